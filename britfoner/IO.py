@@ -3,43 +3,142 @@
 Functions to convert input/output data into tensors and viceversa
 
 '''
+import json
+import logging
 from codecs import open
 from collections import defaultdict
-from os.path import join
-from typing import Iterable, List, Dict, Set, Tuple
+from hashlib import sha256
+from multiprocessing import get_context, cpu_count
+from os import makedirs, replace, getpid
+from os.path import join, basename, exists, getsize
+from typing import Iterable, Iterator, Sequence, List, Dict, Set, Tuple, Optional, Any, Mapping, TYPE_CHECKING
 
 import numpy as np
-from keras.engine.training import Model
 from numpy import zeros, ndarray, argmax
-from .seq2seq.models import AttentionSeq2Seq
 from sklearn.model_selection import train_test_split
 
-from britfoner import Seq, Alphabet, Inv_Alphabet, Index, _GAP, _symbols, _PREFIX, _SUFFIX, _MODEL_OUT
+# keras is only imported when a keras model is built, so that inference with other backends doesn't need TensorFlow
+if TYPE_CHECKING:
+    from keras.engine.training import Model
 
+from britfoner import Seq, Alphabet, Inv_Alphabet, Index, _GAP, _symbols, _PREFIX, _SUFFIX, _MODEL_OUT, _VOWELS, \
+    _CACHE_DIR
 
-def dataset_from(src: str, val_size: float = .05, random_state: int = 42) \
-        -> Tuple[Tuple[ndarray, ndarray, ndarray, ndarray], Index]:
+# attribute of model files holding their description, see artifact_to()
+_DESCRIPTION = 'britfoner'
+
+# magic number and data alignment of flat array files, see arrays_to()
+_MAGIC, _ALIGNMENT = b'BRITFONR', 64
+
+
+def dataset_from(src: str, val_size: float = .05, random_state: int = 42, sparse: bool = False,
+                 cache_dir: Optional[str] = _CACHE_DIR) -> Tuple[Tuple[ndarray, ndarray, ndarray, ndarray], Index]:
     '''
     Creates a dataset read in from the the given file name. The dataset
     consists of rain/test input-output tensors plus an index
 
+    The dataset is cached, see :func:`cached_dataset_from`, and memory-mapped read-only on later calls
+
     :param src: the file name with the data
     :param val_size: the proportion in [0, 1] of data points used for validation
     :param random_state: the seed for picking the validation set
+    :param sparse: whether the outputs should be phone indices, shaped (N, T, 1), rather than one-hot encoded
+    :param cache_dir: the directory to cache the dataset in, or None not to cache it
     :return: a dataset consisting of tensors and index, as a tuple
     '''
+    def encoded(words, sounds, index):
+        X = all_encoded(padded(words), index.letter, reverse=True)
+
+        Y = all_indexed(padded(sounds), index.phone)[..., None] if sparse else all_encoded(padded(sounds), index.phone)
+
+        return X, Y
+
+    return cached_dataset_from(src, encoded, dict(val_size=val_size, random_state=random_state, sparse=sparse),
+                               cache_dir)
+
+
+def indexed_dataset_from(src: str, val_size: float = .05, random_state: int = 42,
+                         cache_dir: Optional[str] = _CACHE_DIR) -> Tuple[Tuple[ndarray, ndarray, ndarray, ndarray], Index]:
+    '''
+    Creates a dataset read in from the the given file name, like :func:`dataset_from`, but with the
+    sequences encoded as matrices of symbol indices rather than one-hot tensors. The train/validation
+    split is the same :func:`dataset_from` makes for the same arguments
+
+    :param src: the file name with the data
+    :param val_size: the proportion in [0, 1] of data points used for validation
+    :param random_state: the seed for picking the validation set
+    :param cache_dir: the directory to cache the dataset in, or None not to cache it
+    :return: a dataset consisting of index matrices and index, as a tuple
+    '''
+    def encoded(words, sounds, index):
+        return all_indexed(padded(words), index.letter, reverse=True), all_indexed(padded(sounds), index.phone)
+
+    return cached_dataset_from(src, encoded, dict(val_size=val_size, random_state=random_state, indexed=True),
+                               cache_dir)
+
+
+def cached_dataset_from(src: str, encoded, params: Dict[str, Any], cache_dir: Optional[str]) \
+        -> Tuple[Tuple[ndarray, ndarray, ndarray, ndarray], Index]:
+    '''
+    Creates a dataset, or maps it from the cache if it was created before from the same data with the same
+    parameters. Datasets are cached split, together with their index and the split indices, as flat files, see
+    :func:`arrays_to`, named after the hash of the data and the parameters, see :func:`training_hash`
+
+    :param src: the file name with the data
+    :param encoded: a function encoding the words and sounds, with the index, into input and output arrays
+    :param params: the parameters of the dataset, ``val_size`` and ``random_state`` used to split it
+    :param cache_dir: the directory to cache the dataset in, or None not to cache it
+    :return: a dataset consisting of the train/validation input/output arrays and index, as a tuple
+    '''
+    cached = None if cache_dir is None else join(cache_dir, f'{basename(src)}.{training_hash(src, params)[:16]}.dataset')
+
+    if cached is not None and exists(cached):
+        arrays, meta = arrays_from(cached)
+        return (arrays['train_X'], arrays['val_X'], arrays['train_Y'], arrays['val_Y']), _index_from_meta(meta)
+
     words, sounds = items_from(src)
 
     index = index_from(words, sounds)
 
-    X = all_encoded(padded(words), index.letter, reverse=True)
+    X, Y = encoded(words, sounds, index)
+
+    train, val = train_test_split(np.arange(len(X)), test_size=params['val_size'], random_state=params['random_state'])
+    dataset = X[train], X[val], Y[train], Y[val]
+
+    if cached is not None:
+        arrays = dict(zip(('train_X', 'val_X', 'train_Y', 'val_Y'), dataset), train=train, val=val)
+        meta = dict(inv_letter=index.inv_letter, inv_phone=index.inv_phone, x_n=index.x_n, y_n=index.y_n,
+                    word_to_sounds=[[word, sorted(sounds)] for word, sounds in index.word_to_sounds.items()])
 
-    Y = all_encoded(padded(sounds), index.phone)
+        try:
+            makedirs(cache_dir, exist_ok=True)
+            # written aside and moved into place, so that concurrent runs never map a partial file
+            arrays_to(f'{cached}.{getpid()}', arrays, meta)
+            replace(f'{cached}.{getpid()}', cached)
+        except OSError as error:
+            logging.warning(f'could not cache dataset at [{cached}]: {error}')
 
-    return train_test_split(X, Y, test_size=val_size, random_state=random_state), index
+    return dataset, index
 
 
-def items_from(src: str) -> Tuple[Iterable[Seq], Iterable[Seq]]:
+def _index_from_meta(meta: Dict[str, Any]) -> Index:
+    '''
+    :param meta: the index of a cached dataset, see :func:`cached_dataset_from`
+    :return: the index
+    '''
+    inv_letter, inv_phone = tuple(meta['inv_letter']), tuple(meta['inv_phone'])
+
+    word_to_sounds = defaultdict(set)
+    for word, sounds in meta['word_to_sounds']:
+        word_to_sounds[tuple(word)] = {tuple(sound) for sound in sounds}
+
+    return Index(len(inv_letter), meta['x_n'], len(inv_phone), meta['y_n'],
+                 {letter: idx for idx, letter in enumerate(inv_letter)}, inv_letter,
+                 {phone: idx for idx, phone in enumerate(inv_phone)}, inv_phone,
+                 word_to_sounds)
+
+
+def items_from(src: str, processes: int = 1) -> Tuple[Iterable[Seq], Iterable[Seq]]:
     '''
     Reads a sequence of inputs and outputs from a file
     The file's format should be a line per data point, the input sequence made up
@@ -47,8 +146,11 @@ def items_from(src: str) -> Tuple[Iterable[Seq], Iterable[Seq]]:
     separated output sequence
 
     :param src: the data file
+    :param processes: the number of processes parsing the file, see :func:`entries_from`
     :return: a tuple with the input and output sequences
     '''
+    if processes != 1: return entries_from(src, processes)
+
     with open(src, 'r', 'utf-8') as in_file:
         return zip(*[to_tuple(entry)  # remove length condition
                      for entry in in_file
@@ -108,7 +210,7 @@ def all_encoded(seqs: List[Seq], alphabet: Alphabet, reverse=False) -> ndarray:
     :return: a 3-D tensor as a 3-D numpy array index by sequence, position and vector component
     '''
 
-    X = zeros((len(seqs), len(seqs[0]), len(alphabet)), dtype=np.bool)
+    X = zeros((len(seqs), len(seqs[0]), len(alphabet)), dtype=bool)
 
     for i, seq in enumerate(seqs):
         for t, phone in enumerate(seq[::-1] if reverse else seq):
@@ -117,6 +219,34 @@ def all_encoded(seqs: List[Seq], alphabet: Alphabet, reverse=False) -> ndarray:
     return X
 
 
+def all_indexed(seqs: List[Seq], alphabet: Alphabet, reverse=False) -> ndarray:
+    '''
+    Encodes a list of strings into a matrix of symbol indices, a compact alternative to :func:`all_encoded`
+
+    :param seqs: alist of sequences as string tuples
+    :param alphabet: a mapping from character to index
+    :param reverse: true if the sequences should be encoded in reverse
+    :return: a 2-D numpy array indexed by sequence and position
+    '''
+    X = zeros((len(seqs), len(seqs[0])), dtype=np.uint8 if len(alphabet) <= 256 else np.int32)
+
+    for i, seq in enumerate(seqs):
+        X[i] = [alphabet[phone] for phone in (seq[::-1] if reverse else seq)]
+
+    return X
+
+
+def one_hot(ids: ndarray, dim: int) -> ndarray:
+    '''
+    Turns a matrix of symbol indices, as built by :func:`all_indexed`, into the tensor :func:`all_encoded` builds
+
+    :param ids: a 2-D numpy array of symbol indices
+    :param dim: the size of the alphabet
+    :return: a 3-D tensor as a 3-D numpy array index by sequence, position and vector component
+    '''
+    return np.eye(dim, dtype=bool)[ids]
+
+
 def decoded(seq_vec: ndarray, inv_alphabet: Inv_Alphabet, reverse=False) -> Seq:
     '''
     Decodes a matrix representing a sequence into a tuple
@@ -156,16 +286,24 @@ def bounded(seq: Seq, max_length: int):
     return _PREFIX + seq + _SUFFIX + padding_for(len(seq), max_length)
 
 
-def dictionary_from(src: str) -> Dict[Seq, Set[Seq]]:
+def dictionary_from(src: str, processes: int = 1) -> Dict[Seq, Set[Seq]]:
     '''
     #
     Returns a mapping from word to pronunciation(s)
 
     :param src: file to read the dictionary data from
+    :param processes: the number of processes parsing the file, see :func:`entries_from`
     :return: a map of words to their pronunciations as Dict[Seq, Set[Seq]]
     '''
     word_to_sounds = defaultdict(set)
 
+    if processes != 1:
+        words, sounds = entries_from(src, processes)
+        for word, sound in zip(words, sounds):
+            word_to_sounds[word].add(sound)
+
+        return word_to_sounds
+
     with open(src, 'r', 'utf-8') as in_file:
 
         for entry in in_file:
@@ -178,6 +316,92 @@ def dictionary_from(src: str) -> Dict[Seq, Set[Seq]]:
     return word_to_sounds
 
 
+def entries_from(src: str, processes: int = None, chunk_n: int = None) -> Tuple[List[Seq], List[Seq]]:
+    '''
+    Reads the entries of a large lexicon file, in the format :func:`items_from` takes, on a process pool. The file
+    is split into byte ranges ending at line ends, see :func:`chunks_of`, and each worker parses its ranges into
+    flat arrays, with phones interned into ids of its own, so that little is sent back to be merged
+
+    :param src: the lexicon file
+    :param processes: the number of processes, as many as cores if not given
+    :param chunk_n: the number of byte ranges, a few per process if not given
+    :return: the words and the pronunciations of the entries, in file order
+    '''
+    processes = processes or cpu_count()
+    chunks = chunks_of(src, chunk_n or 4 * processes)
+
+    if processes == 1:
+        parsed = [_interned_entries_in((src, start, end)) for start, end in chunks]
+    else:
+        with get_context('spawn').Pool(processes) as pool:
+            parsed = pool.map(_interned_entries_in, [(src, start, end) for start, end in chunks])
+
+    words, sounds = [], []
+    for letters, word_start, inv_phone, phones, sound_start in parsed:
+        words.extend(_seqs_of(letters, word_start))
+        sounds.extend(_seqs_of([inv_phone[phone] for phone in phones.tolist()], sound_start))
+
+    return words, sounds
+
+
+def chunks_of(src: str, chunk_n: int) -> List[Tuple[int, int]]:
+    '''
+    Splits a text file into byte ranges of about the same size, each ending at a line end
+
+    :param src: the file
+    :param chunk_n: the largest number of ranges
+    :return: the start and end offsets of the non-empty ranges
+    '''
+    size = getsize(src)
+
+    bounds = [0]
+    with open(src, 'rb') as in_file:
+        for chunk in range(1, chunk_n):
+            in_file.seek(max(bounds[-1], size * chunk // chunk_n))
+            in_file.readline()
+            bounds.append(min(in_file.tell(), size))
+
+    bounds.append(size)
+
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _interned_entries_in(chunk: Tuple[str, int, int]) -> Tuple[str, ndarray, List[str], ndarray, ndarray]:
+    '''
+    Parses the entries in a byte range of a lexicon file. Letters are single characters, so the words are kept
+    joined, and phones are interned into ids in the order first seen
+
+    :param chunk: the file, and the start and end offsets of the range
+    :return: the joined words and the offsets of each word in them, the phones, the phone ids of the
+             pronunciations and the offsets of each pronunciation in them
+    '''
+    src, start, end = chunk
+
+    with open(src, 'rb') as in_file:
+        in_file.seek(start)
+        text = in_file.read(end - start).decode('utf-8')
+
+    words, word_start, phones, sound_start = [], [0], [], [0]
+    for entry in text.split('\n'):
+        if not entry.strip(): continue
+
+        word, sound = _fields_of(entry)
+        words.append(word)
+        phones.extend(sound)
+        word_start.append(word_start[-1] + len(word))
+        sound_start.append(len(phones))
+
+    inv_phone = list(dict.fromkeys(phones))
+    phone_ids = {phone: idx for idx, phone in enumerate(inv_phone)}
+
+    return (''.join(words), np.array(word_start, dtype=np.int64), inv_phone,
+            np.array([phone_ids[phone] for phone in phones], dtype=np.int32), np.array(sound_start, dtype=np.int64))
+
+
+def _seqs_of(symbols: Sequence, starts: ndarray) -> List[Seq]:
+    return [tuple(symbols[start:end]) for start, end in zip(starts[:-1].tolist(), starts[1:].tolist())]
+
+
 def indexes_from(dictionary: Dict[Seq, Set[Seq]]) -> Tuple[Alphabet, Inv_Alphabet]:
     '''
     #
@@ -198,28 +422,675 @@ def indexes_from(dictionary: Dict[Seq, Set[Seq]]) -> Tuple[Alphabet, Inv_Alphabe
     return {letter: idx for idx, letter in enumerate(sorted(letters))}, tuple(sorted(phones))
 
 
-def model_from(src: str) -> Model:
+class Lexicon(Mapping):
+    '''
+    A word to pronunciations mapping, as given by :func:`dictionary_from`, stored as a trie over the letters
+    of its words in a few flat arrays. Words sharing a prefix share its nodes, and the arrays can be saved and
+    memory-mapped with :func:`lexicon_to` and :func:`compiled_lexicon_from`
+
+    Nodes are numbered in pre-order, so the words with a given prefix are the words of a contiguous node range,
+    in alphabetical order. Its arrays are, for ``N`` nodes, ``W`` words and ``P`` pronunciations:
+
+    - ``child_start`` (N + 1): the children of node ``n`` are ``child_node[child_start[n]:child_start[n + 1]]``
+    - ``child_symbol``, ``child_node`` (N - 1): the edges, sorted by parent node and then letter
+    - ``parent``, ``symbol`` (N): the parent of each node, and the letter on the edge from it
+    - ``subtree_end`` (N): the nodes under node ``n`` are ``n`` to ``subtree_end[n] - 1``
+    - ``word`` (N): the word ending at each node, -1 if none, and ``word_node`` (W) the other way round
+    - ``sound_start`` (W + 1), ``phone_start`` (P + 1), ``phones``: the pronunciations of each word, as phone ids
+
+    A second trie over the reversed pronunciations finds words by how they sound, with the same arrays prefixed
+    by ``reverse_`` except for ``reverse_sound_start`` (N + 1) and ``reverse_sounds`` (P): the pronunciations
+    ending at node ``n`` are ``reverse_sounds[reverse_sound_start[n]:reverse_sound_start[n + 1]]``, so those
+    ending with a given sequence of phones are a contiguous range too
+    '''
+
+    def __init__(self, arrays: Dict[str, ndarray], inv_letter: Inv_Alphabet, inv_phone: Inv_Alphabet):
+        '''
+        :param arrays: the trie arrays, see :func:`lexicon_from`
+        :param inv_letter: the sorted letters of the words
+        :param inv_phone: the sorted phones of the pronunciations
+        '''
+        self.arrays = arrays
+        self.inv_letter, self.inv_phone = tuple(inv_letter), tuple(inv_phone)
+        self.letter = {letter: idx for idx, letter in enumerate(self.inv_letter)}
+
+        # children are found with bytes.find, which needs the edge letters as bytes, and the other arrays
+        # are read through memoryviews, which index to python ints much faster than numpy arrays do
+        self._child_symbols = arrays['child_symbol'].tobytes()
+        self._reverse_child_symbols = arrays['reverse_child_symbol'].tobytes()
+        self._child_start, self._child_node, self._word, self._parent, self._symbol, self._sound_start, \
+            self._phone_start, self._phones = (memoryview(np.ascontiguousarray(arrays[name])) for name in (
+                'child_start', 'child_node', 'word', 'parent', 'symbol', 'sound_start', 'phone_start', 'phones'))
+        self._reverse_child_start, self._reverse_child_node = (memoryview(np.ascontiguousarray(arrays[name]))
+                                                               for name in ('reverse_child_start', 'reverse_child_node'))
+        self.phone = {phone: idx for idx, phone in enumerate(self.inv_phone)}
+
+    def __getitem__(self, word: Seq) -> Set[Seq]:
+        sounds = self.get(word)
+
+        if sounds is None: raise KeyError(word)
+
+        return sounds
+
+    def get(self, word: Seq, default=None) -> Optional[Set[Seq]]:
+        node = self._node_of(word)
+
+        if node < 0 or self._word[node] < 0: return default
+
+        return self._sounds_of(self._word[node])
+
+    def __contains__(self, word: Seq) -> bool:
+        node = self._node_of(word)
+
+        return node >= 0 and self._word[node] >= 0
+
+    def __len__(self) -> int:
+        return len(self.arrays['sound_start']) - 1
+
+    def __iter__(self) -> Iterator[Seq]:
+        return (self._word_at(node) for node in np.flatnonzero(self.arrays['word'] >= 0))
+
+    def with_prefix(self, prefix: Seq) -> List[Seq]:
+        '''
+        Gives the words starting with a prefix
+
+        :param prefix: the prefix, which may be a whole word
+        :return: the words in alphabetical order
+        '''
+        node = self._node_of(prefix)
+
+        if node < 0: return []
+
+        return [self._word_at(node) for node in self._words_under(node)]
+
+    def prefixes_of(self, word: Seq) -> List[int]:
+        '''
+        Finds the words that are prefixes of a word, in a single walk down the trie
+
+        :param word: the word
+        :return: the lengths of the prefixes that are words, in increasing order, including the word itself
+        '''
+        lengths, node = [], 0
+        for length, letter in enumerate(word, 1):
+            node = self._child_of(node, letter)
+
+            if node < 0: break
+            if self._word[node] >= 0: lengths.append(length)
+
+        return lengths
+
+    def matching(self, pattern: Seq) -> List[Seq]:
+        '''
+        Gives the words matching a wildcard pattern, in which ``?`` stands for any letter and ``*`` for
+        any number of letters
+
+        :param pattern: the pattern, as a string or a sequence of letters
+        :return: the words in alphabetical order
+        '''
+        pattern = tuple(pattern)
+        # whether the rest of the pattern from each position matches anything, so the whole subtree does
+        any_rest = [all(symbol == '*' for symbol in pattern[i:]) for i in range(len(pattern))]
+
+        matches, seen, pending = set(), set(), [(0, 0)]
+        while pending:
+            node, i = pending.pop()
+
+            if (node, i) in seen: continue
+            seen.add((node, i))
+
+            if i == len(pattern):
+                if self._word[node] >= 0: matches.add(node)
+            elif any_rest[i]:
+                matches.update(self._words_under(node))
+            elif pattern[i] == '*':
+                pending.append((node, i + 1))
+                pending.extend((child, i) for child in self._children_of(node))
+            elif pattern[i] == '?':
+                pending.extend((child, i + 1) for child in self._children_of(node))
+            else:
+                child = self._child_of(node, pattern[i])
+                if child >= 0: pending.append((child, i + 1))
+
+        return [self._word_at(node) for node in sorted(matches)]
+
+    def sounding_like(self, sound: Seq) -> List[Seq]:
+        '''
+        Gives the words with a pronunciation, such as homophones of a word
+
+        :param sound: the pronunciation
+        :return: the words in alphabetical order
+        '''
+        node = self._reverse_node_of(sound)
+
+        if node < 0: return []
+
+        start, end = self.arrays['reverse_sound_start'][node:node + 2]
+
+        return self._words_of_sounds(self.arrays['reverse_sounds'][start:end])
+
+    def rhyming_with(self, sound: Seq, vowels: int = 1) -> List[Seq]:
+        '''
+        Gives the words with a pronunciation ending like another, from its last vowels on
+
+        :param sound: the pronunciation to rhyme with
+        :param vowels: the number of vowels, counting from the end, the rhyme starts from
+        :return: the words in alphabetical order
+        '''
+        starts = [idx for idx, phone in enumerate(sound) if phone in _VOWELS]
+        rhyme = sound[starts[-min(vowels, len(starts))]:] if starts else sound
+
+        node = self._reverse_node_of(rhyme)
+
+        if node < 0: return []
+
+        end = int(self.arrays['reverse_subtree_end'][node])
+        start, end = self.arrays['reverse_sound_start'][[node, end]]
+
+        return self._words_of_sounds(self.arrays['reverse_sounds'][start:end])
+
+    def _reverse_node_of(self, sound: Seq) -> int:
+        node = 0
+        for phone in reversed(sound):
+            symbol = self.phone.get(phone)
+            if symbol is None: return -1
+
+            edge = self._reverse_child_symbols.find(symbol, self._reverse_child_start[node],
+                                                    self._reverse_child_start[node + 1])
+            if edge < 0: return -1
+
+            node = self._reverse_child_node[edge]
+
+        return node
+
+    def _words_of_sounds(self, sounds: ndarray) -> List[Seq]:
+        words = np.unique(np.searchsorted(self.arrays['sound_start'], sounds, side='right') - 1)
+
+        return [self._word_at(node) for node in self.arrays['word_node'][words].tolist()]
+
+    def _node_of(self, word: Seq) -> int:
+        node = 0
+        for letter in word:
+            node = self._child_of(node, letter)
+            if node < 0: break
+
+        return node
+
+    def _child_of(self, node: int, letter: str) -> int:
+        symbol = self.letter.get(letter)
+
+        if symbol is None: return -1
+
+        edge = self._child_symbols.find(symbol, self._child_start[node], self._child_start[node + 1])
+
+        return self._child_node[edge] if edge >= 0 else -1
+
+    def _children_of(self, node: int) -> List[int]:
+        return self._child_node[self._child_start[node]:self._child_start[node + 1]].tolist()
+
+    def _words_under(self, node: int) -> List[int]:
+        end = int(self.arrays['subtree_end'][node])
+
+        return (node + np.flatnonzero(self.arrays['word'][node:end] >= 0)).tolist()
+
+    def _word_at(self, node: int) -> Seq:
+        letters = []
+        while node > 0:
+            letters.append(self.inv_letter[self._symbol[node]])
+            node = self._parent[node]
+
+        return tuple(reversed(letters))
+
+    def _sounds_of(self, word: int) -> Set[Seq]:
+        inv_phone, phone_start, phones = self.inv_phone, self._phone_start, self._phones
+
+        return {tuple([inv_phone[phone] for phone in phones[phone_start[sound]:phone_start[sound + 1]]])
+                for sound in range(self._sound_start[word], self._sound_start[word + 1])}
+
+
+def lexicon_from(dictionary: Dict[Seq, Set[Seq]]) -> Lexicon:
+    '''
+    Compiles a word to pronunciations mapping into a :class:`Lexicon`
+
+    :param dictionary: the mapping, as given by :func:`dictionary_from`
+    :return: the lexicon
+    '''
+    words = sorted(dictionary)
+
+    inv_letter = tuple(sorted({letter for word in words for letter in word}))
+    inv_phone = tuple(sorted({phone for sounds in dictionary.values() for sound in sounds for phone in sound}))
+
+    if max(len(inv_letter), len(inv_phone)) > 256: raise ValueError('Lexicons support at most 256 letters and phones')
+
+    letter = {letter: idx for idx, letter in enumerate(inv_letter)}
+    phone = {phone: idx for idx, phone in enumerate(inv_phone)}
+
+    arrays, word_node = _trie_from([tuple(letter[l] for l in word) for word in words])
+
+    node_word = np.full(len(arrays['parent']), -1, dtype=np.int32)
+    node_word[word_node] = np.arange(len(words))
+
+    sounds = [tuple(phone[p] for p in sound) for word in words for sound in sorted(dictionary[word])]
+    sound_start = np.cumsum([0] + [len(dictionary[word]) for word in words], dtype=np.int32)
+    phone_start = np.cumsum([0] + [len(sound) for sound in sounds], dtype=np.int32)
+    phones = np.array([p for sound in sounds for p in sound], dtype=np.uint8)
+
+    # the reversed pronunciations, for finding words by how their pronunciations end
+    order = sorted(range(len(sounds)), key=lambda idx: sounds[idx][::-1])
+    reverse_arrays, sound_node = _trie_from([sounds[idx][::-1] for idx in order])
+    reverse_sound_start = np.searchsorted(sound_node, np.arange(len(reverse_arrays['parent']) + 1)).astype(np.int32)
+
+    arrays.update(word=node_word, word_node=np.array(word_node, dtype=np.int32),
+                  sound_start=sound_start, phone_start=phone_start, phones=phones,
+                  **{f'reverse_{name}': array for name, array in reverse_arrays.items()},
+                  reverse_sound_start=reverse_sound_start, reverse_sounds=np.array(order, dtype=np.int32))
+
+    return Lexicon(arrays, inv_letter, inv_phone)
+
+
+def _trie_from(seqs: List[Tuple[int, ...]]) -> Tuple[Dict[str, ndarray], List[int]]:
+    '''
+    Builds a trie over sorted sequences of symbol ids, with nodes numbered in pre-order, see :class:`Lexicon`
+
+    :param seqs: the sequences, sorted
+    :return: the ``child_start``, ``child_symbol``, ``child_node``, ``parent``, ``symbol`` and ``subtree_end``
+             arrays of the trie, and the node each sequence ends at
+    '''
+    # sorted sequences are inserted in pre-order, each adding nodes for what it doesn't share with the previous one
+    parent, symbol, ends, path, previous = [-1], [0], [], [0], ()
+    for seq in seqs:
+        shared = 0
+        while shared < min(len(seq), len(previous)) and seq[shared] == previous[shared]: shared += 1
+
+        del path[shared + 1:]
+        for symbol_ in seq[shared:]:
+            parent.append(path[-1])
+            symbol.append(symbol_)
+            path.append(len(parent) - 1)
+
+        ends.append(path[-1])
+        previous = seq
+
+    parent, symbol = np.array(parent, dtype=np.int32), np.array(symbol, dtype=np.uint8)
+
+    subtree_end = np.arange(1, len(parent) + 1, dtype=np.int32)
+    for node in range(len(parent) - 1, 0, -1):
+        subtree_end[parent[node]] = max(subtree_end[parent[node]], subtree_end[node])
+
+    # nodes are numbered in pre-order, so the children of each node are already sorted by symbol
+    child_node = (np.argsort(parent[1:], kind='stable') + 1).astype(np.int32)
+    child_start = np.searchsorted(parent[child_node], np.arange(len(parent) + 1)).astype(np.int32)
+
+    return dict(child_start=child_start, child_symbol=symbol[child_node], child_node=child_node,
+                parent=parent, symbol=symbol, subtree_end=subtree_end), ends
+
+
+def lexicon_to(lexicon: Lexicon, dst: str):
+    '''
+    Saves a lexicon to a flat file, see :func:`arrays_to`
+
+    :param lexicon: the lexicon
+    :param dst: the file to save to
+    '''
+    arrays_to(dst, lexicon.arrays, dict(inv_letter=lexicon.inv_letter, inv_phone=lexicon.inv_phone))
+
+
+def lexicon_file_to(src: str, dst: str, processes: int = None) -> Lexicon:
+    '''
+    Compiles a lexicon file, in the format :func:`items_from` takes, read on a process pool, and saves it with
+    :func:`lexicon_to`
+
+    :param src: the lexicon file
+    :param dst: the file to save the compiled lexicon to
+    :param processes: the number of processes parsing the lexicon file, as many as cores if not given
+    :return: the lexicon
+    '''
+    lexicon = lexicon_from(dictionary_from(src, processes))
+    lexicon_to(lexicon, dst)
+
+    return lexicon
+
+
+def compiled_lexicon_from(src: str) -> Lexicon:
+    '''
+    Maps a lexicon saved by :func:`lexicon_to` read-only into memory, so processes using the same file share it
+
+    :param src: the lexicon file
+    :return: the lexicon
+    '''
+    arrays, meta = arrays_from(src)
+
+    return Lexicon(arrays, meta['inv_letter'], meta['inv_phone'])
+
+
+def configure_threads(intra_op_threads: int = 0, inter_op_threads: int = 0):
+    '''
+    Sets the sizes of the thread pools of the TensorFlow session models are created in. It only affects models
+    created afterwards
+
+    :param intra_op_threads: number of threads a single operation can be parallelised over, 0 for TensorFlow's choice
+    :param inter_op_threads: number of operations that can run in parallel, 0 for TensorFlow's choice
+    '''
+    import tensorflow as tf
+    from keras import backend as K
+
+    config = tf.ConfigProto(intra_op_parallelism_threads=intra_op_threads,
+                            inter_op_parallelism_threads=inter_op_threads)
+
+    K.set_session(tf.Session(config=config))
+
+
+def finalize_graph():
+    '''
+    Finalizes the TensorFlow graph of the current keras session, so that adding operations to it raises an error.
+    Models must have built the functions they use, with a first prediction, beforehand
+    '''
+    from keras import backend as K
+
+    K.get_session().graph.finalize()
+
+
+def model_from(src: str) -> 'Model':
     '''
     #
     loads sequence to sequence model from file
-    :param src: model file name
+    :param src: model file name, relative to the package directory unless absolute
     :return: a model
     '''
-    # uses model file name to set appropiate model parameters before loading model weights,
-    # this is workaround for a defect in seq2seq that prevents reading the whole model
-    input_length, input_dim, hidden_n, output_length, output_dim, depth = map(int, src.split('.h5')[0].split('x'))
+    return artifact_from(src)[0]
+
+
+def artifact_from(src: str) -> Tuple['Model', Optional[Dict[str, Any]]]:
+    '''
+    Loads a sequence to sequence model together with the description saved with it by :func:`artifact_to`,
+    reading the file once. Files without a description have their architecture parsed from their name.
+    Both weights files and whole model files, as saved by ``model.save``, are read
+
+    :param src: model file name, relative to the package directory unless absolute
+    :return: the model and its description, None if the file has none
+    '''
+    import h5py
+    from keras.engine.saving import load_weights_from_hdf5_group
+
+    with h5py.File(join(_MODEL_OUT, src), 'r') as h5:
+
+        description = h5.attrs.get(_DESCRIPTION)
+
+        if description is None:
+            config = config_from_name(src)
+        else:
+            description = json.loads(description.decode() if isinstance(description, bytes) else description)
+            config = description['config']
+
+        model = seq2seq_from(config, unroll=False)
+
+        # files saved with model.save hold the weights in a group of their own
+        group = h5['model_weights'] if 'layer_names' not in h5.attrs and 'model_weights' in h5 else h5
+        load_weights_from_hdf5_group(group, model.layers)
+
+    return model, description
+
+
+def seq2seq_from(config: Dict[str, Any], **kwargs) -> 'Model':
+    '''
+    Builds a sequence to sequence model of the family in its configuration
+
+    :param config: the keyword arguments to build the model with :func:`AttentionSeq2Seq`, or with
+                   :func:`ParallelSeq2Seq` together with a ``family`` of ``'parallel'``
+    :param kwargs: more keyword arguments for attention models
+    :return: the model
+    '''
+    from .seq2seq.models import AttentionSeq2Seq, ParallelSeq2Seq
+
+    config = dict(config)
+
+    if config.pop('family', 'attention') == 'parallel': return ParallelSeq2Seq(**config)
+
+    return AttentionSeq2Seq(**config, **kwargs)
+
+
+def artifact_to(model: 'Model', dst: str, config: Dict[str, Any], index: Index, train_hash: str):
+    '''
+    Saves a sequence to sequence model together with what is needed to load and use it: the
+    architecture, the symbol alphabets and a hash identifying the training data and hyperparameters
+
+    :param model: the model
+    :param dst: the file to save to
+    :param config: the model configuration, see :func:`seq2seq_from`
+    :param index: the index of the dataset the model was trained on
+    :param train_hash: the hash of the training data and hyperparameters, see :func:`training_hash`
+    '''
+    import h5py
+
+    model.save_weights(dst, overwrite=True)
+
+    with h5py.File(dst, 'a') as h5:
+        h5.attrs[_DESCRIPTION] = json.dumps(description_from(config, index, train_hash))
+
+
+def description_from(config: Dict[str, Any], index: Index, train_hash: str) -> Dict[str, Any]:
+    '''
+    Describes a sequence to sequence model, as saved with it by :func:`artifact_to`
+
+    :param config: the keyword arguments to build the model with :func:`AttentionSeq2Seq`
+    :param index: the index of the dataset the model was trained on
+    :param train_hash: the hash of the training data and hyperparameters, see :func:`training_hash`
+    :return: the description
+    '''
+    return dict(config=config, inv_letter=index.inv_letter, inv_phone=index.inv_phone, train_hash=train_hash)
+
+
+def weights_to(model: 'Model', dst: str, description: Dict[str, Any]):
+    '''
+    Exports the weights of a sequence to sequence model to a flat file, see :func:`arrays_to`, for
+    backends that memory-map them rather than load them, see :mod:`britfoner.backends`
+
+    :param model: the model
+    :param dst: the file to save to
+    :param description: the model description, see :func:`description_from`
+    '''
+    if description['config'].get('family') == 'parallel': raise ValueError('Only attention models can be exported')
+
+    arrays_to(dst, weights_by_role(model), description)
+
+
+def weights_by_role(model: 'Model') -> Dict[str, ndarray]:
+    '''
+    Gives the weights of a sequence to sequence model by the role they play in it, as in :mod:`britfoner.backends`
+
+    Weights are named ``<part>/<cell>/<matrix>/<kernel|bias>`` where part is one of ``forward``,
+    ``backward`` (the encoder directions) or ``decoder``, cell is the position of the cell in the part's
+    stack and matrix is the name of the matrix in the cell's code
+
+    :param model: the model
+    :return: a mapping from weight name to weight value
+    '''
+    weights = {}
+
+    for name, dense in _dense_layers_of(model).items():
+        values = dense.get_weights()
+        weights[f'{name}/kernel'] = values[0]
+        if len(values) > 1: weights[f'{name}/bias'] = values[1]
+
+    return weights
+
+
+def set_weights_by_role(model: 'Model', weights: Dict[str, ndarray]):
+    '''
+    Sets the weights of a sequence to sequence model from their values by role, see :func:`weights_by_role`
+
+    :param model: the model
+    :param weights: a mapping from weight name to weight value
+    '''
+    layers = _dense_layers_of(model)
+
+    unused = {name.rsplit('/', 1)[0] for name in weights} - set(layers)
+    if unused: raise ValueError(f'Model has no weights for roles {sorted(unused)}')
+
+    for name, dense in layers.items():
+        dense.set_weights([weights[f'{name}/kernel']] + ([weights[f'{name}/bias']] if dense.use_bias else []))
+
+
+def _dense_layers_of(model: 'Model') -> Dict[str, Any]:
+    '''
+    Finds the dense layers of a sequence to sequence model, and names them by role
+
+    :param model: the model
+    :return: a mapping from ``<part>/<cell>/<matrix>`` to dense layer
+    '''
+    from keras.layers import Dense
+    from .recurrentshop import RNNCell
+
+    # masked models have layers between the input, the encoder and the decoder
+    rnns = [layer for layer in model.layers if hasattr(layer, 'cells') or hasattr(layer, 'forward_layer')]
+    encoder, decoder = rnns[0], rnns[-1]
+
+    if hasattr(encoder, 'forward_layer'):
+        parts = dict(forward=encoder.forward_layer, backward=encoder.backward_layer, decoder=decoder)
+    else:
+        parts = dict(forward=encoder, decoder=decoder)
+
+    layers = {}
+    for part, rnn in parts.items():
+        for position, cell in enumerate(cell for cell in rnn.cells if isinstance(cell, RNNCell)):
+
+            x, h_tm1 = cell.model.inputs[:2]
+
+            for dense in (layer for layer in cell.model.layers if isinstance(layer, Dense)):
+                input = dense.get_input_at(0)
+
+                if input is h_tm1:
+                    matrix = 'U'
+                elif input is x:
+                    matrix = 'W' if part != 'decoder' else 'W1'
+                elif dense.units == 1:
+                    matrix = 'W3'
+                elif type(input._keras_history[0]).__name__ == 'Multiply':
+                    matrix = 'W2'
+                elif input._keras_history[0].name == 'readout':
+                    matrix = 'W4'
+                else:
+                    matrix = 'W1'
+
+                layers[f'{part}/{position}/{matrix}'] = dense
+
+    return layers
+
+
+def arrays_to(dst: str, arrays: Dict[str, ndarray], meta: Dict[str, Any]):
+    '''
+    Saves named arrays to a flat, uncompressed file that can be memory-mapped by :func:`arrays_from`
+
+    The file starts with a magic number, the length of a JSON header as an 8-byte little-endian
+    integer and the header itself, which holds ``meta`` and the dtype, shape and offset of each array.
+    The array data follows, each array aligned to 64 bytes
+
+    :param dst: the file to save to
+    :param arrays: the arrays, by name
+    :param meta: JSON-serialisable data to save with the arrays
+    '''
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    def header_for(start: int) -> bytes:
+        layout, offset = {}, start
+        for name, array in arrays.items():
+            layout[name] = dict(dtype=array.dtype.str, shape=array.shape, offset=offset)
+            offset += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+        return json.dumps(dict(meta=meta, arrays=layout)).encode()
+
+    # the header holds the offsets, which depend on the header's length, so it is sized with an upper bound
+    header = header_for(0)
+    start = -(-(len(_MAGIC) + 8 + len(header) + 16 * len(arrays)) // _ALIGNMENT) * _ALIGNMENT
+    header = header_for(start)
+
+    with open(dst, 'wb') as out_file:
+        out_file.write(_MAGIC + len(header).to_bytes(8, 'little') + header)
+
+        for name, array in arrays.items():
+            out_file.seek(json.loads(header)['arrays'][name]['offset'])
+            out_file.write(array.tobytes())
+
+        out_file.truncate()
+
+
+def arrays_from(src: str) -> Tuple[Dict[str, ndarray], Dict[str, Any]]:
+    '''
+    Maps the arrays in a file saved by :func:`arrays_to` read-only into memory, so that processes mapping
+    the same file share its pages and only the parts that are used are read in
+
+    :param src: the file
+    :return: the arrays, by name, and the data saved with them
+    '''
+    data = np.memmap(src, dtype=np.uint8, mode='r')
+
+    if bytes(data[:len(_MAGIC)]) != _MAGIC: raise ValueError(f'Not an array file: {src}')
+
+    length = int.from_bytes(bytes(data[len(_MAGIC):len(_MAGIC) + 8]), 'little')
+    header = json.loads(bytes(data[len(_MAGIC) + 8:len(_MAGIC) + 8 + length]).decode())
+
+    arrays = {}
+    for name, layout in header['arrays'].items():
+        dtype, shape, offset = np.dtype(layout['dtype']), tuple(layout['shape']), layout['offset']
+        size = dtype.itemsize * int(np.prod(shape))
+        arrays[name] = data[offset:offset + size].view(dtype).reshape(shape)
+
+    return arrays, header['meta']
+
+
+def config_from_name(src: str) -> Dict[str, Any]:
+    '''
+    Parses the architecture of a model from its file name, as created by :func:`britfoner.main.model_name_from`,
+    and kept ahead of the suffixes of other kinds of model, such as ``.student.h5`` for distilled students.
+    This is workaround for a defect in seq2seq that prevents reading the whole model
 
-    model = AttentionSeq2Seq(output_dim=output_dim,
-                             output_length=output_length,
-                             hidden_dim=hidden_n,
-                             input_dim=input_dim,
-                             input_length=input_length,
-                             unroll=False,
-                             depth=depth)
+    :param src: model file name
+    :return: the keyword arguments to build the model with :func:`AttentionSeq2Seq`
+    '''
+    input_length, input_dim, hidden_n, output_length, output_dim, depth = map(int, basename(src).split('.')[0].split('x'))
 
-    model.load_weights(join(_MODEL_OUT, src))
+    return dict(input_length=input_length, input_dim=input_dim, hidden_dim=hidden_n,
+                output_length=output_length, output_dim=output_dim, depth=depth)
 
-    return model
+
+def alphabets_from(description: Optional[Dict[str, Any]], dictionary: Dict[Seq, Set[Seq]]) \
+        -> Tuple[Alphabet, Inv_Alphabet]:
+    '''
+    Gives the input and inverted output indexes of a model, as saved in its description, checking
+    they cover the symbols in the dictionary. Models without description get them built from the dictionary
+
+    :param description: the model description, as returned by :func:`artifact_from`
+    :param dictionary: a word to proununciations mapping
+    :return: an input and an inverted output index as a tuple
+    '''
+    letter_index, inv_phone_index = indexes_from(dictionary)
+
+    if description is None: return letter_index, inv_phone_index
+
+    missing_letters = set(letter_index) - set(description['inv_letter'])
+    missing_phones = set(inv_phone_index) - set(description['inv_phone'])
+
+    if missing_letters or missing_phones:
+        raise ValueError(f'Model alphabets lack symbols {sorted(missing_letters | missing_phones)} in the dictionary')
+
+    return {letter: idx for idx, letter in enumerate(description['inv_letter'])}, tuple(description['inv_phone'])
+
+
+def training_hash(src: str, params: Dict[str, Any]) -> str:
+    '''
+    Hashes the training data and hyperparameters of a model, to identify what it was trained on
+
+    :param src: the file name with the data
+    :param params: the training hyperparameters
+    :return: the hash as an hexadecimal string
+    '''
+    digest = sha256()
+
+    with open(src, 'rb') as in_file:
+        for chunk in iter(lambda: in_file.read(1 << 20), b''):
+            digest.update(chunk)
+
+    digest.update(json.dumps(params, sort_keys=True).encode())
+
+    return digest.hexdigest()
 
 
 def to_tuple(entry: str) -> Tuple[Seq, Seq]:
@@ -229,4 +1100,12 @@ def to_tuple(entry: str) -> Tuple[Seq, Seq]:
     :param entry: the string containing the entry
     :return: a tuple containing an input and an output sequence
     '''
-    return tuple(entry.split(',')[0].split('(')[0]), tuple(entry.split(',')[1].split())
+    word, sound = _fields_of(entry)
+
+    return tuple(word), tuple(sound)
+
+
+def _fields_of(entry: str) -> Tuple[str, List[str]]:
+    fields = entry.split(',')
+
+    return fields[0].split('(')[0], fields[1].split()
@@ -1,7 +1,7 @@
 import logging
 import os
 from collections import namedtuple
-from os.path import dirname, join, realpath
+from os.path import dirname, join, realpath, splitext, expanduser
 
 from typing import Tuple, Dict
 
@@ -13,11 +13,31 @@ logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', date
 
 _UNSTRESSED_BRITFONE = join(dirname(realpath(__file__)), 'britfone.main.no-stress.2.0.1.csv')
 _MODEL_OUT = dirname(realpath(__file__))
+# the model for words not in the dictionary, which can be a smaller student, see britfoner.main.main_distilled
+_MODEL_NAME = os.environ.get('BRITFONER_MODEL', '20x32x256x19x48x1.h5')
+# the model weights as a flat file for the numpy backend, see britfoner.main.exported_weights_from
+_WEIGHTS_NAME = splitext(_MODEL_NAME)[0] + '.weights'
+# the joint sequence n-gram model for the ngram backend, see britfoner.main.main_ngram
+_NGRAM_NAME = 'britfone.4.ngram'
+
+# the directory training datasets are cached in, see britfoner.IO.cached_dataset_from
+_CACHE_DIR = os.environ.get('BRITFONER_CACHE', join(expanduser('~'), '.cache', 'britfoner'))
+
+# the backend running the model, 'keras', 'numpy' or 'ngram'
+_BACKEND = os.environ.get('BRITFONER_BACKEND', 'keras')
+
+# sizes of the TensorFlow thread pools, 0 lets TensorFlow pick
+_INTRA_OP_THREADS = int(os.environ.get('BRITFONER_INTRA_OP_THREADS', 0))
+_INTER_OP_THREADS = int(os.environ.get('BRITFONER_INTER_OP_THREADS', 0))
 
 _START, _END, _GAP = '*', '¬', '·'
 _symbols = {_GAP, _START, _END}
 _PREFIX, _SUFFIX = (_START,), (_END,)
 
+# the vowel phones of Britfone
+_VOWELS = {'aɪ', 'aʊ', 'eɪ', 'i', 'iː', 'uː', 'æ', 'ɐ', 'ɑː', 'ɒ', 'ɔɪ', 'ɔː', 'ə', 'əʊ', 'ɛ', 'ɛə', 'ɜː', 'ɪ', 'ɪə',
+           'ʊ', 'ʊə'}
+
 Seq = Tuple[str, ...]
 Alphabet = Dict[str, int]
 Inv_Alphabet = Tuple[str, ...]
@@ -3,31 +3,316 @@
 Public api
 
 '''
-from typing import Set
+import logging
+from collections import Counter
+from itertools import islice
+from threading import Lock, RLock
+from time import perf_counter
+from os.path import splitext
+from typing import Set, List, Tuple, Iterable, Dict, Any, Optional
 
-from britfoner import Seq, _UNSTRESSED_BRITFONE, _MODEL_OUT
-from britfoner.IO import all_encoded, bounded, dictionary_from, model_from, indexes_from
-from britfoner.g2p import most_likely_sequence
+from britfoner import Seq, _UNSTRESSED_BRITFONE, _MODEL_NAME, _NGRAM_NAME, _BACKEND, _INTRA_OP_THREADS, \
+    _INTER_OP_THREADS
+from britfoner.IO import Lexicon, dictionary_from, lexicon_from, artifact_from, alphabets_from, configure_threads, \
+    finalize_graph
+from britfoner.backends import Predictor
+from britfoner.morphology import Decomposer
+from britfoner.phonetics import PhoneGrams
+from britfoner.spelling import NearMatches
 
 # Length of the longest word in Britfone, the pronunciation dictionary
 # A limitation of this model is that input/output sequences have a fixed length
 # and need therefore be represented by the longest available sequence
 MAX_LENGTH = 18
 
-_dictionary  = dictionary_from(_UNSTRESSED_BRITFONE)
+# built on first use, see dictionary()
+_dictionary = None
 
-_letter_index, _inv_phone_index = indexes_from(_dictionary)
+# loaded on first use, together with the model's alphabets and the predictor pronouncing with it, see load()
+_model, _letter_index, _inv_phone_index, _predictor = None, None, None, None
 
-_model = model_from('20x32x256x19x48x1.h5')
+# held while loading the dictionary and models, so that threads needing one at once don't load it more than once.
+# Reentrant, as models check their alphabets against the dictionary
+_loading = RLock()
+
+_settings = dict(intra_op_threads=_INTRA_OP_THREADS, inter_op_threads=_INTER_OP_THREADS)
+_session_configured = False
+# whether warm_up() has finalized the TensorFlow graph, after which no keras model can be built
+_graph_finalized = False
+_backend, _model_name = _BACKEND, _MODEL_NAME
+
+_BACKENDS = ('keras', 'numpy', 'ngram')
+
+# the tiers tried for words not in the dictionary before the model, see configure_tiers()
+_tiers = dict(decompose=False, near_match_confidence=None, max_edits=1)
+_decomposer, _near_matches = None, None
+
+# the fast model tried before the model, see configure_cascade(), loaded on first use, see fast_model()
+_cascade = dict(fast='ngram', confidence=None)
+_fast = None
+
+# the number of words pronounced by each tier, see resolved_fractions()
+_resolved = Counter()
+# held while counting, apart from _loading so that counting doesn't wait for models to load
+_counting = Lock()
+
+# built on first use, see phone_grams()
+_phone_grams = None
 
 _EMPTY_SET = set()
 
 
+def configure(intra_op_threads: int = None, inter_op_threads: int = None, backend: str = None, model: str = None):
+    '''
+    Configures the model used for words not in the dictionary. It must be called before the model is loaded,
+    either explicitly with :func:`load` or by the first call to :func:`pronounce` that needs it
+
+    The defaults are read from the ``BRITFONER_INTRA_OP_THREADS``, ``BRITFONER_INTER_OP_THREADS``,
+    ``BRITFONER_BACKEND`` and ``BRITFONER_MODEL`` environment variables
+
+    :param intra_op_threads: number of threads a single TensorFlow operation can use, 0 for TensorFlow's choice
+    :param inter_op_threads: number of TensorFlow operations that can run in parallel, 0 for TensorFlow's choice
+    :param backend: 'keras', 'numpy' to run the model without TensorFlow over weights memory-mapped
+                    from a file, shared by all the processes using it, or 'ngram' to predict with a joint sequence
+                    n-gram model instead, see :class:`britfoner.ngram.JointSequenceModel`, which is faster to load
+                    and run but less accurate
+    :param model: the model file, relative to the package directory unless absolute, such as a student distilled
+                  by :func:`britfoner.main.main_distilled`. The numpy backend maps the file with the same name and
+                  a ``.weights`` extension
+    '''
+    global _backend, _model_name
+
+    if _model is not None: raise ValueError('Model already loaded')
+    if backend is not None and backend not in _BACKENDS: raise ValueError(f'Unknown backend {backend}')
+
+    if intra_op_threads is not None: _settings['intra_op_threads'] = intra_op_threads
+    if inter_op_threads is not None: _settings['inter_op_threads'] = inter_op_threads
+    if backend is not None: _backend = backend
+    if model is not None: _model_name = model
+
+
+def configure_tiers(decompose: bool = None, near_match_confidence: float = None, max_edits: int = None):
+    '''
+    Configures the tiers tried, in order, for words not in the dictionary before falling back to the model.
+    All tiers are disabled by default. Settings not given are left unchanged
+
+    :param decompose: whether to pronounce words from the pronunciations of their parts, see
+                      :class:`britfoner.morphology.Decomposer`, including words too long for the model
+    :param near_match_confidence: the least confidence to give the pronunciations of the dictionary words closest
+                                  to a word, see :meth:`britfoner.spelling.NearMatches.closest`, or False to
+                                  disable the tier
+    :param max_edits: the largest number of edits between a word and a dictionary word for it to be a near match
+    '''
+    global _near_matches
+
+    if max_edits is not None and max_edits != _tiers['max_edits']: _near_matches = None
+
+    if decompose is not None: _tiers['decompose'] = decompose
+    if near_match_confidence is not None:
+        _tiers['near_match_confidence'] = None if near_match_confidence is False else near_match_confidence
+    if max_edits is not None: _tiers['max_edits'] = max_edits
+
+
+def configure_cascade(fast: str = 'ngram', confidence: float = None):
+    '''
+    Configures a fast model to pronounce words not in the dictionary, nor pronounced by the other tiers, see
+    :func:`configure_tiers`, before the model. The model only pronounces the words the fast model isn't
+    confident enough about. The cascade is disabled by default. With the keras backend, a fast model other than
+    the n-gram one must be configured before :func:`warm_up` finalizes the graph
+
+    :param fast: 'ngram' for the joint sequence n-gram model, see :class:`britfoner.ngram.JointSequenceModel`, or a
+                 smaller model file, such as a student distilled by :func:`britfoner.main.main_distilled`, run by the
+                 backend set with :func:`configure`
+    :param confidence: the least confidence, in [0, 1], to accept a pronunciation of the fast model with, or None to
+                       disable the cascade, see :func:`britfoner.backends.confidences_of` and
+                       :meth:`britfoner.ngram.JointSequenceModel.pronounce_with_confidence`
+    '''
+    global _fast
+
+    loads_keras_model = fast != 'ngram' and _backend == 'keras' and (_fast is None or fast != _cascade['fast'])
+    if confidence is not None and loads_keras_model and _graph_finalized:
+        raise ValueError('Keras fast models must be configured before the graph is finalized, see warm_up')
+
+    if fast != _cascade['fast']: _fast = None
+
+    _cascade.update(fast=fast, confidence=confidence)
+
+
+def resolved_fractions() -> Dict[str, float]:
+    '''
+    Gives the fraction of the words pronounced so far by each tier: the dictionary, decomposition, near matches,
+    the fast model of the cascade and the model
+
+    :return: the fractions, by tier
+    '''
+    with _counting:
+        total = sum(_resolved.values())
+
+        return {tier: count / total for tier, count in _resolved.items()}
+
+
+def dictionary() -> Lexicon:
+    '''
+    Loads the pronunciation dictionary, if not loaded yet
+
+    :return: the dictionary
+    '''
+    global _dictionary
+
+    if _dictionary is not None: return _dictionary
+
+    with _loading:
+        if _dictionary is None: _dictionary = lexicon_from(dictionary_from(_UNSTRESSED_BRITFONE))
+
+        return _dictionary
+
+
+def decomposer() -> Decomposer:
+    '''
+    Creates the decomposer of words into dictionary words, if not created yet
+
+    :return: the decomposer
+    '''
+    global _decomposer
+
+    if _decomposer is None: _decomposer = Decomposer(dictionary())
+
+    return _decomposer
+
+
+def near_matches() -> NearMatches:
+    '''
+    Indexes the dictionary words for approximate matching, if not indexed yet
+
+    :return: the index
+    '''
+    global _near_matches
+
+    if _near_matches is None: _near_matches = NearMatches(dictionary(), _tiers['max_edits'])
+
+    return _near_matches
+
+
+def load():
+    '''
+    Loads the model used for words not in the dictionary, if not loaded yet
+
+    :return: the model
+    '''
+    global _model, _letter_index, _inv_phone_index, _predictor
+
+    if _model is not None: return _model
+
+    with _loading:
+        if _model is None:
+            if _backend == 'ngram':
+                from britfoner.ngram import compiled_joint_sequence_model_from
+                _predictor = compiled_joint_sequence_model_from(_NGRAM_NAME)
+                _model = _predictor
+                return _model
+
+            model, description = _model_from(_model_name)
+            _letter_index, _inv_phone_index = alphabets_from(description, dictionary())
+            _predictor = Predictor(model, _letter_index, _inv_phone_index, MAX_LENGTH,
+                                   output_activation=_output_activation_of(description))
+            # set last, as other threads take the model as loaded once it is
+            _model = model
+
+    return _model
+
+
+def fast_model():
+    '''
+    Loads the fast model of the cascade, see :func:`configure_cascade`, if not loaded yet
+
+    :return: the fast model, as a predictor of pronunciations with their confidence
+    '''
+    global _fast
+
+    if _fast is not None: return _fast
+
+    with _loading:
+        if _fast is None:
+            if _cascade['fast'] == 'ngram':
+                from britfoner.ngram import compiled_joint_sequence_model_from
+                _fast = compiled_joint_sequence_model_from(_NGRAM_NAME)
+            else:
+                model, description = _model_from(_cascade['fast'])
+                letter_index, inv_phone_index = alphabets_from(description, dictionary())
+                _fast = Predictor(model, letter_index, inv_phone_index, MAX_LENGTH,
+                                  output_activation=_output_activation_of(description))
+
+        return _fast
+
+
+def _model_from(name: str) -> Tuple[Any, Optional[Dict[str, Any]]]:
+    '''
+    Loads a model file with the backend set with :func:`configure`. Keras models share the TensorFlow session
+    configured for the first of them
+
+    :param name: the model file
+    :return: the model and its description
+    '''
+    global _session_configured
+
+    if _backend == 'numpy':
+        from britfoner.backends import numpy_model_from
+        return numpy_model_from(splitext(name)[0] + '.weights')
+
+    if not _session_configured:
+        configure_threads(**_settings)
+        _session_configured = True
+
+    return artifact_from(name)
+
+
+def _output_activation_of(description: Optional[Dict[str, Any]]) -> Optional[str]:
+    return None if description is None else description['config'].get('output_activation')
+
+
+def warm_up(batch_sizes: Iterable[int] = (1, 32), finalize: bool = True) -> float:
+    '''
+    Loads the model, if not loaded yet, and runs batches of dictionary words of each size through it, so that the
+    first words not in the dictionary don't wait for keras to build and TensorFlow to optimise the predict function.
+    Servers can call it before reporting ready
+
+    With the keras backend, the TensorFlow graph is then finalized, so that anything adding operations to it, which
+    would leak memory and slow down predictions, raises an error rather than going unnoticed. No other keras model
+    can be built in the process afterwards
+
+    :param batch_sizes: the numbers of words predicted at once to warm up for
+    :param finalize: whether to finalize the TensorFlow graph
+    :return: the warm-up time in seconds, loading included
+    '''
+    global _graph_finalized
+
+    start = perf_counter()
+
+    load()
+    predictors = [_predictor] if _cascade['confidence'] is None else [fast_model(), _predictor]
+
+    words = list(islice((word for word in dictionary() if len(word) <= MAX_LENGTH), max(batch_sizes)))
+
+    for predictor in predictors:
+        for n in batch_sizes:
+            predictor.pronounce(words[:n])
+
+    if finalize and _backend == 'keras':
+        finalize_graph()
+        _graph_finalized = True
+
+    time = perf_counter() - start
+    logging.info(f'model warmed up in [{time:.3f}]s')
+
+    return time
+
+
 def pronounce(word: str, fallback_to_model=True) -> Set[Seq]:
     '''
     Gives British English pronunciation(s) of word as symbols in the International Phonetic Alphabet
 
-    Strings longer than 18 characters are given no pronunciations
+    Strings longer than 18 characters are given no pronunciations, unless decomposed into dictionary words,
+    see :func:`configure_tiers`
 
     *input is not validated*
 
@@ -36,17 +321,103 @@ def pronounce(word: str, fallback_to_model=True) -> Set[Seq]:
     :return: a set of string tuples representing the pronunciations of ``word``
     '''
 
-    if len(word) > MAX_LENGTH: return _EMPTY_SET
+    if len(word) > MAX_LENGTH and not _tiers['decompose']: return _EMPTY_SET
 
     norm_word = tuple(word.upper())
-    sounds = _dictionary.get(norm_word, None)
+    sounds, tier = dictionary().get(norm_word, None), 'dictionary'
+
+    if not sounds and _tiers['decompose']:
+        sounds, tier = decomposer().pronounce(norm_word), 'decomposition'
+
+        if not sounds and len(word) > MAX_LENGTH: return _EMPTY_SET
+
+    if not sounds and _tiers['near_match_confidence'] is not None:
+        words, confidence = near_matches().closest(norm_word)
+
+        if confidence >= _tiers['near_match_confidence']:
+            sounds, tier = {sound for near_word in words for sound in dictionary()[near_word]}, 'near match'
 
     if not sounds:
         if fallback_to_model:
-            bound_word = [bounded(norm_word, MAX_LENGTH)]
-            y_hat = _model.predict([all_encoded(bound_word, _letter_index, reverse=True)])[0]
-            sounds = {most_likely_sequence(y_hat, _inv_phone_index)}
+            sounds, tier = _predicted(norm_word)
         else:
             raise ValueError('Word not found in the dictionary')
 
+    with _counting:
+        _resolved[tier] += 1
+
     return sounds
+
+
+def _predicted(word: Seq) -> Tuple[Set[Seq], str]:
+    '''
+    Predicts the pronunciation of a word with the fast model of the cascade, if enabled and confident enough,
+    or else with the model
+
+    :param word: the word, in upper case
+    :return: the pronunciation, with the tier that predicted it
+    '''
+    if _cascade['confidence'] is not None:
+        sound, confidence = fast_model().pronounce_with_confidence([word])[0]
+
+        if confidence >= _cascade['confidence']: return {sound}, 'fast model'
+
+    load()
+
+    return set(_predictor.pronounce([word])), 'model'
+
+
+def homophones(word: str, fallback_to_model=True) -> List[Seq]:
+    '''
+    Gives the dictionary words sounding like a word, in any of its pronunciations
+
+    :param word: the word, as in :func:`pronounce`
+    :param fallback_to_model: whether to predict the pronunciation of the unknown words with a ML model
+    :return: the other words, in alphabetical order, as tuples of letters
+    '''
+    return _others(word, [dictionary().sounding_like(sound) for sound in pronounce(word, fallback_to_model)])
+
+
+def rhymes(word: str, vowels: int = 1, fallback_to_model=True) -> List[Seq]:
+    '''
+    Gives the dictionary words rhyming with a word, in any of its pronunciations: those whose pronunciations end
+    with the same sounds from the word's last vowels on
+
+    :param word: the word, as in :func:`pronounce`
+    :param vowels: the number of vowels, counting from the end, the rhyme starts from
+    :param fallback_to_model: whether to predict the pronunciation of the unknown words with a ML model
+    :return: the other words, in alphabetical order, as tuples of letters
+    '''
+    return _others(word, [dictionary().rhyming_with(sound, vowels) for sound in pronounce(word, fallback_to_model)])
+
+
+def sounds_like(sound: Seq, k: int = 10, max_edits: int = 2) -> List[Tuple[Seq, int]]:
+    '''
+    Gives the dictionary words pronounced most like a pronunciation, such as one given by :func:`pronounce`
+
+    :param sound: the pronunciation
+    :param k: the largest number of words given
+    :param max_edits: the largest number of phone insertions, deletions and substitutions between the
+                      pronunciation and a word's
+    :return: the words, as tuples of letters, with their number of edits away, closest first and then alphabetically
+    '''
+    return phone_grams().nearest(sound, k, max_edits)
+
+
+def phone_grams() -> PhoneGrams:
+    '''
+    Indexes the dictionary pronunciations for similarity search, if not indexed yet
+
+    :return: the index
+    '''
+    global _phone_grams
+
+    if _phone_grams is None: _phone_grams = PhoneGrams(dictionary())
+
+    return _phone_grams
+
+
+def _others(word: str, found: List[List[Seq]]) -> List[Seq]:
+    norm_word = tuple(word.upper())
+
+    return sorted({other for others in found for other in others if other != norm_word})
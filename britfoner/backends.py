@@ -0,0 +1,317 @@
+'''
+
+Inference backends for the sequence to sequence models
+
+'''
+from os.path import join
+from threading import Lock
+from typing import Dict, Any, Tuple, List, Iterable
+
+import numpy as np
+from numpy import ndarray
+
+from britfoner import Seq, Alphabet, Inv_Alphabet, _MODEL_OUT, _GAP, _START, _END, _symbols
+from britfoner.IO import arrays_from
+
+
+class NumpySeq2Seq:
+    '''
+    Inference-only NumPy implementation of the forward pass of :class:`britfoner.seq2seq.models.AttentionSeq2Seq`,
+    over the weights exported by :func:`britfoner.IO.weights_to`
+
+    It doesn't need TensorFlow, and weights mapped from a file with :func:`britfoner.IO.arrays_from` are shared
+    by all the processes that map the same file, rather than copied into each of them
+    '''
+
+    def __init__(self, weights: Dict[str, ndarray], config: Dict[str, Any]):
+        '''
+        :param weights: the weights by role, see :func:`britfoner.IO.weights_by_role`
+        :param config: the model configuration, as in :func:`britfoner.IO.artifact_to`
+        '''
+        self.weights = weights
+        self.output_length = config['output_length']
+        self.output_activation = config.get('output_activation') or 'tanh'
+        self.mask_index = config.get('mask_index')
+
+        self.directions = [direction for direction in ('forward', 'backward') if f'{direction}/0/W/kernel' in weights]
+        self.depth = sum(1 for name in weights if name.startswith('decoder/') and name.endswith('/W2/kernel'))
+
+    def predict(self, X: ndarray, batch_size: int = None) -> ndarray:
+        '''
+        Predicts the output sequences of a batch, as ``keras.Model.predict``
+
+        :param X: the encoded input sequences
+        :param batch_size: ignored, the batch is processed at once
+        :return: the model outputs
+        '''
+        if isinstance(X, list): X = X[0]
+
+        return self.decoded(self.encoded(np.asarray(X, dtype=np.float32)))
+
+    def encoded(self, X: ndarray) -> ndarray:
+        '''
+        Runs the encoder: a stack of LSTMs per direction, whose outputs are summed. Masked models skip padding
+        steps and zero their outputs
+
+        :param X: the encoded input sequences, as float32
+        :return: the encoder outputs
+        '''
+        mask = None if self.mask_index is None else X[..., self.mask_index] != 1.
+
+        H = None
+        for direction in self.directions:
+            Y, M = (X[:, ::-1], None if mask is None else mask[:, ::-1]) if direction == 'backward' else (X, mask)
+
+            for cell in range(self._cells_in(direction)):
+                Y = self._lstm(Y, direction, cell, M)
+
+            Y = Y[:, ::-1] if direction == 'backward' else Y
+            H = Y if H is None else H + Y
+
+        return H if mask is None else H * mask[..., None]
+
+    def decoded(self, H: ndarray) -> ndarray:
+        '''
+        Runs the decoder, which attends over the encoder outputs, and reads its previous output if it has a readout, at
+        every step
+
+        :param H: the encoder outputs
+        :return: the model outputs
+        '''
+        w = self.weights
+        batch_n = H.shape[0]
+
+        n_h = H.shape[-1]
+        W3 = w['decoder/0/W3/kernel']
+        # energies are linear in the encoder outputs and the cell state, so the first half is computed once
+        H_energies = H @ W3[:n_h, 0] + w['decoder/0/W3/bias'][0]
+        # as AttentionDecoderCell, masked models don't attend to the zeroed outputs of padding
+        if self.mask_index is not None: H_energies = np.where(H.any(axis=-1), H_energies, H_energies - 1e9)
+
+        states = [self._zero_states(batch_n, w[f'decoder/{cell}/U/kernel']) for cell in range(self.depth)]
+        # models with a readout also read their previous output, none before the first step
+        W4 = w.get('decoder/0/W4/kernel')
+        if W4 is not None: y = np.zeros((batch_n, W4.shape[0]), dtype=H.dtype)
+
+        outputs = []
+        for _ in range(self.output_length):
+            h, c = states[0]
+
+            energies = H_energies + (c @ W3[n_h:, 0])[:, None]
+            alpha = _softmax(energies)
+            context = np.einsum('bt,btd->bd', alpha, H)
+
+            z = context @ w['decoder/0/W1/kernel'] + w['decoder/0/W1/bias'] + h @ w['decoder/0/U/kernel'] + \
+                w['decoder/0/U/bias']
+            if W4 is not None: z += y @ W4
+
+            # matches AttentionDecoderCell, whose forget gate is the input gate
+            z0, _, z2, z3 = np.split(z, 4, axis=-1)
+            i = f = _hard_sigmoid(z0)
+            c = f * c + i * np.tanh(z2)
+            h = _hard_sigmoid(z3) * np.tanh(c)
+            states[0] = h, c
+
+            y = self._activation(h @ w['decoder/0/W2/kernel'] + w['decoder/0/W2/bias'], 0)
+
+            for cell in range(1, self.depth):
+                h, c = states[cell]
+
+                z = y @ w[f'decoder/{cell}/W1/kernel'] + h @ w[f'decoder/{cell}/U/kernel'] + w[f'decoder/{cell}/U/bias']
+
+                z0, z1, z2, z3 = np.split(z, 4, axis=-1)
+                c = _hard_sigmoid(z1) * c + _hard_sigmoid(z0) * np.tanh(z2)
+                h = _hard_sigmoid(z3) * np.tanh(c)
+                states[cell] = h, c
+
+                y = self._activation(h @ w[f'decoder/{cell}/W2/kernel'] + w[f'decoder/{cell}/W2/bias'], cell)
+
+            outputs.append(y)
+
+        return np.stack(outputs, axis=1)
+
+    def _lstm(self, X: ndarray, direction: str, cell: int, mask: ndarray = None) -> ndarray:
+        '''
+        Runs an encoder LSTM cell over whole sequences
+
+        :param X: the cell inputs
+        :param direction: the encoder direction
+        :param cell: the position of the cell in the direction's stack
+        :param mask: which steps are not padding, if masked: padding steps keep the states of the step before, as
+                     in ``K.rnn``, and their outputs are zeroed by :meth:`encoded`
+        :return: the cell outputs
+        '''
+        prefix = f'{direction}/{cell}'
+        U = self.weights[f'{prefix}/U/kernel']
+
+        # the input projections of all steps at once
+        XW = X @ self.weights[f'{prefix}/W/kernel'] + self.weights[f'{prefix}/W/bias']
+
+        h, c = self._zero_states(X.shape[0], U)
+
+        outputs = []
+        for t in range(X.shape[1]):
+            z0, z1, z2, z3 = np.split(XW[:, t] + h @ U, 4, axis=-1)
+
+            # matches britfoner.recurrentshop.cells.LSTMCell, which keeps the squashed cell state
+            # and has no output gate activation
+            c_t = np.tanh(_hard_sigmoid(z0) * c + _hard_sigmoid(z1) * np.tanh(z2))
+            h_t = z3 * c_t
+
+            if mask is not None:
+                h_t, c_t = np.where(mask[:, t, None], h_t, h), np.where(mask[:, t, None], c_t, c)
+
+            h, c = h_t, c_t
+            outputs.append(h)
+
+        return np.stack(outputs, axis=1)
+
+    def _cells_in(self, direction: str) -> int:
+        return sum(1 for name in self.weights if name.startswith(f'{direction}/') and name.endswith('/W/kernel'))
+
+    def _activation(self, x: ndarray, cell: int) -> ndarray:
+        if cell == self.depth - 1 and self.output_activation == 'softmax': return _softmax(x)
+
+        return np.tanh(x)
+
+    @staticmethod
+    def _zero_states(batch_n: int, U: ndarray) -> Tuple[ndarray, ndarray]:
+        return np.zeros((batch_n, U.shape[0]), np.float32), np.zeros((batch_n, U.shape[0]), np.float32)
+
+
+class Predictor:
+    '''
+    Pronounces words with a model with less overhead than ``Model.predict``, which validates, batches and runs
+    callbacks around every call: words are one-hot encoded, as :func:`britfoner.IO.all_encoded` does with
+    :func:`britfoner.IO.bounded` words reversed, straight into input buffers kept for the common batch sizes, and
+    the model's backend function, built once, is called on them directly
+
+    The buffers are reused, so predictions are serialised with a lock
+    '''
+
+    def __init__(self, model: Any, letter_index: Alphabet, inv_phone_index: Inv_Alphabet, max_length: int,
+                 batch_sizes: Iterable[int] = (1, 32), output_activation: str = None):
+        '''
+        :param model: a keras sequence to sequence model, or a :class:`NumpySeq2Seq`
+        :param letter_index: the model's input alphabet
+        :param inv_phone_index: the model's sorted output alphabet
+        :param max_length: the length of the longest word the model takes
+        :param batch_sizes: the numbers of words predicted at once to keep input buffers for
+        :param output_activation: the activation of the model's output layer, tanh if not given
+        '''
+        self.letter_index, self.inv_phone_index, self.max_length = letter_index, inv_phone_index, max_length
+        self.output_activation = output_activation
+        self.predict_function = predict_function_of(model)
+
+        self.buffers = {n: self._buffer(n) for n in batch_sizes}
+        self.lock = Lock()
+
+        self._gap, self._start, self._end = letter_index[_GAP], letter_index[_START], letter_index[_END]
+        self._skipped = [phone in _symbols for phone in inv_phone_index]
+
+    def pronounce(self, words: List[Seq]) -> List[Seq]:
+        '''
+        Predicts the most likely pronunciation of each word, decoded greedily as :func:`britfoner.IO.decoded` does
+
+        :param words: the words, of ``max_length`` letters at most
+        :return: the pronunciations
+        '''
+        return self._decoded(self.predict(words).argmax(axis=-1))
+
+    def pronounce_with_confidence(self, words: List[Seq]) -> List[Tuple[Seq, float]]:
+        '''
+        Predicts the most likely pronunciation of each word, as :meth:`pronounce`, with the confidence in it, see
+        :func:`confidences_of`
+
+        :param words: the words, of ``max_length`` letters at most
+        :return: the pronunciations with their confidences
+        '''
+        Y_hat = self.predict(words)
+
+        return list(zip(self._decoded(Y_hat.argmax(axis=-1)), confidences_of(Y_hat, self.output_activation).tolist()))
+
+    def predict(self, words: List[Seq]) -> ndarray:
+        '''
+        Predicts the model outputs for some words
+
+        :param words: the words, of ``max_length`` letters at most
+        :return: the model outputs
+        '''
+        with self.lock:
+            X = self.buffers.get(len(words))
+            if X is None: X = self._buffer(len(words))
+
+            X.fill(0)
+            for i, word in enumerate(words):
+                gaps = self.max_length - len(word)
+
+                X[i, :gaps, self._gap] = 1
+                X[i, gaps, self._end] = 1
+                X[i, range(gaps + 1, gaps + 1 + len(word)), [self.letter_index[letter] for letter in word[::-1]]] = 1
+                X[i, -1, self._start] = 1
+
+            return self.predict_function([X])[0]
+
+    def _decoded(self, phones: ndarray) -> List[Seq]:
+        return [tuple(self.inv_phone_index[phone] for phone in word_phones if not self._skipped[phone])
+                for word_phones in phones.tolist()]
+
+    def _buffer(self, n: int) -> ndarray:
+        return np.zeros((n, self.max_length + 2, len(self.letter_index)), dtype=np.float32)
+
+
+def confidences_of(Y_hat: ndarray, output_activation: str = None) -> ndarray:
+    '''
+    Scores how confident a model is in its greedily decoded predictions as the smallest margin, over the output
+    steps, between the two highest outputs: 0 when two phones tie at some step, and 1 when a step is certain.
+    Softmax outputs are probabilities, and tanh outputs, trained towards -1 and 1, have their margins halved
+
+    :param Y_hat: the model outputs
+    :param output_activation: the activation of the model's output layer, tanh if not given
+    :return: the confidence in each prediction, in [0, 1]
+    '''
+    top = np.partition(Y_hat, -2, axis=-1)[..., -2:]
+    margins = (top[..., 1] - top[..., 0]) / (1. if output_activation == 'softmax' else 2.)
+
+    return np.clip(margins.min(axis=-1), 0., 1.)
+
+
+def predict_function_of(model: Any):
+    '''
+    Gives the function computing a model's outputs from its inputs, without the machinery around ``Model.predict``.
+    Keras functions add operations to the TensorFlow graph, so they must be built before it is finalized. They are
+    run in the test phase, as ``Model.predict`` runs them, so that dropout is off
+
+    :param model: a keras model, or a :class:`NumpySeq2Seq`
+    :return: a function from a list of input arrays to a list of output arrays
+    '''
+    if isinstance(model, NumpySeq2Seq): return lambda inputs: [model.predict(inputs[0])]
+
+    from keras import backend as K
+
+    function = K.function(model.inputs + [K.learning_phase()], model.outputs)
+
+    return lambda inputs: function(inputs + [0])
+
+
+def numpy_model_from(src: str) -> Tuple[NumpySeq2Seq, Dict[str, Any]]:
+    '''
+    Maps a weights file saved by :func:`britfoner.IO.weights_to` into memory
+
+    :param src: the weights file, relative to the package directory unless absolute
+    :return: the model and its description
+    '''
+    weights, description = arrays_from(join(_MODEL_OUT, src))
+
+    return NumpySeq2Seq(weights, description['config']), description
+
+
+def _hard_sigmoid(x: ndarray) -> ndarray:
+    return np.clip(.2 * x + .5, 0., 1.)
+
+
+def _softmax(x: ndarray) -> ndarray:
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+
+    return e / e.sum(axis=-1, keepdims=True)
+
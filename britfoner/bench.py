@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+'''
+
+script to benchmark inference on the current machine
+
+'''
+import logging
+import tracemalloc
+from argparse import ArgumentParser
+from multiprocessing import get_context, cpu_count
+from statistics import median
+from time import perf_counter
+from typing import Dict, Iterable, Tuple, List, Set
+
+import numpy as np
+
+from britfoner import api, Seq, _MODEL_NAME, _WEIGHTS_NAME, _UNSTRESSED_BRITFONE
+from sklearn.model_selection import train_test_split
+
+from britfoner.IO import all_encoded, bounded, artifact_from, alphabets_from, dictionary_from, lexicon_from, \
+    items_from, index_from
+from britfoner.phonetics import PhoneGrams
+from britfoner.backends import numpy_model_from, Predictor
+
+Setting = Tuple[int, int]
+
+
+def thread_throughputs(settings: Iterable[Setting], batch_sizes: Iterable[int] = (1, 32, 256), repeats: int = 20) \
+        -> Dict[Setting, Dict[int, float]]:
+    '''
+    Measures model throughput for different TensorFlow thread pool sizes. Each setting is measured in a
+    fresh process, as thread pools can't be resized once a session exists
+
+    :param settings: (intra-op, inter-op) thread pool sizes to measure
+    :param batch_sizes: the batch sizes to measure each setting with
+    :param repeats: number of batches timed per batch size
+    :return: the words per second, by batch size, for each setting
+    '''
+    context = get_context('spawn')
+
+    throughputs = {}
+    for setting in settings:
+        with context.Pool(1) as pool:
+            throughputs[setting] = pool.apply(_throughput, (setting, tuple(batch_sizes), repeats))
+
+    return throughputs
+
+
+def _throughput(setting: Setting, batch_sizes: Tuple[int, ...], repeats: int) -> Dict[int, float]:
+    '''
+    Measures model throughput in the current process
+
+    :param setting: (intra-op, inter-op) thread pool sizes
+    :param batch_sizes: the batch sizes to measure
+    :param repeats: number of batches timed per batch size
+    :return: the words per second by batch size
+    '''
+    api.configure(*setting)
+    model = api.load()
+
+    X = all_encoded([bounded(word, api.MAX_LENGTH) for word in _words(max(batch_sizes))],
+                    api._letter_index, reverse=True)
+
+    throughput = {}
+    for n in batch_sizes:
+        model.predict(X[:n], batch_size=n)
+
+        start = perf_counter()
+        for _ in range(repeats):
+            model.predict(X[:n], batch_size=n)
+
+        throughput[n] = n * repeats / (perf_counter() - start)
+
+    return throughput
+
+
+def load_times(srcs: Iterable[str], repeats: int = 3) -> Dict[str, float]:
+    '''
+    Measures the time to load model files, with the alphabets needed to use them, each in a fresh process
+
+    :param srcs: the model files, ``.weights`` files being loaded with the numpy backend
+    :param repeats: number of loads per file
+    :return: the median load time in seconds of each file
+    '''
+    context = get_context('spawn')
+
+    times = {}
+    for src in srcs:
+        runs = []
+        for _ in range(repeats):
+            with context.Pool(1) as pool:
+                runs.append(pool.apply(_load_time, (src,)))
+
+        times[src] = median(runs)
+
+    return times
+
+
+def _load_time(src: str) -> float:
+    '''
+    Measures the time to load a model file in the current process
+
+    :param src: the model file
+    :return: the load time in seconds
+    '''
+    dictionary = api.dictionary()
+    start = perf_counter()
+
+    model, description = numpy_model_from(src) if src.endswith('.weights') else artifact_from(src)
+    alphabets_from(description, dictionary)
+
+    return perf_counter() - start
+
+
+def predict_latencies(batch_sizes: Iterable[int] = (1, 32), repeats: int = 200) -> Dict[int, Dict[str, float]]:
+    '''
+    Compares the latency of predicting with ``Model.predict`` on words encoded with :func:`all_encoded`, as
+    :func:`britfoner.api.pronounce` used to, against a :class:`britfoner.backends.Predictor`
+
+    :param batch_sizes: the numbers of words predicted at once
+    :param repeats: number of predictions timed per batch size
+    :return: the median latency in milliseconds of each way, by batch size
+    '''
+    model = api.load()
+    predictor = Predictor(model, api._letter_index, api._inv_phone_index, api.MAX_LENGTH, batch_sizes)
+
+    def predicted(words):
+        X = all_encoded([bounded(word, api.MAX_LENGTH) for word in words], api._letter_index, reverse=True)
+
+        return model.predict(X, batch_size=len(words))
+
+    latencies = {}
+    for n in batch_sizes:
+        words = _words(n)
+
+        times = {}
+        for way, predict in (('model', predicted), ('predictor', predictor.predict)):
+            predict(words)
+
+            runs = []
+            for _ in range(repeats):
+                start = perf_counter()
+                predict(words)
+                runs.append(perf_counter() - start)
+
+            times[way] = 1000 * median(runs)
+
+        latencies[n] = times
+
+    return latencies
+
+
+def cascade_tradeoffs(thresholds: Iterable[float] = (0., .1, .2, .3, .4, .5, .6, .7, .8, .9, 1.),
+                      fast: str = 'ngram', data_src: str = _UNSTRESSED_BRITFONE) -> Dict[float, Dict[str, float]]:
+    '''
+    Measures the cascade of a fast model and the model, see :func:`britfoner.api.configure_cascade`, on the
+    validation words of :func:`britfoner.main.main_seq_2_seq`, which neither model was trained on, for different
+    confidence thresholds
+
+    :param thresholds: the least confidences the fast model's pronunciations are accepted with
+    :param fast: the fast model, as in :func:`britfoner.api.configure_cascade`
+    :param data_src: file containing the data the models were trained on
+    :return: the fraction of words the fast model pronounces, the WER and the mean latency in milliseconds per
+             word, by threshold
+    '''
+    words, sounds = items_from(data_src)
+    _, val_words = train_test_split(list(words), test_size=.01, random_state=42)
+    val_words = [word for word in val_words if len(word) <= api.MAX_LENGTH]
+    references = index_from(words, sounds).word_to_sounds
+
+    api.configure_cascade(fast, confidence=1.)
+    api.load()
+
+    timed = {}
+    for tier, pronounce in (('fast', api.fast_model().pronounce_with_confidence),
+                            ('model', lambda batch: [(sound, 1.) for sound in api._predictor.pronounce(batch)])):
+        pronounce(val_words[:1])
+
+        start = perf_counter()
+        timed[tier] = [pronounce([word])[0] for word in val_words]
+        timed[tier + '_ms'] = 1000 * (perf_counter() - start) / len(val_words)
+
+    fast_wrong = np.array([sound not in references[word] for word, (sound, _) in zip(val_words, timed['fast'])])
+    model_wrong = np.array([sound not in references[word] for word, (sound, _) in zip(val_words, timed['model'])])
+    confidences = np.array([confidence for _, confidence in timed['fast']])
+
+    tradeoffs = {}
+    for threshold in thresholds:
+        accepted = confidences >= threshold
+
+        tradeoffs[threshold] = dict(fast=accepted.mean(),
+                                    WER=100 * np.where(accepted, fast_wrong, model_wrong).mean(),
+                                    latency_ms=timed['fast_ms'] + (1 - accepted.mean()) * timed['model_ms'])
+
+    return tradeoffs
+
+
+def padding_fractions(data_src: str = _UNSTRESSED_BRITFONE, batch_n: int = 128) -> Dict[str, float]:
+    '''
+    Measures the fraction of the encoder steps of a training epoch of :func:`britfoner.main.main_seq_2_seq` spent on
+    padding, with inputs all padded to the longest word and cut to the longest word in their batch, see
+    :class:`britfoner.g2p.BucketedSequence`
+
+    :param data_src: file containing the training data
+    :param batch_n: batch size
+    :return: the fraction of padding steps, uniform and bucketed
+    '''
+    words, sounds = items_from(data_src)
+    train_words, _ = train_test_split(list(words), test_size=.01, random_state=42)
+
+    # words are bounded by a start and an end symbol
+    lengths = np.sort([len(word) + 2 for word in train_words])
+    batches = np.array_split(lengths, range(batch_n, len(lengths), batch_n))
+
+    return dict(uniform=1 - lengths.sum() / (len(lengths) * index_from(words, sounds).x_n),
+                bucketed=1 - lengths.sum() / sum(batch.max() * len(batch) for batch in batches))
+
+
+def lexicon_costs(src: str = _UNSTRESSED_BRITFONE, prefix_length: int = 3) -> Dict[str, Dict[str, float]]:
+    '''
+    Compares the memory and lookup times of the dictionary as a dict, as given by :func:`dictionary_from`,
+    and as a :class:`britfoner.IO.Lexicon`
+
+    :param src: file to read the dictionary from
+    :param prefix_length: the length of the prefixes looked up, taken from the dictionary words
+    :return: the memory in MB, and the median exact and prefix lookup times in microseconds, of each structure
+    '''
+    tracemalloc.start()
+    dictionary = dictionary_from(src)
+    dict_mb = tracemalloc.get_traced_memory()[0] / 2 ** 20
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    lexicon = lexicon_from(dictionary)
+    lexicon_mb = tracemalloc.get_traced_memory()[0] / 2 ** 20
+    tracemalloc.stop()
+
+    words = list(dictionary)
+    prefixes = sorted({word[:prefix_length] for word in words})
+
+    def scan(prefix):
+        return sorted(word for word in dictionary if word[:len(prefix)] == prefix)
+
+    return dict(dict=dict(MB=dict_mb,
+                          exact_us=_lookup_time(dictionary.get, words),
+                          prefix_us=_lookup_time(scan, prefixes[::max(1, len(prefixes) // 50)])),
+                lexicon=dict(MB=lexicon_mb,
+                             exact_us=_lookup_time(lexicon.get, words),
+                             prefix_us=_lookup_time(lexicon.with_prefix, prefixes)))
+
+
+def sounds_like_latencies(sizes: Iterable[int] = (16000, 1000000), queries: int = 100, max_edits: int = 2,
+                          random_state: int = 42) -> Dict[int, Dict[str, float]]:
+    '''
+    Measures the latency of phone similarity search, see :class:`britfoner.phonetics.PhoneGrams`, against computing
+    the distance to every pronunciation, over lexicons of different sizes. Lexicons larger than the dictionary are
+    made up by adding variants of its words with a phone changed
+
+    :param sizes: the numbers of lexicon entries
+    :param queries: number of pronunciations searched for, taken from the dictionary
+    :param max_edits: the largest number of phone edits searched within
+    :param random_state: the seed for making up lexicons and picking queries
+    :return: the index build time in seconds, and the median search and scan times in milliseconds, by size
+    '''
+    random = np.random.RandomState(random_state)
+    dictionary = api.dictionary()
+    sounds = [sound for word in dictionary for sound in dictionary[word]]
+
+    latencies = {}
+    for size in sizes:
+        lexicon = lexicon_from(_made_up_dictionary(dictionary, size, random))
+
+        start = perf_counter()
+        index = PhoneGrams(lexicon)
+        build_s = perf_counter() - start
+
+        picked = [sounds[idx] for idx in random.choice(len(sounds), queries)]
+        all_sounds = np.arange(len(index.lengths))
+
+        search, scan = [], []
+        for sound in picked:
+            start = perf_counter()
+            index.nearest(sound, max_edits=max_edits)
+            search.append(perf_counter() - start)
+
+            start = perf_counter()
+            index._distances([lexicon.phone[phone] for phone in sound], all_sounds)
+            scan.append(perf_counter() - start)
+
+        latencies[size] = dict(build_s=build_s, search_ms=1000 * median(search), scan_ms=1000 * median(scan))
+
+    return latencies
+
+
+def _made_up_dictionary(dictionary, size: int, random: np.random.RandomState) -> Dict[Seq, Set[Seq]]:
+    '''
+    Makes up a dictionary of a given size from a smaller one, by truncating it or by adding variants of its words,
+    spelled with a numbered suffix and pronounced with one phone substituted, inserted or deleted
+
+    :param dictionary: the dictionary
+    :param size: the number of words
+    :param random: the random number generator
+    :return: the made up dictionary
+    '''
+    words = list(dictionary)
+    made_up = {word: dictionary[word] for word in words[:size]}
+    phones = sorted({phone for word in words for sound in dictionary[word] for phone in sound})
+
+    for idx in range(size - len(made_up)):
+        word = words[idx % len(words)]
+        sound = list(sorted(dictionary[word])[0])
+
+        at, phone = random.randint(len(sound) + 1), phones[random.randint(len(phones))]
+        edit = random.randint(3) if len(sound) > 1 else 1
+        if edit == 0 and at < len(sound):
+            sound[at] = phone
+        elif edit == 1:
+            sound.insert(at, phone)
+        else:
+            del sound[min(at, len(sound) - 1)]
+
+        made_up[word + tuple(f'#{idx}')] = {tuple(sound)}
+
+    return made_up
+
+
+def _lookup_time(lookup, keys: List, repeats: int = 5) -> float:
+    '''
+    Measures the time of a lookup
+
+    :param lookup: the lookup function
+    :param keys: the keys to look up
+    :param repeats: number of timed passes over the keys
+    :return: the median over the passes of the mean lookup time, in microseconds
+    '''
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        for key in keys: lookup(key)
+        times.append((perf_counter() - start) / len(keys))
+
+    return 1e6 * median(times)
+
+
+def _words(n: int) -> List[Tuple[str, ...]]:
+    '''
+    Picks words from the dictionary to benchmark with
+
+    :param n: number of words
+    :return: the first ``n`` words short enough for the model
+    '''
+    return [word for word in api.dictionary() if len(word) <= api.MAX_LENGTH][:n]
+
+
+def _default_settings() -> List[Setting]:
+    cores = cpu_count()
+
+    return sorted({(1, 1), (2, 1), (max(cores // 2, 1), 1), (cores, 1), (cores, 2)})
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__.strip())
+    commands = parser.add_subparsers(dest='command')
+
+    threads = commands.add_parser('threads', help='model throughput for TensorFlow thread pool sizes')
+    threads.add_argument('--settings', nargs='+', metavar='INTRAxINTER',
+                         type=lambda s: tuple(map(int, s.split('x'))), default=_default_settings())
+    threads.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 32, 256])
+    threads.add_argument('--repeats', type=int, default=20)
+
+    load = commands.add_parser('load', help='time to load model files')
+    load.add_argument('srcs', nargs='*', default=[_MODEL_NAME, _WEIGHTS_NAME])
+    load.add_argument('--repeats', type=int, default=3)
+
+    predict = commands.add_parser('predict', help='latency of Model.predict against the low-overhead predictor')
+    predict.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 32])
+    predict.add_argument('--repeats', type=int, default=200)
+
+    cascade = commands.add_parser('cascade', help='WER and latency of the fast model and model cascade')
+    cascade.add_argument('--thresholds', nargs='+', type=float, default=[0., .1, .2, .3, .4, .5, .6, .7, .8, .9, 1.])
+    cascade.add_argument('--fast', default='ngram')
+
+    padding = commands.add_parser('padding', help='fraction of training encoder steps spent on padding')
+    padding.add_argument('--batch-n', type=int, default=128)
+
+    lexicon = commands.add_parser('lexicon', help='memory and lookup times of the dictionary structures')
+    lexicon.add_argument('src', nargs='?', default=_UNSTRESSED_BRITFONE)
+
+    sounds_like = commands.add_parser('sounds-like', help='latency of phone similarity search by lexicon size')
+    sounds_like.add_argument('--sizes', nargs='+', type=int, default=[16000, 1000000])
+    sounds_like.add_argument('--queries', type=int, default=100)
+    sounds_like.add_argument('--max-edits', type=int, default=2)
+
+    args = parser.parse_args()
+
+    if args.command == 'threads':
+        for (intra, inter), throughput in thread_throughputs(args.settings, args.batch_sizes, args.repeats).items():
+            rates = ', '.join(f'[{n}] {rate:8.1f}' for n, rate in throughput.items())
+            logging.info(f'intra-op [{intra:2d}] inter-op [{inter:2d}] words/s by batch size: {rates}')
+    elif args.command == 'load':
+        for src, time in load_times(args.srcs, args.repeats).items():
+            logging.info(f'[{time:6.3f}]s to load [{src}]')
+    elif args.command == 'predict':
+        for n, latency in predict_latencies(args.batch_sizes, args.repeats).items():
+            logging.info(f'[{n:4d}] words: Model.predict [{latency["model"]:8.3f}]ms, '
+                         f'predictor [{latency["predictor"]:8.3f}]ms')
+    elif args.command == 'cascade':
+        for threshold, tradeoff in cascade_tradeoffs(args.thresholds, args.fast).items():
+            logging.info(f'confidence [{threshold:4.2f}]: [{100 * tradeoff["fast"]:5.1f}]% by the fast model, '
+                         f'WER [{tradeoff["WER"]:6.2f}], [{tradeoff["latency_ms"]:6.2f}]ms per word')
+    elif args.command == 'padding':
+        for batching, fraction in padding_fractions(batch_n=args.batch_n).items():
+            logging.info(f'{batching:8s}: [{100 * fraction:5.1f}]% of encoder steps are padding')
+    elif args.command == 'lexicon':
+        for structure, costs in lexicon_costs(args.src).items():
+            logging.info(f'{structure:8s}: [{costs["MB"]:6.2f}]MB, exact lookup [{costs["exact_us"]:8.2f}]us, '
+                         f'prefix lookup [{costs["prefix_us"]:8.2f}]us')
+    elif args.command == 'sounds-like':
+        for size, latency in sounds_like_latencies(args.sizes, args.queries, args.max_edits).items():
+            logging.info(f'[{size:8d}] entries: index built in [{latency["build_s"]:6.2f}]s, search '
+                         f'[{latency["search_ms"]:8.2f}]ms, scan [{latency["scan_ms"]:8.2f}]ms')
+    else:
+        parser.print_help()
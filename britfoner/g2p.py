@@ -3,14 +3,22 @@
 Sequence to sequence model building and training
 
 '''
-from typing import Tuple, Callable
+import logging
+import os
+from multiprocessing import get_context
+from queue import Empty
+from typing import Tuple, Callable, Dict, Any, Optional, Union
 
-from keras.callbacks import ModelCheckpoint
+import numpy as np
+from keras import backend as K
+from keras.callbacks import ModelCheckpoint, Callback
 from keras.optimizers import Adam
+from keras.utils import Sequence
 from numpy import ndarray, argmax
 
-from britfoner import Seq, _symbols, Inv_Alphabet
-from .seq2seq.models import AttentionSeq2Seq
+from britfoner import Seq, _symbols, Inv_Alphabet, Index, _GAP
+from britfoner.IO import decoded, one_hot, seq2seq_from
+from .seq2seq.models import AttentionSeq2Seq, ParallelSeq2Seq
 
 
 def attention_g2p_model_from(input_dim: int,
@@ -19,11 +27,22 @@ def attention_g2p_model_from(input_dim: int,
                              output_length: int,
                              hidden_n: int = 256,
                              dropout=.1,
-                             depth = 1) \
+                             depth = 1,
+                             sparse: bool = False,
+                             lr: float = 1e-3,
+                             loss: str = None,
+                             mask_index: int = None,
+                             readout: bool = False,
+                             teacher_force: bool = False,
+                             teacher_force_ratio: float = None) \
         -> AttentionSeq2Seq:
     '''
     Creates a sequence to sequence model with attention
 
+    By default the model has a tanh output trained with mean squared error against one-hot targets; a sparse
+    model has a softmax output trained with categorical cross-entropy against integer phone ids, shaped
+    ``(N, output_length, 1)``, which needs no dense target tensor
+
     :param input_dim: number of symbols in input alphabet (including end, start and padding)
     :param input_length: length of longest input sequence
     :param output_dim: number of symbols in output alphabet (including end, start and padding)
@@ -31,6 +50,16 @@ def attention_g2p_model_from(input_dim: int,
     :param hidden_n: number of hidden units
     :param dropout: dropout rate
     :param depth: depth of rnn stack
+    :param sparse: whether to train against integer targets
+    :param lr: learning rate
+    :param loss: the loss to compile the model with instead of the default for its targets
+    :param mask_index: the index of the padding symbol in the input alphabet, to mask padding steps, see
+                       :func:`AttentionSeq2Seq`; input_length can then be None, for batches of any length
+    :param readout: whether the decoder also reads its previous output, see :func:`AttentionSeq2Seq`
+    :param teacher_force: whether the decoder gets the previous ground truth phone during training, which the model
+                          then takes as a second, one-hot input; it predicts through :class:`InferenceModel`
+    :param teacher_force_ratio: the initial probability of getting the ground truth rather than the decoder's own
+                                output, for scheduled sampling, see :class:`ScheduledSampling`
     :return: the created, compiled model
     '''
     model = AttentionSeq2Seq(output_dim=output_dim,
@@ -38,32 +67,107 @@ def attention_g2p_model_from(input_dim: int,
                              hidden_dim=hidden_n,
                              input_dim=input_dim,
                              input_length=input_length,
-                             unroll= dropout == 0.,
+                             unroll= dropout == 0. and input_length is not None,
                              dropout= dropout,
-                             depth=depth)
+                             depth=depth,
+                             output_activation='softmax' if sparse else None,
+                             mask_index=mask_index,
+                             readout=readout,
+                             teacher_force=teacher_force,
+                             teacher_force_ratio=teacher_force_ratio)
+
+    model.compile(loss=loss or ('sparse_categorical_crossentropy' if sparse else 'mse'),
+                  optimizer=Adam(lr= lr, decay=1e-6))
+
+    return model
+
+
+def parallel_g2p_model_from(input_dim: int,
+                            input_length: int,
+                            output_dim: int,
+                            output_length: int,
+                            hidden_n: int = 256,
+                            dropout=.1,
+                            depth=4,
+                            sparse: bool = False,
+                            lr: float = 1e-3,
+                            loss: str = None) \
+        -> ParallelSeq2Seq:
+    '''
+    Creates a non-autoregressive sequence to sequence model, which predicts all the phones in one forward pass,
+    trained as :func:`attention_g2p_model_from`
+
+    :param input_dim: number of symbols in input alphabet (including end, start and padding)
+    :param input_length: length of longest input sequence
+    :param output_dim: number of symbols in output alphabet (including end, start and padding)
+    :param output_length: length of longest output sequence
+    :param hidden_n: number of hidden units
+    :param dropout: dropout rate
+    :param depth: number of encoder convolutions
+    :param sparse: whether to train against integer targets
+    :param lr: learning rate
+    :param loss: the loss to compile the model with instead of the default for its targets
+    :return: the created, compiled model
+    '''
+    model = ParallelSeq2Seq(output_dim=output_dim,
+                            output_length=output_length,
+                            hidden_dim=hidden_n,
+                            input_dim=input_dim,
+                            input_length=input_length,
+                            dropout=dropout,
+                            depth=depth,
+                            output_activation='softmax' if sparse else None)
 
-    model.compile(loss='mse', optimizer=Adam(lr= 1e-3, decay=1e-6))
+    model.compile(loss=loss or ('sparse_categorical_crossentropy' if sparse else 'mse'),
+                  optimizer=Adam(lr=lr, decay=1e-6))
 
     return model
 
 
+def soft_targets_from(teacher_Y: ndarray, Y: ndarray, teacher_weight: float = .5) -> ndarray:
+    '''
+    Blends a teacher's outputs with the one-hot targets, as the targets of a distilled student
+
+    :param teacher_Y: the teacher's outputs
+    :param Y: the one-hot encoded output sequences
+    :param teacher_weight: the weight in [0, 1] of the teacher's outputs
+    :return: the blended targets
+    '''
+    if not 0 <= teacher_weight <= 1: raise ValueError('Teacher weight must be in [0, 1]')
+
+    return teacher_weight * teacher_Y + (1 - teacher_weight) * Y
+
+
 def train_g2p(model: AttentionSeq2Seq,
-              train_set: Tuple[ndarray, ndarray],
-              val_set: Tuple[ndarray, ndarray],
+              train_set: Union[Tuple[ndarray, ndarray], Sequence],
+              val_set: Union[Tuple[ndarray, ndarray], Sequence],
               batch_n: int = 128,
               epochs: int = 100,
-              callbacks: Callable = None) -> AttentionSeq2Seq:
+              callbacks: Callable = None,
+              workers: int = 1) -> AttentionSeq2Seq:
     '''
     Trains given model
 
     :param model: sequence to sequence model
-    :param train_set: training data as X, Y tuple of tensors
-    :param val_set: validation data as X, Y tuple of tensors
-    :param batch_n: batch size
+    :param train_set: training data as X, Y tuple of tensors or as a batch :class:`Sequence`
+    :param val_set: validation data as X, Y tuple of tensors or as a batch :class:`Sequence`
+    :param batch_n: batch size, ignored if the training data is a :class:`Sequence`
     :param epochs: number of epochs
     :param callbacks: callbacks for keras training
+    :param workers: number of processes preparing batches ahead, if the training data is a :class:`Sequence`
     :return: trained model
     '''
+    if isinstance(train_set, Sequence):
+        model.fit_generator(train_set,
+                            validation_data=val_set,
+                            epochs=epochs,
+                            callbacks=callbacks,
+                            workers=workers,
+                            use_multiprocessing=workers > 1,
+                            verbose=0)
+
+        return model
+
     train_X, train_Y = train_set
     val_X, val_Y = val_set
 
@@ -77,6 +181,158 @@ def train_g2p(model: AttentionSeq2Seq,
     return model
 
 
+class OneHotSequence(Sequence):
+    '''
+    Batches of input/output tensors, one-hot encoded just in time from matrices of symbol indices
+    (see :func:`britfoner.IO.indexed_dataset_from`), so that only the current batches are held as tensors.
+    Examples are reshuffled after every epoch
+    '''
+
+    def __init__(self, X: ndarray, Y: ndarray, index: Index, batch_n: int = 128,
+                 shuffle: bool = True, random_state: int = None, sparse: bool = False, teacher_force: bool = False):
+        '''
+        :param X: input sequences as a matrix of letter indices
+        :param Y: output sequences as a matrix of phone indices
+        :param index: the dataset index
+        :param batch_n: batch size
+        :param shuffle: whether to reshuffle the examples after every epoch
+        :param random_state: the seed for shuffling
+        :param sparse: whether to give the outputs as integer targets rather than one-hot encoded
+        :param teacher_force: whether to give the one-hot encoded outputs also as a second input, for teacher forced
+                              models, see :func:`attention_g2p_model_from`
+        '''
+        self.X, self.Y = X, Y
+        self.x_dim, self.y_dim = index.x_dim, index.y_dim
+        self.batch_n = batch_n
+        self.shuffle = shuffle
+        self.sparse = sparse
+        self.teacher_force = teacher_force
+        self._order = np.arange(len(X))
+        self._random = np.random.RandomState(random_state)
+
+        self.on_epoch_end()
+
+    def __len__(self) -> int:
+        return -(-len(self.X) // self.batch_n)
+
+    def __getitem__(self, idx: int) -> Tuple[ndarray, ndarray]:
+        # sorted so that memory-mapped sources are read in order
+        batch = np.sort(self._order[idx * self.batch_n: (idx + 1) * self.batch_n])
+
+        return self._tensors(self.X[batch], self.Y[batch])
+
+    def _tensors(self, X: ndarray, Y: ndarray) -> Tuple[Any, ndarray]:
+        '''
+        :param X: the batch input sequences, as letter indices
+        :param Y: the batch output sequences, as phone indices
+        :return: the batch inputs and targets, as the model takes them
+        '''
+        targets = Y[..., None] if self.sparse else one_hot(Y, self.y_dim)
+        X = one_hot(X, self.x_dim)
+
+        if not self.teacher_force: return X, targets
+
+        return [X, one_hot(Y, self.y_dim) if self.sparse else targets], targets
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self._random.shuffle(self._order)
+
+
+class BucketedSequence(OneHotSequence):
+    '''
+    Batches of input/output tensors as :class:`OneHotSequence`, of words of about the same length: examples are
+    sorted by input length, in a random order among those as long, and batched in that order, and each batch's
+    inputs are cut to its longest word, so that a masked model (see :func:`britfoner.seq2seq.AttentionSeq2Seq`)
+    takes few padding steps. Batches are reshuffled after every epoch
+
+    Outputs keep their full length, as the decoder runs a fixed number of steps
+    '''
+
+    def __init__(self, X: ndarray, Y: ndarray, index: Index, batch_n: int = 128,
+                 shuffle: bool = True, random_state: int = None, sparse: bool = False, teacher_force: bool = False):
+        '''
+        :param X: input sequences as a matrix of letter indices, padded at the start as
+                  :func:`britfoner.IO.indexed_dataset_from` gives them
+        :param Y: output sequences as a matrix of phone indices
+        :param index: the dataset index
+        :param batch_n: batch size
+        :param shuffle: whether to reshuffle the examples after every epoch
+        :param random_state: the seed for shuffling
+        :param sparse: whether to give the outputs as integer targets rather than one-hot encoded
+        :param teacher_force: whether to give the one-hot encoded outputs also as a second input
+        '''
+        self.lengths = (np.asarray(X) != index.letter[_GAP]).sum(axis=1)
+        self._batches = []
+
+        super().__init__(X, Y, index, batch_n=batch_n, shuffle=shuffle, random_state=random_state, sparse=sparse,
+                         teacher_force=teacher_force)
+
+    def __getitem__(self, idx: int) -> Tuple[ndarray, ndarray]:
+        batch = np.sort(self._batches[idx])
+        width = self.lengths[batch].max()
+
+        return self._tensors(self.X[batch, -width:], self.Y[batch])
+
+    def on_epoch_end(self):
+        super().on_epoch_end()
+
+        order = self._order[np.argsort(self.lengths[self._order], kind='stable')]
+        self._batches = [order[start:start + self.batch_n] for start in range(0, len(order), self.batch_n)]
+
+        if self.shuffle: self._random.shuffle(self._batches)
+
+
+class ScheduledSampling(Callback):
+    '''
+    Lowers the probability of a teacher forced model getting the ground truth rather than its own output linearly,
+    after every epoch, from 1 to ``least`` over ``epochs`` epochs, so that the model learns from its own mistakes
+    as it starts making fewer. The model must be built with a ``teacher_force_ratio``, see
+    :func:`attention_g2p_model_from`
+    '''
+
+    def __init__(self, epochs: int, least: float = 0.):
+        '''
+        :param epochs: the number of epochs until the probability reaches ``least``
+        :param least: the lowest probability
+        '''
+        super().__init__()
+
+        self.epochs = epochs
+        self.least = least
+
+    def on_epoch_begin(self, epoch, logs=None):
+        K.set_value(self.model.decoder.teacher_force_ratio, self.ratio_at(epoch))
+
+    def ratio_at(self, epoch: int) -> float:
+        '''
+        :param epoch: the epoch number
+        :return: the probability of getting the ground truth during the epoch
+        '''
+        return max(self.least, 1. - (1. - self.least) * epoch / self.epochs)
+
+
+class InferenceModel:
+    '''
+    Predicts with the current weights of a teacher forced model, which takes the ground truth as a second input,
+    through the same model built without it, which feeds back its own outputs. The two have the same weights, so
+    weights saved from one load into the other
+    '''
+
+    def __init__(self, model: AttentionSeq2Seq, config: Dict[str, Any]):
+        '''
+        :param model: the teacher forced model
+        :param config: the model configuration, with ``readout`` set, see :func:`britfoner.IO.seq2seq_from`
+        '''
+        self.model = model
+        self.inference = seq2seq_from(config)
+
+    def predict(self, X: ndarray, **kwargs) -> ndarray:
+        self.inference.set_weights(self.model.get_weights())
+
+        return self.inference.predict(X, **kwargs)
+
+
 def most_likely_sequence(y_hat: ndarray, inv_alphabet: Inv_Alphabet) -> Seq:
     '''
     Returns the most likely sequence for the given prediced output vector. The decoding
@@ -107,10 +363,227 @@ class WER_ModelCheckpoint(ModelCheckpoint):
                          mode=mode, period=period)
 
         self.callback = callback
+        self.best_epoch = None
+        self.wers = {}
 
     #hack to ensure the monitored quantity is the WER rather than the loss/metric
     def on_epoch_end(self, epoch, logs=None):
         WER = self.callback(epoch, logs)
-        logs['WER'] = WER
+
+        # epochs that were not evaluated can't be compared against the best WER so far
+        if WER is None: return
+
+        logs['WER'] = self.wers[epoch] = WER
+
+        if self.monitor_op(WER, self.best):
+            self.best_epoch = epoch
 
         super().on_epoch_end(epoch, logs)
+
+
+class WER_Evaluator:
+    '''
+    Computes the Word Error Rate (WER) of a model on a fixed validation set
+
+    The validation references are decoded once, on construction, into a tensor of phone indices,
+    so that scoring the predictions of every epoch only takes batched array operations. Evaluation
+    can be limited to every ``period`` epochs and/or to the epochs in which the validation loss improves;
+    skipped epochs score as ``None``, which :class:`WER_ModelCheckpoint` ignores
+    '''
+
+    def __init__(self, model, val_X: ndarray, index: Index,
+                 period: Optional[int] = 1, on_improvement: bool = False):
+        '''
+        :param model: the model to evaluate
+        :param val_X: validation set input sequences
+        :param index: the dataset index
+        :param period: evaluate every this many epochs, or never if None
+        :param on_improvement: whether to evaluate also when the validation loss improves
+        '''
+        self.model = model
+        self.val_X = val_X
+        self.period = period
+        self.on_improvement = on_improvement
+        self.best_loss = np.inf
+
+        self.words = [decoded(x, index.inv_letter, reverse=True) for x in val_X]
+
+        self._is_symbol = np.array([phone in _symbols for phone in index.inv_phone])
+
+        refs = [sorted(index.word_to_sounds[word]) for word in self.words]
+        self._refs = np.full((len(refs), max(map(len, refs)), index.y_n), -1, dtype=np.int32)
+        self._valid = np.zeros(self._refs.shape[:2], dtype=bool)
+
+        for i, sounds in enumerate(refs):
+            for k, sound in enumerate(sounds):
+                self._refs[i, k, :len(sound)] = [index.phone[phone] for phone in sound]
+                self._valid[i, k] = True
+
+    def __call__(self, epoch: int, logs: Dict[str, Any]) -> Optional[float]:
+        '''
+        Scores the model at the end of an epoch, if due
+
+        :param epoch: the epoch number
+        :param logs: the training logs for the epoch
+        :return: the WER as a percentage, or None if the epoch is not evaluated
+        '''
+        val_loss = logs.get('val_loss', np.inf)
+        improved = val_loss < self.best_loss
+        self.best_loss = min(val_loss, self.best_loss)
+
+        due = self.period is not None and epoch % self.period == 0
+
+        if not (due or self.on_improvement and improved): return None
+
+        return self.wer(self.model.predict(self.val_X))
+
+    def wer(self, Y_hat: ndarray) -> float:
+        '''
+        Computes the WER of the given predictions
+
+        :param Y_hat: predicted output tensor for the validation inputs
+        :return: the WER as a percentage
+        '''
+        return 100 * self.errors(Y_hat).mean()
+
+    def errors(self, Y_hat: ndarray) -> ndarray:
+        '''
+        Finds the validation data points whose predicted pronunciation is wrong
+
+        :param Y_hat: predicted output tensor for the validation inputs
+        :return: a boolean vector, true for wrongly predicted data points
+        '''
+        ids = argmax(Y_hat, axis=-1)
+        keep = ~self._is_symbol[ids]
+
+        # greedy decoding drops symbols wherever they are, so the remaining phones are moved to the front
+        rows = np.arange(len(ids))[:, None]
+        compact = ids[rows, np.argsort(~keep, axis=1, kind='mergesort')]
+        compact[np.arange(ids.shape[1]) >= keep.sum(axis=1)[:, None]] = -1
+
+        matches = (compact[:, None, :] == self._refs).all(axis=2) & self._valid
+
+        return ~matches.any(axis=1)
+
+
+
+class Async_WER_ModelCheckpoint(Callback):
+    '''
+    Saves the training model every time the Word Error Rate (WER) improves, like :class:`WER_ModelCheckpoint`,
+    but without blocking training: after each epoch the weights are dumped next to ``filepath`` and a worker
+    process scores them on its own copy of the model, keeping the dump only if it is the best so far.
+
+    Results are collected as they arrive, and training stops once ``patience`` epochs have passed since
+    the epoch with the best WER received so far
+    '''
+
+    def __init__(self, filepath: str, model_config: Dict[str, Any], val_X: ndarray, index: Index,
+                 patience: Optional[int] = None, max_pending: int = 4, period: int = 10):
+        '''
+        :param filepath: the file to save the best model to
+        :param model_config: the worker's model configuration, see :func:`britfoner.IO.seq2seq_from`
+        :param val_X: validation set input sequences
+        :param index: the dataset index
+        :param patience: number of epochs without WER improvement before stopping training, or None to never stop
+        :param max_pending: maximum number of dumps waiting to be scored; epochs beyond it are not evaluated
+        :param period: the frequency to publish the WER at
+        '''
+        super().__init__()
+
+        self.filepath = filepath
+        self.model_config = model_config
+        self.val_X = val_X
+        self.index = index
+        self.patience = patience
+        self.max_pending = max_pending
+        self.period = period
+
+    def on_train_begin(self, logs=None):
+        context = get_context('spawn')
+
+        self.jobs, self.results = context.Queue(), context.Queue()
+        self.worker = context.Process(target=_wer_worker,
+                                      args=(self.model_config, self.val_X, self.index,
+                                            self.filepath, self.jobs, self.results),
+                                      daemon=True)
+        self.worker.start()
+
+        self.pending, self.best, self.best_epoch = 0, np.inf, None
+        self.wers = {}
+
+    def on_epoch_end(self, epoch, logs=None):
+        # otherwise pending dumps would never be scored, and every later epoch skipped until training ends
+        if not self.worker.is_alive():
+            logging.error(f'WER worker exited with code [{self.worker.exitcode}], stopping training')
+            self.model.stop_training = True
+            return
+
+        self._collect(block=False)
+
+        if self.pending < self.max_pending:
+            dump = f'{self.filepath}.{epoch:04d}.tmp'
+            self.model.save_weights(dump, overwrite=True)
+            self.jobs.put((epoch, dump))
+            self.pending += 1
+        else:
+            logging.debug(f'[{epoch:04d}] WER worker is behind, epoch not evaluated')
+
+        if self.patience is not None and self.best_epoch is not None and epoch - self.best_epoch > self.patience:
+            self.model.stop_training = True
+
+    def on_train_end(self, logs=None):
+        self.jobs.put(None)
+        self._collect(block=True)
+        self.worker.join()
+
+    def _collect(self, block: bool):
+        '''
+        Takes in the scores computed by the worker
+
+        :param block: whether to wait for all pending scores
+        '''
+        while self.pending:
+            try:
+                epoch, WER = self.results.get(timeout=1) if block else self.results.get_nowait()
+            except Empty:
+                if block and self.worker.is_alive(): continue
+                # left for the other callbacks to finish, rather than raised
+                if block: logging.error(f'WER worker exited with [{self.pending}] evaluations pending')
+                return
+
+            self.pending -= 1
+            self.wers[epoch] = WER
+
+            if WER < self.best:
+                self.best, self.best_epoch = WER, epoch
+
+            if epoch % self.period == 0:
+                logging.info(f'[{epoch:04d}] WER [{WER:6.2f}], best [{self.best:6.2f}] at [{self.best_epoch:04d}]')
+
+
+def _wer_worker(model_config: Dict[str, Any], val_X: ndarray, index: Index, filepath: str, jobs, results):
+    '''
+    Scores weight dumps as they are queued, until it receives None, keeping the best one at ``filepath``
+
+    :param model_config: the keyword arguments to build the model with
+    :param val_X: validation set input sequences
+    :param index: the dataset index
+    :param filepath: the file to save the best weights to
+    :param jobs: queue of (epoch, weights file) tuples
+    :param results: queue to put the (epoch, WER) tuples in
+    '''
+    model = seq2seq_from(model_config)
+    evaluator = WER_Evaluator(model, val_X, index)
+    best = np.inf
+
+    for epoch, dump in iter(jobs.get, None):
+        model.load_weights(dump)
+        WER = evaluator.wer(model.predict(val_X))
+
+        if WER < best:
+            best = WER
+            os.replace(dump, filepath)
+        else:
+            os.remove(dump)
+
+        results.put((epoch, WER))
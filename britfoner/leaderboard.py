@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+'''
+
+script to rank model artifacts by accuracy and inference cost on a held-out lexicon
+
+'''
+import csv
+import logging
+import sys
+from argparse import ArgumentParser
+from collections import defaultdict
+from multiprocessing import get_context, cpu_count
+from os.path import join
+from statistics import median
+from time import perf_counter
+from typing import Dict, Any, List, Iterable, Set, Tuple
+
+import numpy as np
+
+from britfoner import Seq, _MODEL_OUT, _UNSTRESSED_BRITFONE
+from britfoner.IO import items_from, dictionary_from, artifact_from, alphabets_from, configure_threads, \
+    config_from_name
+from britfoner.backends import Predictor, numpy_model_from
+
+FIELDS = ['rank', 'artifact', 'WER', 'words', 'skipped', 'params', 'load_s', 'latency_ms', 'batch_ms', 'words_per_s',
+          'rss_mb', 'model_mb']
+
+# the model loaded by the current pool process, see _errors_in
+_loaded = {}
+
+
+def leaderboard(srcs: Iterable[str], data_src: str, out: str = None, threads: int = 1, batch_n: int = 256,
+                repeats: int = 100) -> List[Dict[str, Any]]:
+    '''
+    Measures model artifacts, ``.h5`` files or ``.weights`` files for the numpy backend, on a held-out lexicon and
+    ranks them by WER, then by single word latency, writing the table to ``out`` if given
+
+    The WER is computed with batched inference on a process pool sized to the machine, each process using
+    ``threads`` TensorFlow threads. Latency and memory are measured in a fresh process per model, on its own: the
+    time to load the model, the median time to predict a word at a time and a batch of ``batch_n`` words, and the
+    peak resident memory of the process, together with how much of it loading and running the model added
+
+    Words longer than a model takes are left out of its WER, and counted as skipped
+
+    :param srcs: the model files, relative to the package directory unless absolute
+    :param data_src: the held-out lexicon, in the same format as the training data, see :func:`items_from`
+    :param out: the file to write the table to, tab separated, if given
+    :param threads: number of TensorFlow intra-op threads per process
+    :param batch_n: the number of words predicted at once
+    :param repeats: number of words predicted one at a time to time
+    :return: the table rows, ranked
+    '''
+    references = defaultdict(set)
+    for word, sound in zip(*items_from(data_src)):
+        references[word].add(sound)
+
+    context = get_context('spawn')
+    processes = max(1, cpu_count() // threads)
+    entries = list(references.items())
+    chunk_n = -(-len(entries) // processes)
+    chunks = [dict(entries[start:start + chunk_n]) for start in range(0, len(entries), chunk_n)]
+
+    rows = []
+    for src in srcs:
+        with context.Pool(min(processes, len(chunks))) as pool:
+            errors, scored = np.sum(pool.map(_errors_in, [(src, chunk, threads, batch_n) for chunk in chunks]), axis=0)
+
+        with context.Pool(1) as pool:
+            row = pool.apply(_costs_of, (src, list(references)[:batch_n], threads, batch_n, repeats))
+
+        rows.append(dict(artifact=src, WER=round(100 * errors / max(scored, 1), 2), words=int(scored),
+                         skipped=len(references) - int(scored), **row))
+
+        logging.info(f'[{src}]: WER [{rows[-1]["WER"]:6.2f}], [{row["latency_ms"]:6.2f}]ms per word, '
+                     f'[{row["words_per_s"]:8.1f}] words/s in batches, [{row["rss_mb"]:7.1f}]MB')
+
+    rows.sort(key=lambda row: (row['WER'], row['latency_ms']))
+    for rank, row in enumerate(rows, 1):
+        row['rank'] = rank
+
+    if out is not None:
+        with open(out, 'w', newline='') as out_file:
+            writer = csv.DictWriter(out_file, FIELDS, delimiter='\t')
+            writer.writeheader()
+            writer.writerows(rows)
+
+    return rows
+
+
+def _costs_of(src: str, words: List[Seq], threads: int, batch_n: int, repeats: int) -> Dict[str, Any]:
+    '''
+    Measures the inference cost of a model in the current process, which shouldn't have loaded any other
+
+    :param src: the model file
+    :param words: words to predict
+    :param threads: number of TensorFlow intra-op threads
+    :param batch_n: the number of words predicted at once
+    :param repeats: number of words predicted one at a time to time
+    :return: the number of parameters, load time in seconds, median single word and batch latencies in
+             milliseconds, batched throughput in words per second, and peak and model resident memory in MB
+    '''
+    base_mb = _peak_rss_mb()
+
+    start = perf_counter()
+    predictor, params = _predictor_from(src, threads, batch_n)
+    load_s = perf_counter() - start
+
+    words = [word for word in words if len(word) <= predictor.max_length]
+    if not words: raise ValueError(f'No held-out words are short enough for [{src}]')
+    batch = [words[idx % len(words)] for idx in range(batch_n)]
+
+    predictor.predict(batch[:1])
+    single = []
+    for idx in range(repeats):
+        start = perf_counter()
+        predictor.predict([words[idx % len(words)]])
+        single.append(perf_counter() - start)
+
+    predictor.predict(batch)
+    batched = []
+    for _ in range(max(repeats // 10, 3)):
+        start = perf_counter()
+        predictor.predict(batch)
+        batched.append(perf_counter() - start)
+
+    rss_mb = _peak_rss_mb()
+
+    return dict(params=params, load_s=round(load_s, 3),
+                latency_ms=round(1000 * median(single), 3), batch_ms=round(1000 * median(batched), 3),
+                words_per_s=round(batch_n / median(batched), 1),
+                rss_mb=round(rss_mb, 1), model_mb=round(rss_mb - base_mb, 1))
+
+
+def _errors_in(job: Tuple[str, Dict[Seq, Set[Seq]], int, int]) -> Tuple[int, int]:
+    '''
+    Pronounces some held-out words with a model, loaded once per pool process
+
+    :param job: the model file, the words with their pronunciations, the number of TensorFlow intra-op threads and
+                the number of words predicted at once
+    :return: the number of words mispronounced and of words short enough for the model
+    '''
+    src, references, threads, batch_n = job
+
+    if src not in _loaded:
+        _loaded.clear()
+        _loaded[src] = _predictor_from(src, threads, batch_n, references)[0]
+    predictor = _loaded[src]
+
+    words = [word for word in references if len(word) <= predictor.max_length]
+
+    errors = 0
+    for start in range(0, len(words), batch_n):
+        batch = words[start:start + batch_n]
+        errors += sum(sound not in references[word] for word, sound in zip(batch, predictor.pronounce(batch)))
+
+    return errors, len(words)
+
+
+def _predictor_from(src: str, threads: int, batch_n: int, dictionary: Dict[Seq, Set[Seq]] = None) \
+        -> Tuple[Predictor, int]:
+    '''
+    Loads a model file into a predictor
+
+    :param src: the model file, ``.weights`` files being loaded with the numpy backend
+    :param threads: number of TensorFlow intra-op threads
+    :param batch_n: the number of words predicted at once
+    :param dictionary: words the model's alphabets must cover, see :func:`alphabets_from`
+    :return: the predictor and the model's number of parameters
+    '''
+    if src.endswith('.weights'):
+        model, description = numpy_model_from(src)
+        params = sum(weight.size for weight in model.weights.values())
+    else:
+        configure_threads(threads, 1)
+        model, description = artifact_from(src)
+        params = model.count_params()
+
+    # models without description were trained on Britfone, whose alphabets they use
+    letter_index, inv_phone_index = alphabets_from(description, dictionary or {}) if description else \
+        alphabets_from(None, dictionary_from(_UNSTRESSED_BRITFONE))
+
+    config = description['config'] if description else config_from_name(src)
+
+    predictor = Predictor(model, letter_index, inv_phone_index, config['input_length'] - 2, batch_sizes=(1, batch_n),
+                          output_activation=config.get('output_activation'))
+
+    return predictor, params
+
+
+def _peak_rss_mb() -> float:
+    '''
+    :return: the peak resident memory of the current process so far in MB, NaN where it can't be read
+    '''
+    try:
+        from resource import getrusage, RUSAGE_SELF
+    except ImportError:  # on Windows
+        return float('nan')
+
+    # in bytes on macOS and in kilobytes elsewhere
+    return getrusage(RUSAGE_SELF).ru_maxrss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__.strip())
+    parser.add_argument('srcs', nargs='+', metavar='MODEL', help='model files, .h5 or .weights')
+    parser.add_argument('--data', required=True, help='held-out lexicon, in the format of the training data')
+    parser.add_argument('--out', default=join(_MODEL_OUT, 'leaderboard.tsv'))
+    parser.add_argument('--threads', type=int, default=1, help='TensorFlow threads per process')
+    parser.add_argument('--batch-n', type=int, default=256)
+    parser.add_argument('--repeats', type=int, default=100)
+
+    args = parser.parse_args()
+
+    for row in leaderboard(args.srcs, args.data, args.out, args.threads, args.batch_n, args.repeats):
+        logging.info(f'[{row["rank"]:2d}] [{row["artifact"]}]: WER [{row["WER"]:6.2f}], [{row["params"]:8d}] parameters, '
+                     f'[{row["latency_ms"]:6.2f}]ms per word, [{row["batch_ms"]:8.2f}]ms per batch, '
+                     f'[{row["rss_mb"]:7.1f}]MB')
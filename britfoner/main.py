@@ -6,55 +6,435 @@ script to train model
 '''
 
 
-from os.path import join
-from typing import Dict, Any, Tuple
+from os.path import join, splitext
+from statistics import median
+from time import perf_counter
+from typing import Dict, Any, Tuple, List, Iterable
 import logging
 from keras.callbacks import EarlyStopping
 from keras.models import Model
 
-from britfoner import _UNSTRESSED_BRITFONE, _MODEL_OUT
-from britfoner.IO import decoded, dataset_from
+from sklearn.model_selection import train_test_split
+
+from britfoner import Index, _UNSTRESSED_BRITFONE, _MODEL_OUT, _MODEL_NAME, _NGRAM_NAME, _INTRA_OP_THREADS, \
+    _INTER_OP_THREADS, _GAP
+from britfoner.backends import Predictor
+from britfoner.IO import dataset_from, indexed_dataset_from, one_hot, configure_threads, \
+    artifact_to, artifact_from, config_from_name, training_hash, items_from, index_from, description_from, weights_to, \
+    weights_by_role, set_weights_by_role, seq2seq_from
+from britfoner.ngram import JointSequenceModel, joint_sequence_model_from, joint_sequence_model_to
+from britfoner.pruning import pruned_by_contribution
+from britfoner.recurrentshop import RNNCell
 from britfoner.g2p import train_g2p, most_likely_sequence, \
-    attention_g2p_model_from, WER_ModelCheckpoint
+    attention_g2p_model_from, parallel_g2p_model_from, WER_ModelCheckpoint, WER_Evaluator, Async_WER_ModelCheckpoint, OneHotSequence, \
+    BucketedSequence, ScheduledSampling, InferenceModel, soft_targets_from
 
 
-def main_seq_2_seq(data_src: str = _UNSTRESSED_BRITFONE, model_src: str = None) -> Tuple[Model, str]:
+def main_seq_2_seq(data_src: str = _UNSTRESSED_BRITFONE, model_src: str = None,
+                   eval_period: int = 1, eval_on_improvement: bool = False,
+                   asynchronous: bool = False, streaming: bool = False, workers: int = 1,
+                   sparse: bool = False, parallel: bool = False, bucketed: bool = False,
+                   teacher_force: bool = False, scheduled_sampling: int = None, target_wer: float = 17.,
+                   intra_op_threads: int = _INTRA_OP_THREADS,
+                   inter_op_threads: int = _INTER_OP_THREADS) -> Tuple[Model, str]:
     '''
     Creates, trains and saves a sequence to sequence model
 
     :param data_src: file containing data
     :param model_src: file containing previously trained model, to start the training from
+    :param eval_period: compute the validation WER every this many epochs, or never if None
+    :param eval_on_improvement: whether to compute the validation WER also when the validation loss improves
+    :param asynchronous: whether to compute the validation WER in a worker process, without blocking training
+    :param streaming: whether to one-hot encode the training data a batch at a time, rather than all at once
+    :param workers: number of processes preparing batches ahead, when streaming
+    :param sparse: whether to train a softmax model against integer targets with categorical cross-entropy
+    :param parallel: whether to train a non-autoregressive model, see :func:`parallel_g2p_model_from`, rather than
+                     an attention model
+    :param bucketed: whether to train a model masking padding on batches of words of about the same length, padded
+                     only to the longest, see :class:`BucketedSequence`; the data is streamed
+    :param teacher_force: whether to train a model feeding back its previous output with the ground truth instead,
+                          see :func:`attention_g2p_model_from`; it is evaluated and saved without the ground truth input
+    :param scheduled_sampling: the number of epochs over which the teacher forced model gets its own output more and
+                               more often instead of the ground truth, see :class:`ScheduledSampling`, if given
+    :param target_wer: the validation WER whose first epoch is logged, to compare how fast set-ups train
+    :param intra_op_threads: number of threads a single TensorFlow operation can use, 0 for TensorFlow's choice
+    :param inter_op_threads: number of TensorFlow operations that can run in parallel, 0 for TensorFlow's choice
     :return: the trained model together withe file name it has been saved to
     '''
-    (train_X, val_X, train_Y, val_Y), index = dataset_from(data_src, val_size=.01)
-
-    model = attention_g2p_model_from(index.x_dim, index.x_n, index.y_dim, index.y_n, dropout=.15)
+    if bucketed and parallel: raise ValueError('Only attention models can be trained on length buckets')
+    if teacher_force and parallel: raise ValueError('Only attention models can be teacher forced')
+    if scheduled_sampling and not teacher_force: raise ValueError('Scheduled sampling needs teacher forcing')
+
+    configure_threads(intra_op_threads, inter_op_threads)
+
+    if streaming or bucketed:
+        (train_X, val_X, train_Y, val_Y), index = indexed_dataset_from(data_src, val_size=.01)
+        train_set = (BucketedSequence if bucketed else OneHotSequence)(train_X, train_Y, index, sparse=sparse,
+                                                                       teacher_force=teacher_force)
+        val_X, val_Y = one_hot(val_X, index.x_dim), val_Y[..., None] if sparse else one_hot(val_Y, index.y_dim)
+    else:
+        (train_X, val_X, train_Y, val_Y), index = dataset_from(data_src, val_size=.01, sparse=sparse)
+        train_set = train_X, train_Y
+
+    val_set = val_X, val_Y
+    if teacher_force:
+        # teacher forced models also take the one-hot outputs as an input
+        truth = (lambda Y: one_hot(Y[..., 0], index.y_dim)) if sparse else (lambda Y: Y)
+        if not (streaming or bucketed): train_set = [train_X, truth(train_Y)], train_Y
+        val_set = [val_X, truth(val_Y)], val_Y
+
+    hidden_n, depth, dropout = 256, 4 if parallel else 1, .15
+    if parallel:
+        model = parallel_g2p_model_from(index.x_dim, index.x_n, index.y_dim, index.y_n,
+                                        hidden_n=hidden_n, dropout=dropout, depth=depth, sparse=sparse)
+    else:
+        model = attention_g2p_model_from(index.x_dim, None if bucketed else index.x_n, index.y_dim, index.y_n,
+                                         hidden_n=hidden_n, dropout=dropout, depth=depth, sparse=sparse,
+                                         mask_index=index.letter[_GAP] if bucketed else None,
+                                         teacher_force=teacher_force,
+                                         teacher_force_ratio=1. if scheduled_sampling else None)
+
+    config = dict(input_dim=index.x_dim, input_length=index.x_n,
+                  output_dim=index.y_dim, output_length=index.y_n,
+                  hidden_dim=hidden_n, depth=depth,
+                  output_activation='softmax' if sparse else None)
+    if parallel: config['family'] = 'parallel'
+    if bucketed: config['mask_index'] = index.letter[_GAP]
+    if teacher_force: config['readout'] = True
 
     if model_src is not None:
         model.load_weights(join(_MODEL_OUT, model_src))
 
-    on_epoch_end = epoch_publishing_fn_from(val_X, model, index)
-
-    name = model_name_from(model)
-    callbacks = [
-        EarlyStopping(patience=35),
-        WER_ModelCheckpoint(filepath=join(_MODEL_OUT, name),
-                            verbose=0,
-                            monitor='WER',
-                            save_best_only=True,
-                            callback=on_epoch_end)]
+    kinds = [kind for kind, on in (('parallel', parallel), ('masked', bucketed), ('readout', teacher_force)) if on]
+    if kinds:
+        name = f'{index.x_n}x{index.x_dim}x{hidden_n}x{index.y_n}x{index.y_dim}x{depth}.{".".join(kinds)}.h5'
+    else:
+        name = model_name_from(model)
+
+    if asynchronous:
+        callbacks = [Async_WER_ModelCheckpoint(join(_MODEL_OUT, name), config, val_X, index, patience=35)]
+    else:
+        evaluated = InferenceModel(model, config) if teacher_force else model
+        on_epoch_end = epoch_publishing_fn_from(val_X, evaluated, index,
+                                                eval_period=eval_period, eval_on_improvement=eval_on_improvement)
+        callbacks = [
+            EarlyStopping(patience=35),
+            WER_ModelCheckpoint(filepath=join(_MODEL_OUT, name),
+                                verbose=0,
+                                monitor='WER',
+                                save_best_only=True,
+                                callback=on_epoch_end)]
+    if scheduled_sampling: callbacks.insert(0, ScheduledSampling(scheduled_sampling))
 
     logging.info(f'starting training with a [{len(train_X)}/{len(val_X)}] training/validation split...')
-    model = train_g2p(model, (train_X, train_Y), (val_X, val_Y), epochs=5000, callbacks=callbacks)
-    logging.info('finished training.')
+    start = perf_counter()
+    model = train_g2p(model, train_set, val_set, epochs=5000, callbacks=callbacks, workers=workers)
+    logging.info(f'finished training in [{perf_counter() - start:.0f}]s, best WER at epoch [{callbacks[-1].best_epoch}].')
+
+    reached = [epoch for epoch, WER in sorted(callbacks[-1].wers.items()) if WER <= target_wer]
+    logging.info(f'WER [{target_wer:.2f}] first reached at epoch [{reached[0] if reached else "-"}].')
 
+    # teacher forced models are saved without the ground truth input
+    if teacher_force: model = seq2seq_from(config)
     model.load_weights(join(_MODEL_OUT, name))
 
+    params = dict(hidden_n=hidden_n, depth=depth, dropout=dropout, sparse=sparse, val_size=.01)
+    if parallel: params['parallel'] = True
+    if bucketed: params['bucketed'] = True
+    if teacher_force: params.update(teacher_force=True, scheduled_sampling=scheduled_sampling)
+    artifact_to(model, join(_MODEL_OUT, name), config, index, training_hash(data_src, params))
+
     end_publishing_fn_from(val_X, model, index)(None)
 
     return model, name
 
 
+def main_distilled(teacher_src: str = _MODEL_NAME, data_src: str = _UNSTRESSED_BRITFONE,
+                   hidden_ns: Iterable[int] = (64, 128), teacher_weight: float = .5, dropout: float = .15,
+                   patience: int = 35,
+                   intra_op_threads: int = _INTRA_OP_THREADS,
+                   inter_op_threads: int = _INTER_OP_THREADS) -> Tuple[List[Dict[str, Any]], str]:
+    '''
+    Distils a trained model, the teacher, into smaller students with a single layer rnn stack, trained against
+    targets blending the teacher's outputs on the training words with the dictionary's pronunciations of them.
+    Students learn with the teacher's loss: mean squared error for tanh outputs, and categorical cross-entropy,
+    over dense targets, for softmax outputs
+
+    Each student is saved as a self-describing artifact named after its architecture, see :func:`model_name_from`,
+    with a ``.student.h5`` extension, and the teacher and the students are compared by validation WER, number of
+    parameters and single word latency.
+    The best student, by WER, is also exported for the numpy backend; :func:`britfoner.api.configure` selects it
+
+    :param teacher_src: the teacher model file
+    :param data_src: file containing the data the teacher was trained on
+    :param hidden_ns: the numbers of hidden units of the students
+    :param teacher_weight: the weight in [0, 1] of the teacher's outputs in the targets
+    :param dropout: dropout rate of the students
+    :param patience: number of epochs without a WER improvement to stop training a student after
+    :param intra_op_threads: number of threads a single TensorFlow operation can use, 0 for TensorFlow's choice
+    :param inter_op_threads: number of TensorFlow operations that can run in parallel, 0 for TensorFlow's choice
+    :return: the report of the teacher followed by those of the students, together with the best student file name
+    '''
+    if not 0 <= teacher_weight <= 1: raise ValueError('Teacher weight must be in [0, 1]')
+
+    configure_threads(intra_op_threads, inter_op_threads)
+
+    teacher, description = artifact_from(teacher_src)
+    config = config_from_name(teacher_src) if description is None else description['config']
+    softmax = config.get('output_activation') == 'softmax'
+
+    # the same split as main_seq_2_seq, so the teacher hasn't seen the validation words either
+    (train_X, val_X, train_Y, val_Y), index = dataset_from(data_src, val_size=.01)
+
+    if (index.x_dim, index.x_n, index.y_dim, index.y_n) != \
+            (config['input_dim'], config['input_length'], config['output_dim'], config['output_length']):
+        raise ValueError('Teacher was not trained on the given data')
+
+    soft_Y = soft_targets_from(teacher.predict(train_X, batch_size=256), train_Y, teacher_weight)
+
+    reports = [_report_of(teacher_src, teacher, val_X, index)]
+
+    for hidden_n in hidden_ns:
+        student = attention_g2p_model_from(index.x_dim, index.x_n, index.y_dim, index.y_n,
+                                           hidden_n=hidden_n, dropout=dropout, depth=1, sparse=softmax,
+                                           loss='categorical_crossentropy' if softmax else None,
+                                           mask_index=config.get('mask_index'), readout=config.get('readout', False))
+        # never the name of the teacher, even when as large
+        name = f'{splitext(model_name_from(student))[0]}.student.h5'
+
+        callbacks = [
+            EarlyStopping(patience=patience),
+            WER_ModelCheckpoint(filepath=join(_MODEL_OUT, name),
+                                verbose=0,
+                                monitor='WER',
+                                save_best_only=True,
+                                callback=epoch_publishing_fn_from(val_X, student, index))]
+
+        logging.info(f'distilling [{teacher_src}] into [{name}]...')
+        train_g2p(student, (train_X, soft_Y), (val_X, val_Y), epochs=5000, callbacks=callbacks)
+
+        student.load_weights(join(_MODEL_OUT, name))
+
+        # students are attention models whatever the teacher's family
+        student_config = {key: value for key, value in config.items() if key != 'family'}
+        student_config.update(hidden_dim=hidden_n, depth=1)
+        params = dict(teacher=teacher_src, hidden_n=hidden_n, depth=1, dropout=dropout,
+                      teacher_weight=teacher_weight, val_size=.01)
+        artifact_to(student, join(_MODEL_OUT, name), student_config, index, training_hash(data_src, params))
+
+        reports.append(_report_of(name, student, val_X, index))
+
+    _log(reports)
+
+    best = min(reports[1:], key=lambda report: report['WER'])['name']
+    exported_weights_from(best, data_src)
+
+    return reports, best
+
+
+def main_pruned(model_src: str = _MODEL_NAME, data_src: str = _UNSTRESSED_BRITFONE,
+                hidden_ns: Iterable[int] = (192, 128, 64), epochs: int = 20, dropout: float = .15,
+                intra_op_threads: int = _INTRA_OP_THREADS,
+                inter_op_threads: int = _INTER_OP_THREADS) -> List[Dict[str, Any]]:
+    '''
+    Prunes the hidden units of a trained model with a single layer rnn stack that contribute the least to its
+    outputs, see :func:`britfoner.pruning.pruned_by_contribution`, into smaller dense models, and briefly fine-tunes
+    them to recover accuracy
+
+    Each pruned model is saved as a self-describing artifact named after its architecture with a ``.pruned.h5``
+    extension, which :func:`britfoner.IO.model_from` loads, and the WER against latency trade-off is logged
+
+    :param model_src: the model file
+    :param data_src: file containing the data the model was trained on
+    :param hidden_ns: the numbers of hidden units kept
+    :param epochs: number of fine-tuning epochs
+    :param dropout: dropout rate when fine-tuning
+    :param intra_op_threads: number of threads a single TensorFlow operation can use, 0 for TensorFlow's choice
+    :param inter_op_threads: number of TensorFlow operations that can run in parallel, 0 for TensorFlow's choice
+    :return: the report of the model followed by those of the pruned models, see :func:`main_distilled`
+    '''
+    configure_threads(intra_op_threads, inter_op_threads)
+
+    model, description = artifact_from(model_src)
+    config = config_from_name(model_src) if description is None else description['config']
+    if config.get('family') == 'parallel': raise ValueError('Only attention models can be pruned')
+    sparse = config.get('output_activation') == 'softmax'
+
+    # the same split as main_seq_2_seq, so the model hasn't seen the validation words
+    (train_X, val_X, train_Y, val_Y), index = dataset_from(data_src, val_size=.01, sparse=sparse)
+
+    weights = weights_by_role(model)
+    reports = [_report_of(model_src, model, val_X, index)]
+
+    for hidden_n in hidden_ns:
+        small_weights, small_config = pruned_by_contribution(weights, config, train_X, hidden_n)
+
+        small = attention_g2p_model_from(index.x_dim, index.x_n, index.y_dim, index.y_n,
+                                         hidden_n=hidden_n, dropout=dropout, depth=1, sparse=sparse,
+                                         mask_index=config.get('mask_index'), readout=config.get('readout', False))
+        set_weights_by_role(small, small_weights)
+
+        name = f'{splitext(model_name_from(small))[0]}.pruned.h5'
+
+        callbacks = [WER_ModelCheckpoint(filepath=join(_MODEL_OUT, name),
+                                         verbose=0,
+                                         monitor='WER',
+                                         save_best_only=True,
+                                         callback=epoch_publishing_fn_from(val_X, small, index))]
+
+        logging.info(f'fine-tuning [{model_src}] pruned to [{hidden_n}] units...')
+        train_g2p(small, (train_X, train_Y), (val_X, val_Y), epochs=epochs, callbacks=callbacks)
+
+        small.load_weights(join(_MODEL_OUT, name))
+
+        params = dict(pruned=model_src, hidden_n=hidden_n, epochs=epochs, dropout=dropout, val_size=.01)
+        artifact_to(small, join(_MODEL_OUT, name), small_config, index, training_hash(data_src, params))
+
+        reports.append(_report_of(name, small, val_X, index))
+
+    _log(reports)
+
+    return reports
+
+
+def _log(reports: List[Dict[str, Any]]):
+    for report in reports:
+        logging.info(f'[{report["name"]}]: WER [{report["WER"]:6.2f}], [{report["params"]:8d}] parameters, '
+                     f'[{report["latency_ms"]:6.2f}]ms per word')
+
+
+def _report_of(name: str, model: Model, val_X, index: Index, repeats: int = 100) -> Dict[str, Any]:
+    '''
+    Measures a model for :func:`main_distilled`
+
+    :param name: the model file name
+    :param model: the model
+    :param val_X: validation set input sequences
+    :param index: the dataset index
+    :param repeats: number of words predicted one at a time to time
+    :return: the validation WER, the number of parameters and the median single word latency in milliseconds
+    '''
+    evaluator = WER_Evaluator(model, val_X, index)
+
+    predictor = Predictor(model, index.letter, index.inv_phone, index.x_n - 2, batch_sizes=(1,))
+    words = [evaluator.words[idx % len(evaluator.words)] for idx in range(repeats)]
+
+    times = []
+    for word in words:
+        start = perf_counter()
+        predictor.predict([word])
+        times.append(perf_counter() - start)
+
+    return dict(name=name, WER=evaluator.wer(model.predict(val_X)), params=model.count_params(),
+                latency_ms=1000 * median(times))
+
+
+def main_compared(model_srcs: Iterable[str] = (_MODEL_NAME,), data_src: str = _UNSTRESSED_BRITFONE,
+                  intra_op_threads: int = _INTRA_OP_THREADS,
+                  inter_op_threads: int = _INTER_OP_THREADS) -> List[Dict[str, Any]]:
+    '''
+    Compares trained models of any family, such as an attention model and a non-autoregressive one, by
+    validation WER, number of parameters and single word latency
+
+    :param model_srcs: the model files
+    :param data_src: file containing the data the models were trained on
+    :param intra_op_threads: number of threads a single TensorFlow operation can use, 0 for TensorFlow's choice
+    :param inter_op_threads: number of TensorFlow operations that can run in parallel, 0 for TensorFlow's choice
+    :return: the report of each model, see :func:`main_distilled`
+    '''
+    configure_threads(intra_op_threads, inter_op_threads)
+
+    # the same split as main_seq_2_seq, so the models haven't seen the validation words
+    (_, val_X, _, _), index = dataset_from(data_src, val_size=.01)
+
+    reports = [_report_of(model_src, artifact_from(model_src)[0], val_X, index) for model_src in model_srcs]
+    _log(reports)
+
+    return reports
+
+
+def main_ngram(data_src: str = _UNSTRESSED_BRITFONE, order: int = 4, dst: str = _NGRAM_NAME) \
+        -> Tuple[JointSequenceModel, Dict[str, Any]]:
+    '''
+    Trains and saves a joint sequence n-gram model, see :mod:`britfoner.ngram`, on the same training split as
+    :func:`main_seq_2_seq`, and measures it on the validation split, to compare with the neural models
+
+    :param data_src: file containing data
+    :param order: the order of the n-grams
+    :param dst: the file to save to, relative to the package directory unless absolute
+    :return: the model, with its validation WER and median single word latency in milliseconds
+    '''
+    words, sounds = items_from(data_src)
+    train_words, val_words, train_sounds, _ = train_test_split(list(words), list(sounds),
+                                                               test_size=.01, random_state=42)
+
+    start = perf_counter()
+    model = joint_sequence_model_from(train_words, train_sounds, order)
+    logging.info(f'trained a [{order}]-gram model on [{len(train_words)}] words in [{perf_counter() - start:.0f}]s')
+
+    references = index_from(words, sounds).word_to_sounds
+
+    times, errors = [], 0
+    for word in val_words:
+        start = perf_counter()
+        sound = model.pronounce([word])[0]
+        times.append(perf_counter() - start)
+
+        errors += sound not in references[word]
+
+    joint_sequence_model_to(model, join(_MODEL_OUT, dst))
+
+    report = dict(name=dst, WER=100 * errors / len(val_words), latency_ms=1000 * median(times))
+    logging.info(f'[{dst}]: WER [{report["WER"]:6.2f}], [{report["latency_ms"]:6.2f}]ms per word')
+
+    return model, report
+
+
+def described_artifact_from(model_src: str, data_src: str = _UNSTRESSED_BRITFONE, dst: str = None) -> str:
+    '''
+    Saves a model file that is described only by its name as a self-describing artifact, see :func:`artifact_to`.
+    The training hyperparameters are unknown, so only the data is hashed
+
+    :param model_src: the model file
+    :param data_src: file containing the data the model was trained on
+    :param dst: the file to save to, by default the model file itself
+    :return: the file the artifact was saved to
+    '''
+    model, description = artifact_from(model_src)
+
+    if description is not None: raise ValueError('Model file is already self-describing')
+
+    index = index_from(*items_from(data_src))
+    dst = join(_MODEL_OUT, dst or model_src)
+
+    artifact_to(model, dst, config_from_name(model_src), index, training_hash(data_src, {}))
+
+    return dst
+
+
+def exported_weights_from(model_src: str, data_src: str = _UNSTRESSED_BRITFONE, dst: str = None) -> str:
+    '''
+    Exports the weights of a model file to a flat file that inference backends memory-map,
+    see :func:`britfoner.IO.weights_to` and :mod:`britfoner.backends`
+
+    :param model_src: the model file
+    :param data_src: file containing the data the model was trained on, used only if the model file isn't self-describing
+    :param dst: the file to save to, by default the model file name with a ``.weights`` extension
+    :return: the file the weights were saved to
+    '''
+    model, description = artifact_from(model_src)
+
+    if description is None:
+        index = index_from(*items_from(data_src))
+        description = description_from(config_from_name(model_src), index, training_hash(data_src, {}))
+
+    dst = join(_MODEL_OUT, dst or splitext(model_src)[0] + '.weights')
+
+    weights_to(model, dst, description)
+
+    return dst
+
+
 def model_name_from(model: Any) -> str:
     '''
     Creates file name to save model to
@@ -66,10 +446,13 @@ def model_name_from(model: Any) -> str:
 
     input, hidden, output = model.layers[0].output_shape, model.layers[1].output_shape, model.layers[k - 1].output_shape
 
-    return f'{input[1]}x{input[2]}x{hidden[2]}x{output[1]}x{output[2]}x{int((k-3)/2)}.h5'
+    # the rnn stacks are nested in the encoder/decoder layers, so depth is the number of cells in the decoder
+    depth = sum(isinstance(cell, RNNCell) for cell in model.layers[k - 1].cells)
+
+    return f'{input[1]}x{input[2]}x{hidden[2]}x{output[1]}x{output[2]}x{depth}.h5'
 
 
-def epoch_publishing_fn_from(val_X, model, index, period=10):
+def epoch_publishing_fn_from(val_X, model, index, period=10, eval_period=1, eval_on_improvement=False):
     '''
     Creates a function to publish state of model during training
 
@@ -77,27 +460,21 @@ def epoch_publishing_fn_from(val_X, model, index, period=10):
     :param model: the training model
     :param index: the dataset index
     :param period: the frequency to publish training data at
+    :param eval_period: the frequency to compute the WER at, or None to never compute it periodically
+    :param eval_on_improvement: whether to compute the WER also when the validation loss improves
     :return: the function
     '''
-    fraction = 100 / len(val_X)
+    evaluator = WER_Evaluator(model, val_X, index, period=eval_period, on_improvement=eval_on_improvement)
 
     def on_epoch_end(epoch: int, logs: Dict[str, Any]):
 
-        errors = 0.
-        for x, y_hat in zip(val_X, model.predict(val_X)):
-            sound_hat = most_likely_sequence(y_hat, index.inv_phone)
-
-            word = decoded(x, index.inv_letter, reverse=True)
-
-            sounds = index.word_to_sounds[word]
-            error = +(sound_hat not in sounds)
-
-            errors += error
+        WER = evaluator(epoch, logs)
 
         if epoch % period == 0:
-            logging.info(f'[{epoch:04d}] WER [{fraction * errors:6.2f}], val. loss [{logs["val_loss"]:1.5f}]')
+            wer = '     -' if WER is None else f'{WER:6.2f}'
+            logging.info(f'[{epoch:04d}] WER [{wer}], val. loss [{logs["val_loss"]:1.5f}]')
 
-        return fraction * errors
+        return WER
 
     return on_epoch_end
 
@@ -111,27 +488,19 @@ def end_publishing_fn_from(val_X, model, index):
     :param index: the dataset index
     :return: the function
     '''
-    fraction = 100 / len(val_X)
+    evaluator = WER_Evaluator(model, val_X, index)
 
     def on_train_end(logs: Dict[str, Any]):
 
         logging.info('errors:')
 
-        errors = 0.
-        for x, y_hat in zip(val_X, model.predict(val_X)):
-
-            sound_hat = most_likely_sequence(y_hat, index.inv_phone)
-
-            word = decoded(x, index.inv_letter, reverse=True)
-
-            sounds = index.word_to_sounds[word]
-            error = +(sound_hat not in sounds)
-
-            errors += error
+        Y_hat = model.predict(val_X)
+        errors = evaluator.errors(Y_hat)
 
-            if error:  logging.info(f'\t{"".join(word)}\t{" ".join(sound_hat)}')
+        for word, y_hat, error in zip(evaluator.words, Y_hat, errors):
+            if error: logging.info(f'\t{"".join(word)}\t{" ".join(most_likely_sequence(y_hat, index.inv_phone))}')
 
-        logging.info(f'WER [{fraction*errors:0.2f}]')
+        logging.info(f'WER [{100 * errors.mean():0.2f}]')
 
     return on_train_end
 
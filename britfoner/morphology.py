@@ -0,0 +1,137 @@
+'''
+
+Pronunciation of words not in the dictionary from the pronunciations of their parts
+
+'''
+from typing import Dict, Set, Tuple, Optional
+
+from britfoner import Seq, _VOWELS
+from britfoner.IO import Lexicon
+
+_SIBILANTS = {'s', 'z', 'ʃ', 'ʒ', 'tʃ', 'dʒ'}
+_VOICELESS = {'p', 't', 'k', 'f', 'θ', 's', 'ʃ', 'tʃ'}
+
+# the sounds of the suffixes that don't depend on the stem
+_SUFFIX_SOUNDS = {'ING': ('ɪ', 'ŋ'), 'ER': ('ə',), 'EST': ('ɪ', 's', 't'), 'NESS': ('n', 'ɪ', 's'), 'LY': ('l', 'i'),
+                  'FUL': ('f', 'ə', 'l'), 'LESS': ('l', 'ɪ', 's'), 'MENT': ('m', 'ə', 'n', 't')}
+
+# (word ending, stem ending it replaces, suffix), tried in order. Shorter endings come first where a longer one
+# would wrongly take a letter of the stem, as in NOTES, which is NOTE + S rather than NOT + ES
+_RULES = [("'S", '', 'S'), ('IES', 'Y', 'S'), ('S', '', 'S'), ('ES', '', 'S'),
+          ('IED', 'Y', 'D'), ('D', '', 'D'), ('ED', '', 'D'),
+          ('ING', '', 'ING'), ('ING', 'E', 'ING'),
+          ('IER', 'Y', 'ER'), ('R', '', 'ER'), ('ER', '', 'ER'),
+          ('IEST', 'Y', 'EST'), ('ST', '', 'EST'), ('EST', '', 'EST'),
+          ('INESS', 'Y', 'NESS'), ('NESS', '', 'NESS'),
+          ('ILY', 'Y', 'LY'), ('ALLY', '', 'LY'), ('LY', '', 'LY'),
+          ('FUL', '', 'FUL'), ('LESS', '', 'LESS'), ('MENT', '', 'MENT')]
+
+# suffixes after which the final consonant of a stem may have been doubled, as in STOPPED
+_DOUBLING = {'D', 'ING', 'ER', 'EST'}
+
+
+class Decomposer:
+    '''
+    Pronounces words that are not in the dictionary by decomposing them into dictionary words: either a stem
+    and a known suffix, as in THRONE + S or HAPPY + NESS, or a compound of words, as in BLACK + BOARD. Parts can
+    themselves be decomposed, as in SUN + FLOWER + S
+
+    Suffixes are pronounced according to the stem they follow: plurals as s, z or ɪz and past tenses as t, d or ɪd
+    depending on the stem's last sound, a stem's final i becomes iː or ɪ before suffixes other than S when its Y is
+    spelled I, a sound shared by the end of the stem and the start of the suffix is said once, and a stem spelled
+    with a final R gets a linking ɹ before a suffix starting with a vowel
+    '''
+
+    def __init__(self, lexicon: Lexicon, min_stem: int = 3, min_part: int = 4, max_parts: int = 3, max_sounds: int = 4):
+        '''
+        :param lexicon: the dictionary
+        :param min_stem: the least number of letters of a stem
+        :param min_part: the least number of letters of a compound part, larger than ``min_stem`` as short words
+                         often spell parts of longer words without being their parts, like CON in CONVICTION
+        :param max_parts: the largest number of parts a word is decomposed into
+        :param max_sounds: the largest number of pronunciations given for a word
+        '''
+        self.lexicon = lexicon
+        self.min_stem, self.min_part, self.max_parts, self.max_sounds = min_stem, min_part, max_parts, max_sounds
+
+    def pronounce(self, word: Seq) -> Set[Seq]:
+        '''
+        Pronounces a word from its parts
+
+        :param word: the word
+        :return: the pronunciations of the first decomposition found, or no pronunciations if there is none
+        '''
+        return self._sounds(tuple(word), self.max_parts, {}) or set()
+
+    def _sounds(self, word: Seq, parts: int, memo: Dict[Tuple[Seq, int], Optional[Set[Seq]]]) -> Optional[Set[Seq]]:
+        '''
+        :param word: the word or the part of a word
+        :param parts: the largest number of parts it can be decomposed into
+        :param memo: the results for the parts already tried
+        :return: the word's pronunciations, or None if it can't be decomposed into at most ``parts`` parts
+        '''
+        sounds = self.lexicon.get(word)
+
+        if sounds or parts < 2: return sounds
+
+        if (word, parts) in memo: return memo[(word, parts)]
+        memo[(word, parts)] = None
+
+        for ending, stem_ending, suffix in _RULES:
+            if len(word) - len(ending) < self.min_stem or word[-len(ending):] != tuple(ending): continue
+
+            base = word[:-len(ending)]
+            stems = [base + tuple(stem_ending)]
+            if suffix in _DOUBLING and not stem_ending and base[-1] == base[-2] and base[-1] not in 'AEIOU':
+                stems.append(base[:-1])
+
+            for stem in stems:
+                stem_sounds = self._sounds(stem, parts - 1, memo)
+
+                if stem_sounds:
+                    sounds = {_suffixed(sound, stem, suffix, bool(stem_ending)) for sound in sorted(stem_sounds)}
+                    memo[(word, parts)] = set(sorted(sounds)[:self.max_sounds])
+                    return memo[(word, parts)]
+
+        # compounds, trying the longest first part first
+        for length in reversed(self.lexicon.prefixes_of(word[:-self.min_part])):
+            if length < self.min_part: break
+
+            rest_sounds = self._sounds(word[length:], parts - 1, memo)
+
+            if rest_sounds:
+                first_sounds = self.lexicon.get(word[:length])
+                sounds = [first + rest for first in sorted(first_sounds) for rest in sorted(rest_sounds)]
+                memo[(word, parts)] = set(sounds[:self.max_sounds])
+                return memo[(word, parts)]
+
+        return None
+
+
+def _suffixed(sound: Seq, stem: Seq, suffix: str, respelled: bool) -> Seq:
+    '''
+    Joins the pronunciations of a stem and a suffix
+
+    :param sound: the pronunciation of the stem
+    :param stem: the spelling of the stem
+    :param suffix: the suffix
+    :param respelled: whether the stem's spelling changed before the suffix, like the Y of HAPPY in HAPPINESS
+    :return: the pronunciation of the suffixed stem
+    '''
+    last = sound[-1]
+
+    if suffix == 'S':
+        suffix_sound = ('ɪ', 'z') if last in _SIBILANTS else ('s',) if last in _VOICELESS else ('z',)
+    elif suffix == 'D':
+        suffix_sound = ('ɪ', 'd') if last in {'t', 'd'} else ('t',) if last in _VOICELESS else ('d',)
+    else:
+        suffix_sound = _SUFFIX_SOUNDS[suffix]
+
+    if respelled and last == 'i' and suffix != 'S':
+        sound = sound[:-1] + ('iː' if suffix == 'D' else 'ɪ',)
+    elif last == suffix_sound[0]:
+        suffix_sound = suffix_sound[1:]
+    elif last in _VOWELS and suffix_sound[0] in _VOWELS and stem[-1] in {'R', 'E'} and 'R' in stem[-2:]:
+        sound = sound + ('ɹ',)
+
+    return sound + suffix_sound
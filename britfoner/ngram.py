@@ -0,0 +1,378 @@
+'''
+
+Joint sequence n-gram model of pronunciation, which needs nothing but NumPy
+
+'''
+from collections import Counter, defaultdict
+from math import log
+from os.path import join
+from typing import Dict, Iterable, List, Tuple, Any
+
+import numpy as np
+from numpy import ndarray
+
+from britfoner import Seq, _MODEL_OUT
+from britfoner.IO import arrays_to, arrays_from
+
+# a graphone, the unit of the model: a chunk of letters with the chunk of phones it sounds as
+Graphone = Tuple[Seq, Seq]
+
+# the shapes of the graphones, as numbers of letters and phones
+_SHAPES = [(letters, phones) for letters in (1, 2) for phones in (0, 1, 2)]
+
+# the graphone marking the start and end of words
+_BOUNDARY = 0
+
+# the log probability of skipping a letter that starts no graphone, lower than that of any graphone sequence
+_SKIP = -1e3
+
+
+class JointSequenceModel:
+    '''
+    Predicts pronunciations as the most likely sequences of graphones spelling words, scored by an n-gram model
+    over graphones, interpolated with Kneser-Ney smoothing. Graphones pair 1 or 2 letters with 0 to 2 phones
+
+    The n-grams of each order are kept in sorted arrays of integer keys, with their log probabilities, and the
+    histories with the log weights of backing off from them to a lower order. Words are decoded with a beam search
+    over how their letters split into graphones
+    '''
+
+    def __init__(self, arrays: Dict[str, ndarray], graphones: List[Graphone], order: int):
+        '''
+        :param arrays: the n-gram arrays, see :func:`joint_sequence_model_from`
+        :param graphones: the graphones, by id, the first being the word boundary
+        :param order: the order of the n-grams
+        '''
+        self.arrays, self.graphones, self.order = arrays, graphones, order
+        self.base = len(graphones)
+
+        self.by_letters = defaultdict(list)
+        for unit, (letters, _) in enumerate(graphones[1:], 1):
+            self.by_letters[letters].append(unit)
+        self.by_letters = {letters: np.array(units, dtype=np.int64) for letters, units in self.by_letters.items()}
+
+    def pronounce(self, words: List[Seq], beam: int = 16) -> List[Seq]:
+        '''
+        Predicts the pronunciation of each word spelled by its most likely graphone sequence
+
+        :param words: the words, as tuples of upper case letters
+        :param beam: the number of partial pronunciations kept at each letter
+        :return: the pronunciations
+        '''
+        return [self._pronounced(word, beam)[0] for word in words]
+
+    def pronounce_with_confidence(self, words: List[Seq], beam: int = 16) -> List[Tuple[Seq, float]]:
+        '''
+        Predicts the pronunciation of each word, as :meth:`pronounce`, with the confidence in it: the probability,
+        among the graphone sequences left in the beam, of those spelling it
+
+        :param words: the words, as tuples of upper case letters
+        :param beam: the number of partial pronunciations kept at each letter
+        :return: the pronunciations with their confidences
+        '''
+        return [self._pronounced(word, beam) for word in words]
+
+    def log_probabilities(self, histories: ndarray, units: ndarray) -> ndarray:
+        '''
+        Gives the log probabilities of graphones following histories of graphones, backing off to shorter histories
+        for the n-grams not seen in training
+
+        :param histories: the previous graphone ids, one row of as many as the order less 1 per history
+        :param units: the graphone ids
+        :return: the log probabilities, one row per history
+        '''
+        logp = np.zeros((len(histories), len(units)))
+        pending = np.ones(logp.shape, dtype=bool)
+
+        for k in range(self.order, 0, -1):
+            contexts = np.zeros(len(histories), dtype=np.int64)
+            for column in range(self.order - k, self.order - 1):
+                contexts = contexts * self.base + histories[:, column]
+
+            found, where = self._find(f'keys/{k}', (contexts[:, None] * self.base + units[None, :])[pending])
+
+            rows, columns = np.nonzero(pending)
+            logp[rows[found], columns[found]] += self.arrays[f'logp/{k}'][where[found]]
+            pending[rows[found], columns[found]] = False
+
+            if not pending.any() or k == 1: break
+
+            found, where = self._find(f'history_keys/{k}', contexts)
+            logp += np.where(found, self.arrays[f'backoff/{k}'][where], 0.)[:, None] * pending
+
+        return logp
+
+    def _pronounced(self, word: Seq, beam: int) -> Tuple[Seq, float]:
+        start = (_BOUNDARY,) * (self.order - 1)
+
+        # the best partial pronunciations by number of letters spelled, as history -> (log probability, phones)
+        hypotheses = [dict() for _ in range(len(word) + 1)]
+        hypotheses[0][start] = 0., ()
+
+        for i in range(len(word)):
+            if not hypotheses[i]: continue
+
+            best = sorted(hypotheses[i].items(), key=lambda item: -item[1][0])[:beam]
+            histories = np.array([history for history, _ in best], dtype=np.int64).reshape(len(best), -1)
+            expanded = False
+
+            for letters_n in (1, 2):
+                units = self.by_letters.get(tuple(word[i:i + letters_n]))
+                if units is None or i + letters_n > len(word): continue
+
+                scores = self.log_probabilities(histories, units).tolist()
+                expanded = True
+
+                for (history, (score, phones)), unit_scores in zip(best, scores):
+                    for unit, unit_score in zip(units.tolist(), unit_scores):
+                        next_history = (history + (unit,))[1:]
+                        current = hypotheses[i + letters_n].get(next_history)
+
+                        if current is None or score + unit_score > current[0]:
+                            hypotheses[i + letters_n][next_history] = \
+                                score + unit_score, phones + self.graphones[unit][1]
+
+            # letters that start no graphone are skipped, as a last resort
+            if not expanded:
+                for history, (score, phones) in best:
+                    current = hypotheses[i + 1].get(history)
+
+                    if current is None or score + _SKIP > current[0]:
+                        hypotheses[i + 1][history] = score + _SKIP, phones
+
+        if not hypotheses[-1]: return (), 0.
+
+        ends = list(hypotheses[-1].items())
+        histories = np.array([history for history, _ in ends], dtype=np.int64).reshape(len(ends), -1)
+        totals = self.log_probabilities(histories, np.array([_BOUNDARY]))[:, 0] + [score for _, (score, _) in ends]
+
+        # the pronunciation of the best graphone sequence, whose confidence sums over all the graphone sequences
+        # spelling it, as different ones can
+        phones = ends[int(totals.argmax())][1][1]
+
+        probabilities = np.exp(totals - totals.max())
+        spelled = sum(probability for (_, (_, end_phones)), probability in zip(ends, probabilities.tolist())
+                      if end_phones == phones)
+
+        return phones, spelled / probabilities.sum()
+
+    def _key(self, units: Iterable[int]) -> int:
+        key = 0
+        for unit in units: key = key * self.base + unit
+
+        return key
+
+    def _find(self, name: str, keys: ndarray) -> Tuple[ndarray, ndarray]:
+        '''
+        :param name: the name of a sorted key array
+        :param keys: the keys to look up
+        :return: whether each key is found, and where
+        '''
+        array = self.arrays[name]
+        where = np.minimum(np.searchsorted(array, keys), len(array) - 1)
+
+        return array[where] == keys, where
+
+
+def joint_sequence_model_from(words: Iterable[Seq], sounds: Iterable[Seq], order: int = 3, iterations: int = 8) \
+        -> JointSequenceModel:
+    '''
+    Trains a joint sequence model: words are aligned with their pronunciations into graphones, by expectation
+    maximisation of the graphone probabilities, and an n-gram model is estimated over the aligned graphones
+
+    :param words: the words, as from :func:`britfoner.IO.items_from`
+    :param sounds: their pronunciations
+    :param order: the order of the n-grams
+    :param iterations: the number of expectation maximisation iterations
+    :return: the model
+    '''
+    pairs = list(zip(words, sounds))
+
+    probabilities = defaultdict(lambda: 1.)
+    for _ in range(iterations):
+        counts = Counter()
+        for word, sound in pairs:
+            _expect(word, sound, probabilities, counts)
+
+        total = sum(counts.values())
+        probabilities = defaultdict(float, {graphone: count / total for graphone, count in counts.items()})
+
+    graphones, ids = [((), ())], {}
+    sequences = []
+    for word, sound in pairs:
+        sequence = []
+        for graphone in _aligned(word, sound, probabilities):
+            if graphone not in ids:
+                ids[graphone] = len(graphones)
+                graphones.append(graphone)
+
+            sequence.append(ids[graphone])
+
+        sequences.append(sequence)
+
+    return JointSequenceModel(_ngram_arrays_from(sequences, len(graphones), order), graphones, order)
+
+
+def joint_sequence_model_to(model: JointSequenceModel, dst: str):
+    '''
+    Saves a joint sequence model to a file that :func:`compiled_joint_sequence_model_from` memory-maps
+
+    :param model: the model
+    :param dst: the file to save to
+    '''
+    graphones = [[list(letters), list(phones)] for letters, phones in model.graphones]
+
+    arrays_to(dst, model.arrays, dict(graphones=graphones, order=model.order))
+
+
+def compiled_joint_sequence_model_from(src: str) -> JointSequenceModel:
+    '''
+    Maps a joint sequence model saved by :func:`joint_sequence_model_to` into memory
+
+    :param src: the model file, relative to the package directory unless absolute
+    :return: the model
+    '''
+    arrays, meta = arrays_from(join(_MODEL_OUT, src))
+
+    return JointSequenceModel(arrays, [(tuple(letters), tuple(phones)) for letters, phones in meta['graphones']],
+                              meta['order'])
+
+
+def _chunks(word: Seq, sound: Seq, i: int, j: int):
+    '''
+    Gives the graphones ending after the first ``i`` letters and ``j`` phones of a word and its pronunciation
+
+    :return: the graphones, with the letters and phones before them
+    '''
+    for letters_n, phones_n in _SHAPES:
+        if letters_n <= i and phones_n <= j:
+            yield (word[i - letters_n:i], sound[j - phones_n:j]), i - letters_n, j - phones_n
+
+
+def _expect(word: Seq, sound: Seq, probabilities: Dict[Graphone, float], counts: Counter):
+    '''
+    Adds the expected number of times each graphone is used to spell a word, over all its alignments with its
+    pronunciation, computed with the forward-backward algorithm
+
+    :param word: the word
+    :param sound: its pronunciation
+    :param probabilities: the graphone probabilities
+    :param counts: the graphone counts, updated
+    '''
+    n, m = len(word), len(sound)
+
+    forward = [[0.] * (m + 1) for _ in range(n + 1)]
+    forward[0][0] = 1.
+    for i in range(1, n + 1):
+        for j in range(m + 1):
+            forward[i][j] = sum(forward[i0][j0] * probabilities[graphone]
+                                for graphone, i0, j0 in _chunks(word, sound, i, j))
+
+    total = forward[n][m]
+    if total == 0: return
+
+    backward = [[0.] * (m + 1) for _ in range(n + 1)]
+    backward[n][m] = 1.
+    for i in range(n, 0, -1):
+        for j in range(m, -1, -1):
+            if backward[i][j] == 0: continue
+
+            for graphone, i0, j0 in _chunks(word, sound, i, j):
+                p = probabilities[graphone]
+                backward[i0][j0] += p * backward[i][j]
+                counts[graphone] += forward[i0][j0] * p * backward[i][j] / total
+
+
+def _aligned(word: Seq, sound: Seq, probabilities: Dict[Graphone, float]) -> List[Graphone]:
+    '''
+    Aligns a word with its pronunciation into its most likely sequence of graphones
+
+    :param word: the word
+    :param sound: its pronunciation
+    :param probabilities: the graphone probabilities
+    :return: the graphones
+    '''
+    n, m = len(word), len(sound)
+
+    best = [[(-np.inf, None)] * (m + 1) for _ in range(n + 1)]
+    best[0][0] = 0., None
+    for i in range(1, n + 1):
+        for j in range(m + 1):
+            for graphone, i0, j0 in _chunks(word, sound, i, j):
+                p = probabilities.get(graphone, 0.)
+                if p > 0 and best[i0][j0][0] + log(p) > best[i][j][0]:
+                    best[i][j] = best[i0][j0][0] + log(p), (graphone, i0, j0)
+
+    graphones, i, j = [], n, m
+    while i > 0:
+        if best[i][j][1] is None: raise ValueError(f'Cannot align {"".join(word)} with {" ".join(sound)}')
+
+        graphone, i, j = best[i][j][1]
+        graphones.append(graphone)
+
+    return graphones[::-1]
+
+
+def _ngram_arrays_from(sequences: List[List[int]], base: int, order: int) -> Dict[str, ndarray]:
+    '''
+    Estimates n-gram log probabilities with interpolated Kneser-Ney smoothing, as arrays
+
+    :param sequences: the graphone id sequences
+    :param base: the number of graphones
+    :param order: the order of the n-grams
+    :return: for each order k, the sorted keys of the n-grams and their log probabilities, as ``keys/k`` and
+             ``logp/k``, and the sorted keys of the histories with the log weights of backing off from them, as
+             ``history_keys/k`` and ``backoff/k``
+    '''
+    counts = [Counter() for _ in range(order + 1)]
+    for sequence in sequences:
+        padded = [_BOUNDARY] * (order - 1) + sequence + [_BOUNDARY]
+        for end in range(order - 1, len(padded)):
+            counts[order][tuple(padded[end - order + 1:end + 1])] += 1
+
+    # lower orders count the different graphones preceding them, but for those starting words, which have none
+    for k in range(order - 1, 0, -1):
+        for ngram, count in counts[k + 1].items():
+            if k > 1 and ngram[1] == _BOUNDARY:
+                counts[k][ngram[1:]] += count
+            else:
+                counts[k][ngram[1:]] += 1
+
+    def key_of(units):
+        key = 0
+        for unit in units: key = key * base + unit
+
+        return key
+
+    arrays, probability = {}, {}
+    for k in range(1, order + 1):
+        count_of_counts = Counter(count for count in counts[k].values() if count <= 2)
+        discount = count_of_counts[1] / (count_of_counts[1] + 2 * count_of_counts[2]) if count_of_counts[2] else .5
+
+        totals, types = Counter(), Counter()
+        for ngram, count in counts[k].items():
+            totals[ngram[:-1]] += count
+            types[ngram[:-1]] += 1
+
+        backoff = {history: discount * types[history] / totals[history] for history in totals}
+
+        lower = probability
+        probability = {}
+        for ngram, count in counts[k].items():
+            # every lower order n-gram is the end of a higher order one, so it is always found
+            lower_p = lower[ngram[1:]] if k > 1 else 1. / base
+
+            probability[ngram] = max(count - discount, 0) / totals[ngram[:-1]] + backoff[ngram[:-1]] * lower_p
+
+        keys = np.array([key_of(ngram) for ngram in probability], dtype=np.int64)
+        order_by = np.argsort(keys)
+        arrays[f'keys/{k}'] = keys[order_by]
+        arrays[f'logp/{k}'] = np.log(np.array(list(probability.values())))[order_by].astype(np.float32)
+
+        history_keys = np.array([key_of(history) for history in backoff], dtype=np.int64)
+        order_by = np.argsort(history_keys)
+        arrays[f'history_keys/{k}'] = history_keys[order_by]
+        arrays[f'backoff/{k}'] = np.log(np.array(list(backoff.values())))[order_by].astype(np.float32)
+
+    return arrays
+
@@ -0,0 +1,127 @@
+'''
+
+Search of the dictionary by how words sound
+
+'''
+from typing import List, Tuple
+
+import numpy as np
+
+from britfoner import Seq
+from britfoner.IO import Lexicon
+
+
+class PhoneGrams:
+    '''
+    Finds the dictionary words whose pronunciations are within a few phone edits of a pronunciation, with an
+    index from each pair of consecutive phones (bigram) to the pronunciations containing it. Pronunciations are
+    padded at both ends, so one of ``n`` phones has ``n + 1`` bigrams and, since an edit changes at most two of
+    them, any pronunciation ``d`` edits away shares at least ``n + 1 - 2d`` of them. Only the pronunciations
+    sharing that many bigrams with a query, and whose length is within ``d`` of it, have their distance computed,
+    all at once
+
+    Distances are Levenshtein distances over phones: the number of phone insertions, deletions and substitutions
+    '''
+
+    def __init__(self, lexicon: Lexicon):
+        '''
+        :param lexicon: the dictionary
+        '''
+        self.lexicon = lexicon
+        arrays = lexicon.arrays
+
+        phones, phone_start = arrays['phones'].astype(np.int32), arrays['phone_start']
+        self.lengths = np.diff(phone_start)
+        self.pad = len(lexicon.inv_phone)
+
+        # each pronunciation padded at both ends, flattened
+        n_sounds = len(self.lengths)
+        padded = np.full(len(phones) + 2 * n_sounds, self.pad, dtype=np.int32)
+        padded[np.arange(len(phones)) + 1 + 2 * np.repeat(np.arange(n_sounds), self.lengths)] = phones
+
+        # the bigrams of each pronunciation are those starting anywhere but at its end pad
+        starts = np.ones(len(padded), dtype=bool)
+        starts[phone_start[1:] + 2 * np.arange(1, n_sounds + 1) - 1] = False
+        grams = self._codes(padded[:-1][starts[:-1]], padded[1:][starts[:-1]])
+        owners = np.repeat(np.arange(n_sounds, dtype=np.int32), self.lengths + 1)
+
+        order = np.argsort(grams, kind='stable')
+        self.grams, gram_start = np.unique(grams[order], return_index=True)
+        self.gram_start = np.append(gram_start, len(order)).astype(np.int32)
+        self.postings = owners[order]
+
+    def nearest(self, sound: Seq, k: int = 10, max_edits: int = 2) -> List[Tuple[Seq, int]]:
+        '''
+        Finds the words pronounced most like a pronunciation
+
+        :param sound: the pronunciation, as given by :func:`britfoner.api.pronounce`
+        :param k: the largest number of words given
+        :param max_edits: the largest number of phone edits between the pronunciation and a word's
+        :return: the words with the number of edits away they are, closest first and then alphabetically
+        '''
+        query = [self.lexicon.phone.get(phone, self.pad + 1) for phone in sound]
+        padded = np.array([self.pad] + query + [self.pad], dtype=np.int32)
+
+        near_length = np.abs(self.lengths - len(query)) <= max_edits
+        least_shared = len(query) + 1 - 2 * max_edits
+
+        if least_shared <= 0:
+            candidates = np.flatnonzero(near_length)
+        else:
+            codes = np.unique(self._codes(padded[:-1], padded[1:]))
+            found = np.searchsorted(self.grams, codes)
+            found = found[(found < len(self.grams)) & (self.grams[np.minimum(found, len(self.grams) - 1)] == codes)]
+
+            postings = [self.postings[self.gram_start[idx]:self.gram_start[idx + 1]] for idx in found]
+            if not postings: return []
+
+            candidates, shared = np.unique(np.concatenate(postings), return_counts=True)
+            candidates = candidates[shared >= least_shared]
+            candidates = candidates[near_length[candidates]]
+
+        if not len(candidates): return []
+
+        distances = self._distances(query, candidates)
+        near = distances <= max_edits
+        words = np.searchsorted(self.lexicon.arrays['sound_start'], candidates[near], side='right') - 1
+
+        nearest = {}
+        for word, distance in zip(words.tolist(), distances[near].tolist()):
+            nearest[word] = min(distance, nearest.get(word, distance))
+
+        ranked = sorted(nearest, key=lambda word: (nearest[word], word))[:k]
+        nodes = self.lexicon.arrays['word_node'][ranked].tolist()
+
+        return [(self.lexicon._word_at(node), nearest[word]) for node, word in zip(nodes, ranked)]
+
+    def _distances(self, query: List[int], candidates: np.ndarray) -> np.ndarray:
+        '''
+        Computes the Levenshtein distances between a pronunciation and many others at once, filling the dynamic
+        programming table a row at a time for all the others
+
+        :param query: the pronunciation, as phone ids
+        :param candidates: the other pronunciations
+        :return: the distances
+        '''
+        phones, phone_start = self.lexicon.arrays['phones'], self.lexicon.arrays['phone_start']
+
+        lengths = self.lengths[candidates]
+        columns = np.arange(lengths.max() + 1)
+
+        positions = phone_start[candidates][:, None] + columns[None, :-1]
+        others = np.where(columns[:-1] < lengths[:, None], phones[np.minimum(positions, len(phones) - 1)], -1)
+
+        row = np.broadcast_to(columns, (len(candidates), len(columns)))
+        for i, phone in enumerate(query, 1):
+            # the best cost of reaching each cell from the row above, by substitution or deletion ...
+            above = np.empty_like(row)
+            above[:, 0] = i
+            above[:, 1:] = np.minimum(row[:, :-1] + (others != phone), row[:, 1:] + 1)
+
+            # ... and then along the row, by insertions, as a running minimum
+            row = np.minimum.accumulate(above - columns, axis=1) + columns
+
+        return row[np.arange(len(candidates)), lengths]
+
+    def _codes(self, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+        return first * (self.pad + 2) + second
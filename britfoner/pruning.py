@@ -0,0 +1,116 @@
+'''
+
+Structured pruning of the hidden units of the sequence to sequence models
+
+'''
+from typing import Dict, Any, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+from britfoner.backends import NumpySeq2Seq
+
+
+def unit_scores(weights: Dict[str, ndarray], config: Dict[str, Any], X: ndarray) -> Tuple[ndarray, ndarray]:
+    '''
+    Scores the hidden units of a model with a single layer rnn stack by their contribution to its outputs
+
+    Encoder units, which are also the dimensions the decoder attends over, score the mean magnitude of their
+    outputs on some inputs times the norm of the weights reading them. Decoder units, whose outputs are bounded,
+    score the norm of the weights reading their output and cell state
+
+    :param weights: the weights by role, see :func:`britfoner.IO.weights_by_role`
+    :param config: the model configuration, as in :func:`britfoner.IO.artifact_to`
+    :param X: encoded input sequences
+    :return: the scores of the encoder units and those of the decoder units
+    '''
+    _check_prunable(weights)
+
+    hidden_n = weights['decoder/0/U/kernel'].shape[0]
+    W3 = weights['decoder/0/W3/kernel'][:, 0]
+
+    H = NumpySeq2Seq(weights, config).encoded(np.asarray(X, dtype=np.float32))
+    encoder = np.abs(H).mean(axis=(0, 1)) * np.sqrt((weights['decoder/0/W1/kernel'] ** 2).sum(axis=1) +
+                                                    W3[:hidden_n] ** 2)
+
+    decoder = np.sqrt((weights['decoder/0/W2/kernel'] ** 2).sum(axis=1) +
+                      (weights['decoder/0/U/kernel'] ** 2).sum(axis=1) + W3[hidden_n:] ** 2)
+
+    return encoder, decoder
+
+
+def pruned(weights: Dict[str, ndarray], encoder_units: ndarray, decoder_units: ndarray) -> Dict[str, ndarray]:
+    '''
+    Removes hidden units from a model with a single layer rnn stack, giving the weights of a smaller dense model.
+    Both encoder directions keep the same units, as their outputs are summed
+
+    :param weights: the weights by role, see :func:`britfoner.IO.weights_by_role`
+    :param encoder_units: the encoder units kept
+    :param decoder_units: the decoder units kept, as many as the encoder ones
+    :return: the weights of the smaller model, by role
+    '''
+    _check_prunable(weights)
+
+    if len(encoder_units) != len(decoder_units): raise ValueError('Encoder and decoder must keep as many units')
+
+    hidden_n = weights['decoder/0/U/kernel'].shape[0]
+    encoder_gates, decoder_gates = _gates_of(encoder_units, hidden_n), _gates_of(decoder_units, hidden_n)
+
+    kept = {}
+    for name, value in weights.items():
+        part, _, matrix, kind = name.split('/')
+
+        gates = decoder_gates if part == 'decoder' else encoder_gates
+        rows = decoder_units if part == 'decoder' and matrix in ('U', 'W2') else encoder_units
+
+        if matrix == 'W3':
+            kept[name] = value if kind == 'bias' else value[np.concatenate([encoder_units, hidden_n + decoder_units])]
+        elif matrix == 'W2':
+            kept[name] = value if kind == 'bias' else value[rows]
+        elif matrix == 'W4':
+            # reads the previous output, whose size doesn't change
+            kept[name] = value[:, gates]
+        elif kind == 'bias':
+            kept[name] = value[gates]
+        elif part != 'decoder' and matrix == 'W':
+            # reads the input sequence, whose size doesn't change
+            kept[name] = value[:, gates]
+        else:
+            kept[name] = value[np.ix_(rows, gates)]
+
+    return kept
+
+
+def pruned_by_contribution(weights: Dict[str, ndarray], config: Dict[str, Any], X: ndarray, hidden_n: int) \
+        -> Tuple[Dict[str, ndarray], Dict[str, Any]]:
+    '''
+    Keeps the hidden units contributing the most to the outputs of a model, see :func:`unit_scores`
+
+    :param weights: the weights by role, see :func:`britfoner.IO.weights_by_role`
+    :param config: the model configuration, as in :func:`britfoner.IO.artifact_to`
+    :param X: encoded input sequences to score the encoder units on
+    :param hidden_n: the number of hidden units kept
+    :return: the weights by role and the configuration of the smaller model
+    '''
+    encoder, decoder = unit_scores(weights, config, X)
+
+    if not 0 < hidden_n <= len(encoder): raise ValueError(f'Cannot keep {hidden_n} of {len(encoder)} units')
+
+    encoder_units = np.sort(np.argsort(-encoder, kind='stable')[:hidden_n])
+    decoder_units = np.sort(np.argsort(-decoder, kind='stable')[:hidden_n])
+
+    return pruned(weights, encoder_units, decoder_units), dict(config, hidden_dim=hidden_n)
+
+
+def _gates_of(units: ndarray, hidden_n: int) -> ndarray:
+    '''
+    :param units: some hidden units
+    :param hidden_n: the number of hidden units
+    :return: the columns of the units in the 4 gates of LSTM weights
+    '''
+    return np.concatenate([gate * hidden_n + units for gate in range(4)])
+
+
+def _check_prunable(weights: Dict[str, ndarray]):
+    if any(name.split('/')[1] != '0' for name in weights):
+        raise ValueError('Only models with a single layer rnn stack can be pruned')
@@ -659,6 +659,10 @@ class RecurrentModel(Recurrent):
             one = K.cast(K.zeros((1,))[0], 'int32')
             slices = [slice(None), counter[0] - K.switch(counter[0], one, zero)] + [slice(None)] * (K.ndim(ground_truth) - 2)
             ground_truth_slice = ground_truth[slices]
+            ratio = getattr(self, 'teacher_force_ratio', None)
+            if ratio is not None:
+                forced = K.cast(K.less(K.random_uniform((K.shape(readout)[0], 1)), ratio), K.floatx())
+                ground_truth_slice = forced * ground_truth_slice + (1. - forced) * readout
             readout = K.in_train_phase(K.switch(counter[0], ground_truth_slice, readout), readout)
             states.append(readout)
         if self.decode:
@@ -865,7 +869,7 @@ class RecurrentModel(Recurrent):
 
 class RecurrentSequential(RecurrentModel):
 
-    def __init__(self, state_sync=False, decode=False, output_length=None, return_states=False, readout=False, readout_activation='linear', teacher_force=False, state_initializer=None, **kwargs):
+    def __init__(self, state_sync=False, decode=False, output_length=None, return_states=False, readout=False, readout_activation='linear', teacher_force=False, teacher_force_ratio=None, state_initializer=None, **kwargs):
         self.state_sync = state_sync
         self.cells = []
         if decode and output_length is None:
@@ -881,6 +885,9 @@ class RecurrentSequential(RecurrentModel):
         self.readout = readout
         self.readout_activation = activations.get(readout_activation)
         self.teacher_force = teacher_force
+        # scheduled sampling: the probability of feeding back the ground truth rather than the output, per sequence
+        # and step, which can be changed during training with K.set_value
+        self.teacher_force_ratio = K.variable(teacher_force_ratio) if teacher_force_ratio is not None else None
         self._optional_input_placeholders = {}
         if state_initializer:
             if type(state_initializer) in [list, tuple]:
@@ -937,6 +944,13 @@ class RecurrentSequential(RecurrentModel):
     def build(self, input_shape):
         if hasattr(self, 'model'):
             del self.model
+        sequence_shape = input_shape
+        if self.readout == 'concat':
+            # the readout is repeated along the input sequence and concatenated to it, so that decoders over
+            # sequences, such as attention decoders, get the previous output at every step
+            readout_dim = [cell for cell in self.cells if _is_rnn_cell(cell)][-1].output_dim
+            sequence_shape = tuple(input_shape)
+            input_shape = sequence_shape[:-1] + (sequence_shape[-1] + readout_dim,)
         # Try and get batch size for initializer
         if not hasattr(self, 'batch_size'):
             if hasattr(self, 'batch_input_shape'):
@@ -1035,7 +1049,7 @@ class RecurrentSequential(RecurrentModel):
                 readout = Lambda(lambda x: x + 0., output_shape=lambda s: s)(readout_input)
             else:
                 readout = Activation(self.readout_activation)(readout_input)
-            input = Input(batch_shape=K.int_shape(input))
+            input = Input(batch_shape=sequence_shape if self.readout == 'concat' else K.int_shape(input))
             if self.readout in [True, 'add']:
                 input_readout_merged = add([input, readout])
             elif self.readout in ['mul', 'multiply']:
@@ -1046,13 +1060,16 @@ class RecurrentSequential(RecurrentModel):
                 input_readout_merged = maximum([input, readout])
             elif self.readout == 'readout_only':
                 input_readout_merged = readout
+            elif self.readout == 'concat':
+                input_readout_merged = Lambda(lambda x: K.concatenate([x[0], K.repeat(x[1], K.shape(x[0])[1])]),
+                                              output_shape=lambda s: s[0][:-1] + (s[0][-1] + s[1][-1],))([input, readout])
             initial_states = [Input(batch_shape=K.int_shape(s)) for s in initial_states]
             output = _to_list(self.model([input_readout_merged] + initial_states))
             final_states = output[1:]
             output = output[0]
             self.model = Model([input] + initial_states + [readout_input], [output] + final_states)
             self.states.append(None)
-        super(RecurrentSequential, self).build(input_shape)
+        super(RecurrentSequential, self).build(sequence_shape)
 
     def get_config(self):
         config = {'cells': list(map(serialize, self.cells)),
@@ -7,11 +7,12 @@ from keras import backend as K
 
 class LSTMDecoderCell(ExtendedRNNCell):
 
-    def __init__(self, hidden_dim=None, **kwargs):
+    def __init__(self, hidden_dim=None, output_activation=None, **kwargs):
         if hidden_dim:
             self.hidden_dim = hidden_dim
         else:
             self.hidden_dim = self.output_dim
+        self.output_activation = activations.get(output_activation) if output_activation else None
         super(LSTMDecoderCell, self).__init__(**kwargs)
 
     def build_model(self, input_shape):
@@ -41,25 +42,31 @@ class LSTMDecoderCell(ExtendedRNNCell):
         c = add([multiply([f, c_tm1]), multiply([i, Activation(self.activation)(z2)])])
         o = Activation(self.recurrent_activation)(z3)
         h = multiply([o, Activation(self.activation)(c)])
-        y = Activation(self.activation)(W2(h))
+        y = Activation(self.output_activation or self.activation)(W2(h))
 
         return Model([x, h_tm1, c_tm1], [y, h, c])
 
 
 class AttentionDecoderCell(ExtendedRNNCell):
 
-    def __init__(self, hidden_dim=None, **kwargs):
+    def __init__(self, hidden_dim=None, output_activation=None, masked=False, readout_dim=0, **kwargs):
         if hidden_dim:
             self.hidden_dim = hidden_dim
         else:
             self.hidden_dim = self.output_dim
+        self.output_activation = activations.get(output_activation) if output_activation else None
+        # whether positions of the attended sequence that are all zeros, the encoder outputs of padding, get no attention
+        self.masked = masked
+        # the size of the previous output, when the decoder concatenates it to the attended sequence (readout='concat')
+        self.readout_dim = readout_dim
         self.input_ndim = 3
         super(AttentionDecoderCell, self).__init__(**kwargs)
 
 
     def build_model(self, input_shape):
         
-        input_dim = input_shape[-1]
+        readout_dim = self.readout_dim
+        input_dim = input_shape[-1] - readout_dim
         output_dim = self.output_dim
         input_length = input_shape[1]
         hidden_dim = self.hidden_dim
@@ -67,6 +74,12 @@ class AttentionDecoderCell(ExtendedRNNCell):
         x = Input(batch_shape=input_shape)
         h_tm1 = Input(batch_shape=(input_shape[0], hidden_dim))
         c_tm1 = Input(batch_shape=(input_shape[0], hidden_dim))
+
+        if readout_dim:
+            y_tm1 = Lambda(lambda x: x[:, 0, input_dim:], output_shape=(readout_dim,), name='readout')(x)
+            H = Lambda(lambda x: x[..., :input_dim], output_shape=(input_length, input_dim))(x)
+        else:
+            H = x
         
         W1 = Dense(hidden_dim * 4,
                    kernel_initializer=self.kernel_initializer,
@@ -81,17 +94,28 @@ class AttentionDecoderCell(ExtendedRNNCell):
                   kernel_initializer=self.kernel_initializer,
                   kernel_regularizer=self.kernel_regularizer)
 
-        C = Lambda(lambda x: K.repeat(x, input_length), output_shape=(input_length, input_dim))(c_tm1)
-        _xC = concatenate([x, C])
+        # the attended length is taken from the input, as it varies between batches when unknown
+        C = Lambda(lambda x: K.repeat(x[0], K.shape(x[1])[1]), output_shape=(input_length, input_dim))([c_tm1, H])
+        _xC = concatenate([H, C])
         _xC = Lambda(lambda x: K.reshape(x, (-1, input_dim + hidden_dim)), output_shape=(input_dim + hidden_dim,))(_xC)
 
         alpha = W3(_xC)
-        alpha = Lambda(lambda x: K.reshape(x, (-1, input_length)), output_shape=(input_length,))(alpha)
+        alpha = Lambda(lambda x: K.reshape(x[0], (-1, K.shape(x[1])[1])), output_shape=(input_length,))([alpha, H])
+        if self.masked:
+            alpha = Lambda(lambda x: x[0] - 1e9 * K.cast(K.all(K.equal(x[1], 0.), axis=-1), K.floatx()),
+                           output_shape=(input_length,))([alpha, H])
         alpha = Activation('softmax')(alpha)
 
-        _x = Lambda(lambda x: K.batch_dot(x[0], x[1], axes=(1, 1)), output_shape=(input_dim,))([alpha, x])
+        _x = Lambda(lambda x: K.batch_dot(x[0], x[1], axes=(1, 1)), output_shape=(input_dim,))([alpha, H])
 
-        z = add([W1(_x), U(h_tm1)])
+        if readout_dim:
+            W4 = Dense(hidden_dim * 4,
+                       kernel_initializer=self.kernel_initializer,
+                       kernel_regularizer=self.kernel_regularizer,
+                       use_bias=False)
+            z = add([W1(_x), U(h_tm1), W4(y_tm1)])
+        else:
+            z = add([W1(_x), U(h_tm1)])
 
         z0, z1, z2, z3 = get_slices(z, 4)
 
@@ -101,6 +125,6 @@ class AttentionDecoderCell(ExtendedRNNCell):
         c = add([multiply([f, c_tm1]), multiply([i, Activation(self.activation)(z2)])])
         o = Activation(self.recurrent_activation)(z3)
         h = multiply([o, Activation(self.activation)(c)])
-        y = Activation(self.activation)(W2(h))
+        y = Activation(self.output_activation or self.activation)(W2(h))
 
         return Model([x, h_tm1, c_tm1], [y, h, c])
@@ -2,7 +2,9 @@ from __future__ import absolute_import
 from ..recurrentshop import LSTMCell, RecurrentSequential
 from .cells import LSTMDecoderCell, AttentionDecoderCell
 from keras.models import Sequential, Model
-from keras.layers import Dense, Dropout, TimeDistributed, Bidirectional, Input
+from keras.layers import Dense, Dropout, TimeDistributed, Bidirectional, Input, Conv1D, Add, Dot, Permute, Activation, \
+    Lambda
+from keras import backend as K
 
 
 '''
@@ -209,7 +211,9 @@ def Seq2Seq(output_dim, output_length, batch_input_shape=None,
 def AttentionSeq2Seq(output_dim, output_length, batch_input_shape=None,
                      batch_size=None, input_shape=None, input_length=None,
                      input_dim=None, hidden_dim=None, depth=1,
-                     bidirectional=True, unroll=False, stateful=False, dropout=0.0,):
+                     bidirectional=True, unroll=False, stateful=False, dropout=0.0,
+                     output_activation=None, mask_index=None, readout=False,
+                     teacher_force=False, teacher_force_ratio=None):
     '''
     This is an attention Seq2seq model based on [3].
     Here, there is a soft allignment between the input and output sequence elements.
@@ -234,6 +238,26 @@ def AttentionSeq2Seq(output_dim, output_length, batch_input_shape=None,
     alpha = softmax(energy)
     Where a is a feed forward network.
 
+    output_activation : Activation of the output layer, tanh if not given. Use softmax
+                        to train against integer targets with a categorical loss.
+
+    mask_index : Index of the padding symbol in one-hot encoded inputs. If given, padding steps
+                 are masked: the encoder skips them, their outputs are zeroed and the decoder
+                 doesn't attend to them, so predictions don't depend on how much inputs are padded
+                 and batches can be padded only to their longest sequence (leave input_length out).
+
+    readout : Whether the decoder also gets its previous output y(i-1) at every step, as in [3].
+
+    teacher_force : Whether the decoder gets the ground truth y(i-1) instead during training, which
+                    the model then takes as a second input. It implies readout, and the model
+                    predicts from its own outputs otherwise. To predict without the ground truth
+                    input, build the same model with readout only and give it these weights.
+
+    teacher_force_ratio : The probability of getting the ground truth rather than the decoder's
+                          output, per sequence and step (scheduled sampling), as a variable of the
+                          decoder, model.decoder.teacher_force_ratio, to be lowered during training.
+                          Always the ground truth if not given.
+
     '''
 
     if isinstance(depth, int):
@@ -271,21 +295,98 @@ def AttentionSeq2Seq(output_dim, output_length, batch_input_shape=None,
         # patch
         encoder.layer = encoder.forward_layer
 
-    encoded = encoder(_input)
+    if mask_index is None:
+        encoded = encoder(_input)
+    else:
+        not_padding = lambda x: K.not_equal(x[..., mask_index], 1.)
+        encoded = encoder(Lambda(lambda x: x, mask=lambda x, mask: not_padding(x))(_input))
+        # the decoder steps over outputs, so the input mask stops here
+        encoded = Lambda(lambda x: x[0] * K.expand_dims(K.cast(not_padding(x[1]), K.floatx())),
+                         mask=None)([encoded, _input])
+
+    masked = mask_index is not None
+    readout = readout or teacher_force
+    readout_dim = output_dim if readout else 0
     decoder = RecurrentSequential(decode=True, output_length=output_length,
-                                  unroll=unroll, stateful=stateful)
+                                  unroll=unroll, stateful=stateful,
+                                  readout='concat' if readout else False, teacher_force=teacher_force,
+                                  teacher_force_ratio=teacher_force_ratio)
     decoder.add(Dropout(dropout, batch_input_shape=(shape[0], shape[1], hidden_dim)))
     if depth[1] == 1:
-        decoder.add(AttentionDecoderCell(output_dim=output_dim, hidden_dim=hidden_dim))
+        decoder.add(AttentionDecoderCell(output_dim=output_dim, hidden_dim=hidden_dim,
+                                         output_activation=output_activation, masked=masked,
+                                         readout_dim=readout_dim))
     else:
-        decoder.add(AttentionDecoderCell(output_dim=output_dim, hidden_dim=hidden_dim))
+        decoder.add(AttentionDecoderCell(output_dim=output_dim, hidden_dim=hidden_dim, masked=masked,
+                                         readout_dim=readout_dim))
         for _ in range(depth[1] - 2):
             decoder.add(Dropout(dropout))
             decoder.add(LSTMDecoderCell(output_dim=hidden_dim, hidden_dim=hidden_dim))
         decoder.add(Dropout(dropout))
-        decoder.add(LSTMDecoderCell(output_dim=output_dim, hidden_dim=hidden_dim))
+        decoder.add(LSTMDecoderCell(output_dim=output_dim, hidden_dim=hidden_dim,
+                                    output_activation=output_activation))
     
     inputs = [_input]
-    decoded = decoder(encoded)
+    if teacher_force:
+        truth_tensor = Input(batch_shape=(shape[0], output_length, output_dim))
+        inputs += [truth_tensor]
+
+    decoded = decoder(encoded, ground_truth=inputs[1] if teacher_force else None)
     model = Model(inputs, decoded)
+    model.decoder = decoder
     return model
+
+
+def ParallelSeq2Seq(output_dim, output_length, input_length, input_dim, hidden_dim=256,
+                    depth=4, kernel_size=3, dropout=0.0, output_activation=None, batch_size=None):
+    '''
+    A non-autoregressive sequence to sequence model: all the output sequence elements
+    are predicted at once, in a single forward pass, rather than one after the other.
+
+    The math:
+
+            Encoder:
+            X = Input Sequence of length m.
+            H = a stack of depth residual convolutions over X, dilated 1, 2, 4, 8, 1, ...
+            times, so that with kernel_size 3 every H(j) sees 31 elements around j.
+
+            Decoder:
+            Each output position i has a learned query q(i) attending over H:
+
+    alpha(i, j) = softmax over j of q(i) . H(j)
+
+    v(i) =  sigma(j = 0 to m-1)  alpha(i, j) * H(j)
+
+            y = a dense layer over a stack of residual convolutions over v, so that
+            neighbouring output elements are predicted consistently.
+
+    Output sequences are padded to output_length, so their length is predicted
+    together with their elements.
+
+    output_activation : Activation of the output layer, tanh if not given. Use softmax
+                        to train against integer targets with a categorical loss.
+    '''
+    _input = Input(batch_shape=(batch_size, input_length, input_dim))
+
+    encoded = Dense(hidden_dim)(_input)
+    for layer in range(depth):
+        encoded = _residual_convolution(encoded, hidden_dim, kernel_size, 2 ** (layer % 4), dropout)
+
+    # the energies of all the queries at once, as a dense layer whose kernel holds the queries
+    energies = Permute((2, 1))(Dense(output_length, use_bias=False)(encoded))
+    alpha = Activation('softmax')(energies)
+    decoded = Dot(axes=(2, 1))([alpha, encoded])
+
+    for _ in range(max(depth // 2, 1)):
+        decoded = _residual_convolution(decoded, hidden_dim, kernel_size, 1, dropout)
+
+    output = Dense(output_dim, activation=output_activation or 'tanh')(decoded)
+
+    model = Model(_input, output)
+    return model
+
+
+def _residual_convolution(x, hidden_dim, kernel_size, dilation_rate, dropout):
+    y = Conv1D(hidden_dim, kernel_size, padding='same', dilation_rate=dilation_rate, activation='relu')(x)
+    y = Dropout(dropout)(y)
+    return Add()([x, y])
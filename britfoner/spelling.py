@@ -0,0 +1,123 @@
+'''
+
+Approximate matching of words against the dictionary, for typos and alternative spellings
+
+'''
+from collections import defaultdict
+from typing import Iterable, List, Set, Tuple
+
+from britfoner import Seq
+
+
+class NearMatches:
+    '''
+    Finds the dictionary words within a small edit distance of a word with a symmetric delete index: every word
+    is indexed under the strings left by deleting up to ``max_distance`` of its letters, so that the candidates
+    for a query are the words sharing one of the query's own deletes. Candidates are then verified with the
+    optimal string alignment distance, which counts swapping two adjacent letters as a single edit
+
+    Words differing only in apostrophes and spaces, like ``DONT`` and ``DON'T``, are taken to be no edits away
+    '''
+
+    def __init__(self, words: Iterable[Seq], max_distance: int = 1):
+        '''
+        :param words: the dictionary words
+        :param max_distance: the largest number of edits a match can be away from a word
+        '''
+        self.words = [''.join(word) for word in words]
+        self.max_distance = max_distance
+
+        self.deletes, self.plain = defaultdict(list), defaultdict(list)
+        for idx, word in enumerate(self.words):
+            for key in deletes_of(word, max_distance):
+                self.deletes[key].append(idx)
+
+            self.plain[plain(word)].append(idx)
+
+    def closest(self, word: Seq) -> Tuple[List[Seq], float]:
+        '''
+        Finds the dictionary words closest to a word
+
+        The confidence in them is 1 less the number of edits relative to the length of the word, split
+        among the closest words when there are several
+
+        :param word: the word
+        :return: the closest words, with the confidence in them, or no words and 0 if none is close enough
+        '''
+        query = ''.join(word)
+
+        best, best_distance = self.plain.get(plain(query), []), 0
+
+        if not best:
+            candidates = set()
+            for key in deletes_of(query, self.max_distance):
+                candidates.update(self.deletes.get(key, ()))
+
+            best_distance = self.max_distance
+            for idx in sorted(candidates):
+                distance = edit_distance(query, self.words[idx], best_distance + 1)
+
+                if distance > best_distance: continue
+                if distance < best_distance: best = []
+
+                best.append(idx)
+                best_distance = distance
+
+        if not best: return [], 0.
+
+        confidence = (1 - best_distance / max(len(query), 1)) / len(best)
+
+        return [tuple(self.words[idx]) for idx in best], confidence
+
+
+def plain(word: str) -> str:
+    '''
+    :param word: a word
+    :return: the word without apostrophes and spaces
+    '''
+    return word.replace("'", '').replace(' ', '')
+
+
+def deletes_of(word: str, max_distance: int) -> Set[str]:
+    '''
+    Gives the strings left by deleting up to a number of letters from a word
+
+    :param word: the word
+    :param max_distance: the largest number of letters deleted
+    :return: the strings, including the word itself
+    '''
+    deletes, last = {word}, {word}
+    for _ in range(max_distance):
+        last = {string[:i] + string[i + 1:] for string in last for i in range(len(string))}
+        deletes |= last
+
+    return deletes
+
+
+def edit_distance(a: str, b: str, bound: int) -> int:
+    '''
+    Computes the optimal string alignment distance between two strings: the number of letter insertions,
+    deletions, substitutions and swaps of adjacent letters turning one into the other, without editing
+    any substring twice
+
+    :param a: a string
+    :param b: another string
+    :param bound: a distance beyond which the exact value isn't needed
+    :return: the distance, or ``bound`` if it is at least ``bound``
+    '''
+    if abs(len(a) - len(b)) >= bound: return bound
+
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+
+        if min(current) >= bound: return bound
+
+    return min(current[-1], bound)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+'''
+
+script to search for model hyperparameters, training trials in parallel
+
+'''
+import csv
+import logging
+import os
+from argparse import ArgumentParser
+from itertools import product
+from multiprocessing import get_context, cpu_count
+from os.path import join
+from statistics import median
+from time import perf_counter
+from typing import Dict, Any, List, Sequence
+
+import numpy as np
+from keras.callbacks import EarlyStopping
+
+from britfoner import _UNSTRESSED_BRITFONE, _MODEL_OUT
+from britfoner.IO import dataset_from, configure_threads
+from britfoner.g2p import attention_g2p_model_from, train_g2p, WER_ModelCheckpoint, WER_Evaluator
+from britfoner.main import model_name_from
+
+Trial = Dict[str, Any]
+
+# the hyperparameters main.main_seq_2_seq trains with
+DEFAULT_TRIAL = dict(hidden_n=256, depth=1, dropout=.15, batch_n=128, lr=1e-3)
+
+FIELDS = ['trial'] + list(DEFAULT_TRIAL) + ['WER', 'params', 'epochs', 'train_s', 'latency_ms', 'stopped', 'artifact']
+
+
+def trials_from(space: Dict[str, Sequence], n: int = None, random_state: int = 42) -> List[Trial]:
+    '''
+    Creates the trials of a search over the given hyperparameter values. Hyperparameters not in ``space``
+    take the values in :const:`DEFAULT_TRIAL`
+
+    :param space: the values to try for each hyperparameter
+    :param n: number of trials picked at random from the grid, or None for the whole grid
+    :param random_state: the seed for picking trials
+    :return: the trials, as hyperparameter to value mappings
+    '''
+    names = list(space)
+    grid = [dict(DEFAULT_TRIAL, **dict(zip(names, values))) for values in product(*(space[name] for name in names))]
+
+    if n is None or n >= len(grid): return grid
+
+    picked = np.random.RandomState(random_state).choice(len(grid), n, replace=False)
+
+    return [grid[i] for i in sorted(picked)]
+
+
+def sweep(trials: List[Trial], out_dir: str, data_src: str = _UNSTRESSED_BRITFONE,
+          threads: int = 1, epochs: int = 5000, patience: int = 35, eval_period: int = 5,
+          min_trials: int = 3) -> List[Dict[str, Any]]:
+    '''
+    Trains the given trials on a process pool sized to the machine, each trial using ``threads`` TensorFlow threads,
+    and writes a results table, sorted by WER, to ``results.tsv`` in ``out_dir``
+
+    A trial is stopped early when its WER at an evaluated epoch is worse than the median WER of the
+    other trials at that same epoch, once ``min_trials`` other trials have reached it
+
+    :param trials: the hyperparameters of each trial
+    :param out_dir: the directory to save the results and model artifacts to
+    :param data_src: file containing data
+    :param threads: number of TensorFlow intra-op threads per trial
+    :param epochs: maximum number of epochs per trial
+    :param patience: number of epochs without validation loss improvement before stopping a trial
+    :param eval_period: the frequency to compute the WER at
+    :param min_trials: number of other trials needed at an epoch before stopping losing trials
+    :return: the results table rows
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+
+    context = get_context('spawn')
+    processes = max(1, cpu_count() // threads)
+
+    logging.info(f'starting sweep of [{len(trials)}] trials on [{processes}] processes...')
+
+    # a fresh process per trial, as models and TensorFlow sessions built in a process are never released
+    with context.Manager() as manager, context.Pool(processes, maxtasksperchild=1) as pool:
+        wers, lock = manager.dict(), manager.Lock()
+
+        jobs = [(i, trial, out_dir, data_src, threads, epochs, patience, eval_period, min_trials, wers, lock)
+                for i, trial in enumerate(trials)]
+
+        rows = sorted(pool.starmap(_run_trial, jobs), key=lambda row: row['WER'])
+
+    with open(join(out_dir, 'results.tsv'), 'w', newline='') as out_file:
+        writer = csv.DictWriter(out_file, FIELDS, delimiter='\t')
+        writer.writeheader()
+        writer.writerows(rows)
+
+    logging.info('finished sweep.')
+
+    return rows
+
+
+def _run_trial(i: int, trial: Trial, out_dir: str, data_src: str, threads: int, epochs: int, patience: int,
+               eval_period: int, min_trials: int, wers, lock) -> Dict[str, Any]:
+    '''
+    Trains and measures a single trial
+
+    :param i: the trial number
+    :param trial: the trial's hyperparameters
+    :param wers: shared mapping from epoch to the WERs of the trials that evaluated it
+    :param lock: lock over ``wers``
+    :return: the trial's results table row
+    '''
+    configure_threads(threads, 1)
+
+    (train_X, val_X, train_Y, val_Y), index = dataset_from(data_src, val_size=.01)
+
+    model = attention_g2p_model_from(index.x_dim, index.x_n, index.y_dim, index.y_n,
+                                     hidden_n=trial['hidden_n'], dropout=trial['dropout'],
+                                     depth=trial['depth'], lr=trial['lr'])
+
+    trial_dir = join(out_dir, f'{i:03d}')
+    os.makedirs(trial_dir, exist_ok=True)
+    artifact = join(trial_dir, model_name_from(model))
+
+    evaluator = WER_Evaluator(model, val_X, index, period=eval_period)
+    stopped = []
+
+    def on_epoch_end(epoch: int, logs: Dict[str, Any]):
+
+        WER = evaluator(epoch, logs)
+
+        if WER is None: return None
+
+        with lock:
+            others = wers.get(epoch, [])
+            wers[epoch] = others + [WER]
+
+        if len(others) >= min_trials and WER > median(others):
+            stopped.append(epoch)
+            model.stop_training = True
+
+        return WER
+
+    callbacks = [EarlyStopping(patience=patience),
+                 WER_ModelCheckpoint(filepath=artifact, monitor='WER', save_best_only=True, callback=on_epoch_end)]
+
+    start = perf_counter()
+    train_g2p(model, (train_X, train_Y), (val_X, val_Y), batch_n=trial['batch_n'], epochs=epochs, callbacks=callbacks)
+    train_s = perf_counter() - start
+
+    model.load_weights(artifact)
+
+    row = dict(trial=i, **trial,
+               WER=round(WER_Evaluator(model, val_X, index).wer(model.predict(val_X)), 2),
+               params=model.count_params(),
+               epochs=len(model.history.epoch),
+               train_s=round(train_s),
+               latency_ms=round(_latency(model, val_X[:1]), 3),
+               stopped=stopped[0] if stopped else '',
+               artifact=artifact)
+
+    logging.info(f'trial [{i:03d}] {trial} WER [{row["WER"]:6.2f}]')
+
+    return row
+
+
+def _latency(model, x: np.ndarray, repeats: int = 50) -> float:
+    '''
+    Measures single-word inference latency
+
+    :param model: the model
+    :param x: a single encoded word, as a batch of one
+    :param repeats: number of timed predictions
+    :return: median latency in milliseconds
+    '''
+    model.predict(x)
+
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        model.predict(x)
+        times.append(perf_counter() - start)
+
+    return 1000 * median(times)
+
+
+def _space_from(specs: List[str]) -> Dict[str, List]:
+    '''
+    Parses hyperparameter values given as ``name=value,value,...``
+
+    :param specs: the values of each hyperparameter
+    :return: the values to try for each hyperparameter
+    '''
+    space = {}
+    for spec in specs:
+        name, values = spec.split('=')
+        if name not in DEFAULT_TRIAL:
+            raise ValueError(f'Unknown hyperparameter [{name}], not one of {", ".join(DEFAULT_TRIAL)}')
+
+        space[name] = [type(DEFAULT_TRIAL[name])(float(value)) for value in values.split(',')]
+
+    return space
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__.strip())
+    parser.add_argument('grid', nargs='+', metavar='NAME=VALUE,...',
+                        help=f'hyperparameter values to try, among {", ".join(DEFAULT_TRIAL)}')
+    parser.add_argument('--random', type=int, default=None, metavar='N', help='try N random trials from the grid')
+    parser.add_argument('--threads', type=int, default=1, help='TensorFlow threads per trial')
+    parser.add_argument('--out', default=join(_MODEL_OUT, 'sweep'))
+    parser.add_argument('--data', default=_UNSTRESSED_BRITFONE)
+
+    args = parser.parse_args()
+
+    sweep(trials_from(_space_from(args.grid), args.random), args.out, args.data, threads=args.threads)
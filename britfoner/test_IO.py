@@ -1,8 +1,11 @@
+import pytest
 import sure
 sure.enable() # stops pycharm from removing sure import
-from numpy import array, ndarray
+from numpy import array, ndarray, array_equal
 from britfoner import _UNSTRESSED_BRITFONE, Index, _END, _GAP, _START, Inv_Alphabet, Alphabet
-from britfoner.IO import items_from, index_from, decoded, all_encoded
+from britfoner.IO import items_from, index_from, decoded, all_encoded, all_indexed, one_hot, alphabets_from, \
+    lexicon_from, lexicon_to, compiled_lexicon_from, dataset_from, dictionary_from, entries_from, artifact_from, \
+    config_from_name, seq2seq_from
 
 
 def test_reads_in_csv_as_sorted_tuples():
@@ -13,6 +16,15 @@ def test_reads_in_csv_as_sorted_tuples():
     sounds[0].should.eql(('k','ə','z'))
 
 
+def test_reads_in_csv_in_chunks_as_read_whole():
+    words, sounds = items_from(_UNSTRESSED_BRITFONE)
+    chunked_words, chunked_sounds = entries_from(_UNSTRESSED_BRITFONE, processes=1, chunk_n=7)
+
+    chunked_words.should.eql(list(words))
+    chunked_sounds.should.eql(list(sounds))
+    dictionary_from(_UNSTRESSED_BRITFONE, processes=2).should.eql(dictionary_from(_UNSTRESSED_BRITFONE))
+
+
 def test_builds_index_from_items():
     words = [('A', 'B', 'C'), ('C', 'D')]
     sounds = [('x', 'y'), ('x', 'z')]
@@ -48,3 +60,105 @@ def test_encodes_sequences_into_3D_tensor():
 
     (all_encoded(seqs, alphabet) == tensor).all().should.eql(True)
     (all_encoded(seqs, alphabet, reverse=True) == rev_tensor).all().should.eql(True)
+
+
+def test_indexes_sequences_consistently_with_one_hot_encoding():
+    seqs = [tuple('CAB'), tuple('BAC')]
+    alphabet: Alphabet = {'A': 0, 'B': 1, 'C': 2}
+
+    all_indexed(seqs, alphabet, reverse=True).tolist().should.eql([[1, 0, 2], [2, 0, 1]])
+    (one_hot(all_indexed(seqs, alphabet), 3) == all_encoded(seqs, alphabet)).all().should.eql(True)
+    (one_hot(all_indexed(seqs, alphabet, reverse=True), 3) == all_encoded(seqs, alphabet, reverse=True)).all() \
+        .should.eql(True)
+
+
+def test_takes_alphabets_from_model_description_if_they_cover_the_dictionary():
+    dictionary = {('A', 'B'): {('x', 'y')}}
+    description = dict(inv_letter=[_START, 'A', 'B', 'C', _END, _GAP], inv_phone=[_START, 'x', 'y', _END, _GAP])
+
+    letter_index, inv_phone_index = alphabets_from(description, dictionary)
+
+    letter_index['C'].should.eql(3)
+    inv_phone_index.should.eql((_START, 'x', 'y', _END, _GAP))
+    alphabets_from.when.called_with(description, {('D',): {('x',)}}).should.throw(ValueError)
+
+
+lexicon_words = {tuple('CAT'): {('k', 'a', 't')}, tuple('CATS'): {('k', 'a', 't', 's')}, tuple('COT'): {('k', 'ɒ', 't')},
+                 tuple('CUT'): {('k', 'ɐ', 't')}, tuple('ROW'): {('ɹ', 'əʊ'), ('ɹ', 'aʊ')}}
+
+
+def test_looks_up_words_in_lexicon_as_in_dictionary(tmpdir):
+    src = str(tmpdir.join('words.lexicon'))
+    lexicon_to(lexicon_from(lexicon_words), src)
+
+    for lexicon in (lexicon_from(lexicon_words), compiled_lexicon_from(src)):
+        dict(lexicon.items()).should.eql(lexicon_words)
+        lexicon.get(tuple('CA')).should.be(None)
+        lexicon.get(tuple('DOG')).should.be(None)
+        (tuple('CATS') in lexicon).should.be(True)
+
+
+def test_finds_lexicon_words_by_prefix_and_wildcard_pattern():
+    lexicon = lexicon_from(lexicon_words)
+
+    lexicon.with_prefix(tuple('CA')).should.eql([tuple('CAT'), tuple('CATS')])
+    lexicon.with_prefix(tuple('D')).should.eql([])
+    lexicon.matching('C?T').should.eql([tuple('CAT'), tuple('COT'), tuple('CUT')])
+    lexicon.matching('*T*').should.eql([tuple('CAT'), tuple('CATS'), tuple('COT'), tuple('CUT')])
+    lexicon.matching('*S').should.eql([tuple('CATS')])
+
+
+def test_finds_lexicon_words_by_pronunciation_and_rhyme():
+    lexicon = lexicon_from({**lexicon_words, tuple('CUTS'): {('k', 'ɐ', 't', 's')}, tuple('NUT'): {('n', 'ɐ', 't')},
+                            tuple('KAT'): {('k', 'a', 't')}})
+
+    lexicon.sounding_like(('k', 'a', 't')).should.eql([tuple('CAT'), tuple('KAT')])
+    lexicon.sounding_like(('k', 'a')).should.eql([])
+    lexicon.rhyming_with(('k', 'ɐ', 't')).should.eql([tuple('CUT'), tuple('NUT')])
+    lexicon.rhyming_with(('ɹ', 'aʊ')).should.eql([tuple('ROW')])
+
+
+def test_maps_cached_dataset_on_later_calls(tmpdir):
+    src = str(tmpdir.join('data.csv'))
+    with open(src, 'w', encoding='utf-8') as out_file:
+        out_file.write('CAT,k æ t\nDOG,d ɒ g\nTHRONE,θ ɹ əʊ n\nROW,ɹ əʊ\nROW,ɹ aʊ\n')
+
+    dataset, index = dataset_from(src, val_size=.4, cache_dir=str(tmpdir))
+    cached_dataset, cached_index = dataset_from(src, val_size=.4, cache_dir=str(tmpdir))
+
+    cached_index.should.eql(index)
+    for arrays, cached_arrays in zip(dataset, cached_dataset):
+        array_equal(arrays, cached_arrays).should.be(True)
+        cached_arrays.flags.writeable.should.be(False)
+
+
+def test_parses_architecture_from_model_names_whatever_their_kind():
+    config = dict(input_length=20, input_dim=32, hidden_dim=128, output_length=19, output_dim=48, depth=1)
+
+    config_from_name('20x32x128x19x48x1.h5').should.eql(config)
+    config_from_name('/models/20x32x128x19x48x1.student.h5').should.eql(config)
+    config_from_name('20x32x128x19x48x1.masked.readout.h5').should.eql(config)
+
+
+def test_loads_weights_files_and_whole_model_files(tmpdir):
+    pytest.importorskip('keras', minversion='2.2.2')
+    h5py = pytest.importorskip('h5py')
+    from keras.engine.saving import save_weights_to_hdf5_group
+
+    src = str(tmpdir.join('6x5x4x7x6x1.h5'))
+    model = seq2seq_from(config_from_name(src), unroll=False)
+    X = one_hot(array([[0, 1, 2, 3, 4, 0]]), 5)
+
+    model.save_weights(src)
+    weights_model, description = artifact_from(src)
+
+    # as model.save lays out the file, without the architecture seq2seq can't read back
+    with h5py.File(src, 'w') as h5:
+        save_weights_to_hdf5_group(h5.create_group('model_weights'), model.layers)
+    whole_model, _ = artifact_from(src)
+
+    description.should.be(None)
+    for loaded in weights_model, whole_model:
+        for weights, loaded_weights in zip(model.get_weights(), loaded.get_weights()):
+            array_equal(weights, loaded_weights).should.be(True)
+        array_equal(model.predict(X), loaded.predict(X)).should.be(True)
@@ -1,7 +1,13 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
 import sure
 
 sure.enable()  # stops pycharm from removing sure import
-from britfoner.api import pronounce
+import britfoner.api as api
+from britfoner.api import pronounce, homophones, rhymes, warm_up, configure_cascade, resolved_fractions, \
+    configure_tiers
 
 
 def test_gives_pronunciations_of_word_in_dictionary():
@@ -9,6 +15,11 @@ def test_gives_pronunciations_of_word_in_dictionary():
     pronounce('row').should.eql({('ɹ', 'əʊ'), ('ɹ', 'aʊ')})
 
 
+def test_warms_up_model_before_words_not_in_dictionary():
+    #
+    warm_up(batch_sizes=(1, 2), finalize=False).should.be.greater_than(0)
+
+
 def test_gives_pronunciation_of_word_not_in_dictionary():
     #
     pronounce('thrones').should.eql({('θ', 'ɹ', 'əʊ', 'n', 'z')})
@@ -17,3 +28,81 @@ def test_gives_pronunciation_of_word_not_in_dictionary():
 def test_gives_no_pronunciations_for_words_longer_than_18_chars():
     #
     pronounce('counterrevolutionaries').should.eql(set())
+
+
+def test_gives_homophones_and_rhymes_of_word_in_dictionary():
+    #
+    homophones('know').should.eql([('N', 'O')])
+    rhymes('throne').should.contain(('B', 'O', 'N', 'E'))
+    rhymes('throne').shouldnt.contain(('T', 'H', 'R', 'O', 'N', 'E'))
+
+
+def test_pronounces_words_the_fast_model_is_confident_about_without_the_model():
+    configure_cascade(fast='ngram', confidence=0.)
+    try:
+        pronounce('gorbled').should.have.length_of(1)
+        resolved_fractions().should.have.key('fast model')
+    finally:
+        configure_cascade(confidence=None)
+
+
+def test_refuses_keras_fast_models_once_the_graph_is_finalized():
+    api._graph_finalized = True
+    try:
+        configure_cascade.when.called_with(fast='20x32x128x19x48x1.student.h5', confidence=.9).should.throw(ValueError)
+        configure_cascade(fast='ngram', confidence=.9)
+    finally:
+        api._graph_finalized = False
+        configure_cascade(confidence=None)
+
+
+def test_leaves_tiers_not_configured_unchanged():
+    try:
+        configure_tiers(near_match_confidence=.8)
+        configure_tiers(decompose=True)
+
+        api._tiers.should.eql(dict(decompose=True, near_match_confidence=.8, max_edits=1))
+
+        configure_tiers(near_match_confidence=False)
+        api._tiers['near_match_confidence'].should.be(None)
+    finally:
+        configure_tiers(decompose=False, near_match_confidence=False)
+
+
+def test_loads_models_once_for_threads_needing_them_at_once(monkeypatch):
+    import britfoner.ngram
+    loads = []
+
+    def slow_model_from(src):
+        sleep(.05)
+        loads.append(src)
+        return object()
+
+    monkeypatch.setattr(britfoner.ngram, 'compiled_joint_sequence_model_from', slow_model_from)
+    monkeypatch.setattr(api, '_fast', None)
+
+    with ThreadPoolExecutor(8) as pool:
+        models = list(pool.map(lambda _: api.fast_model(), range(8)))
+
+    loads.should.have.length_of(1)
+    set(map(id, models)).should.have.length_of(1)
+
+
+def test_loads_the_dictionary_once_on_first_use(monkeypatch):
+    monkeypatch.setattr(api, '_dictionary', None)
+
+    with ThreadPoolExecutor(4) as pool:
+        dictionaries = list(pool.map(lambda _: api.dictionary(), range(4)))
+
+    set(map(id, dictionaries)).should.have.length_of(1)
+    api._dictionary.should.be(dictionaries[0])
+
+
+def test_counts_words_pronounced_by_each_tier_across_threads(monkeypatch):
+    monkeypatch.setattr(api, '_resolved', Counter())
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: pronounce('row'), range(2000)))
+
+    api._resolved.should.eql(Counter(dictionary=2000))
+    resolved_fractions().should.eql(dict(dictionary=1.))
@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+import sure
+
+sure.enable()  # stops pycharm from removing sure import
+from britfoner.IO import arrays_to, arrays_from, all_encoded, bounded, seq2seq_from, weights_by_role
+from britfoner.backends import NumpySeq2Seq, Predictor, confidences_of
+
+config = dict(input_dim=5, input_length=4, hidden_dim=3, output_length=6, output_dim=7, depth=1,
+              output_activation='softmax')
+
+
+def random_weights(input_dim=5, hidden_dim=3, output_dim=7, random_state=42):
+    random = np.random.RandomState(random_state)
+
+    shapes = {'forward/0/W/kernel': (input_dim, 4 * hidden_dim), 'forward/0/W/bias': (4 * hidden_dim,),
+              'forward/0/U/kernel': (hidden_dim, 4 * hidden_dim),
+              'backward/0/W/kernel': (input_dim, 4 * hidden_dim), 'backward/0/W/bias': (4 * hidden_dim,),
+              'backward/0/U/kernel': (hidden_dim, 4 * hidden_dim),
+              'decoder/0/W1/kernel': (hidden_dim, 4 * hidden_dim), 'decoder/0/W1/bias': (4 * hidden_dim,),
+              'decoder/0/W2/kernel': (hidden_dim, output_dim), 'decoder/0/W2/bias': (output_dim,),
+              'decoder/0/W3/kernel': (2 * hidden_dim, 1), 'decoder/0/W3/bias': (1,),
+              'decoder/0/U/kernel': (hidden_dim, 4 * hidden_dim), 'decoder/0/U/bias': (4 * hidden_dim,)}
+
+    return {name: random.normal(size=shape).astype(np.float32) for name, shape in shapes.items()}
+
+
+def test_maps_saved_arrays_read_only_and_aligned(tmpdir):
+    src = str(tmpdir.join('arrays.weights'))
+    arrays = dict(a=np.arange(10, dtype=np.float32).reshape(2, 5), b=np.array([1, 2, 3], dtype=np.uint8))
+
+    arrays_to(src, arrays, {'name': 'test'})
+    mapped, meta = arrays_from(src)
+
+    meta.should.eql({'name': 'test'})
+    for name, array in arrays.items():
+        np.array_equal(mapped[name], array).should.be(True)
+        mapped[name].dtype.should.eql(array.dtype)
+        mapped[name].flags.writeable.should.be(False)
+        (mapped[name].ctypes.data % 64).should.eql(0)
+
+
+def test_predicts_words_independently_of_their_batch():
+    model = NumpySeq2Seq(random_weights(), config)
+    X = np.eye(5, dtype=bool)[np.random.RandomState(0).randint(5, size=(3, 4))]
+
+    Y_hat = model.predict(X)
+
+    Y_hat.shape.should.eql((3, 6, 7))
+    np.allclose(Y_hat.sum(axis=-1), 1.).should.be(True)
+    np.allclose(model.predict(X[1:2])[0], Y_hat[1], atol=1e-6).should.be(True)
+
+
+def test_predictor_encodes_words_as_the_model_was_trained():
+    letter_index = {'·': 0, '*': 1, '¬': 2, 'A': 3, 'B': 4}
+    model = NumpySeq2Seq(random_weights(), config)
+    predictor = Predictor(model, letter_index, ('·', '*', '¬', 'a', 'b', 'c', 'd'), max_length=2)
+    words = [('A',), ('B', 'A'), ('A', 'B')]
+
+    X = all_encoded([bounded(word, 2) for word in words], letter_index, reverse=True)
+
+    np.allclose(predictor.predict(words), model.predict(X)).should.be(True)
+    np.allclose(predictor.predict(words[:1]), model.predict(X[:1])).should.be(True)
+    predictor.pronounce(words).should.have.length_of(3)
+
+
+def test_masked_model_predicts_regardless_of_padding():
+    letter_index = {'·': 0, '*': 1, '¬': 2, 'A': 3, 'B': 4}
+    model = NumpySeq2Seq(random_weights(), dict(config, mask_index=letter_index['·']))
+    words = [('A',), ('B', 'A')]
+
+    X = all_encoded([bounded(word, 2) for word in words], letter_index, reverse=True)
+    wider_X = all_encoded([bounded(word, 5) for word in words], letter_index, reverse=True)
+
+    np.allclose(model.predict(wider_X), model.predict(X), atol=1e-6).should.be(True)
+    np.allclose(model.predict(X[:1, 1:]), model.predict(X[:1]), atol=1e-6).should.be(True)
+
+
+def test_readout_model_reads_previous_output_from_the_second_step():
+    weights = random_weights()
+    readout_weights = dict(weights, **{'decoder/0/W4/kernel': np.ones((7, 12), dtype=np.float32)})
+    X = np.eye(5, dtype=bool)[np.random.RandomState(0).randint(5, size=(3, 4))]
+
+    Y_hat = NumpySeq2Seq(weights, config).predict(X)
+    readout_Y_hat = NumpySeq2Seq(readout_weights, config).predict(X)
+
+    np.allclose(readout_Y_hat[:, 0], Y_hat[:, 0]).should.be(True)
+    np.allclose(readout_Y_hat[:, 1:], Y_hat[:, 1:]).should.be(False)
+
+
+def test_scores_confidence_as_least_margin_between_top_outputs():
+    Y_hat = np.array([[[.7, .2, .1], [.5, .5, 0.]],
+                      [[1., 0., 0.], [.1, .8, .1]]])
+
+    np.allclose(confidences_of(Y_hat, 'softmax'), [0., .7]).should.be(True)
+    np.allclose(confidences_of(2 * Y_hat - 1), [0., .7]).should.be(True)
+
+
+@pytest.mark.parametrize('depth', [1, 2])
+def test_predicts_as_the_keras_model_it_was_exported_from(depth):
+    pytest.importorskip('keras', minversion='2.2.2')
+
+    model_config = dict(config, depth=depth)
+    model = seq2seq_from(model_config)
+    X = np.eye(5, dtype=bool)[np.random.RandomState(0).randint(5, size=(3, 4))]
+
+    exported = NumpySeq2Seq(weights_by_role(model), model_config)
+
+    np.allclose(exported.predict(X), model.predict(X), atol=1e-5).should.be(True)
+
+
+def test_predictor_runs_keras_models_with_dropout_off():
+    pytest.importorskip('keras', minversion='2.2.2')
+
+    letter_index = {'·': 0, '*': 1, '¬': 2, 'A': 3, 'B': 4}
+    model = seq2seq_from(dict(config, dropout=.5))
+    predictor = Predictor(model, letter_index, ('·', '*', '¬', 'a', 'b', 'c', 'd'), max_length=2)
+    words = [('A',), ('B', 'A'), ('A', 'B')]
+
+    X = all_encoded([bounded(word, 2) for word in words], letter_index, reverse=True)
+
+    # twice over, so that the second call runs on the reused buffer
+    for _ in range(2):
+        np.allclose(predictor.predict(words), model.predict(X), atol=1e-6).should.be(True)
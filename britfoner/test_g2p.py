@@ -0,0 +1,232 @@
+import pytest
+import sure
+
+sure.enable()  # stops pycharm from removing sure import
+from queue import Queue
+
+import numpy as np
+
+from britfoner import _GAP
+from britfoner.IO import index_from, all_encoded, all_indexed, padded, one_hot
+from britfoner.g2p import WER_Evaluator, OneHotSequence, BucketedSequence, ScheduledSampling, \
+    Async_WER_ModelCheckpoint, soft_targets_from, InferenceModel, attention_g2p_model_from, \
+    parallel_g2p_model_from
+
+words = [tuple('AB'), tuple('CAB'), tuple('BA')]
+sounds = [('x', 'y'), ('z', 'x', 'y'), ('y', 'x')]
+index = index_from(words + [tuple('BA')], sounds + [('y', 'y')])
+
+val_X = all_encoded(padded(words), index.letter, reverse=True)
+
+
+class FixedModel:
+
+    def __init__(self, Y_hat):
+        self.Y_hat = Y_hat
+
+    def predict(self, X):
+        return self.Y_hat
+
+
+class StubWorker:
+
+    def __init__(self, alive):
+        self.alive, self.exitcode = alive, None if alive else 1
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self):
+        pass
+
+
+class StubModel:
+
+    def __init__(self):
+        self.dumps, self.stop_training = [], False
+
+    def save_weights(self, filepath, overwrite=False):
+        self.dumps.append(filepath)
+
+
+def async_checkpoint(worker, results=()):
+    checkpoint = Async_WER_ModelCheckpoint('model.h5', {}, val_X, index, patience=2)
+    checkpoint.model = StubModel()
+    checkpoint.worker, checkpoint.jobs, checkpoint.results = worker, Queue(), Queue()
+    for result in results:
+        checkpoint.results.put(result)
+    checkpoint.pending, checkpoint.best, checkpoint.best_epoch, checkpoint.wers = len(results), np.inf, None, {}
+
+    return checkpoint
+
+
+def test_scores_predictions_against_all_reference_pronunciations():
+    Y_hat = all_encoded(padded([('x', 'y'), ('z', 'x', 'x'), ('y', 'y')]), index.phone)
+
+    evaluator = WER_Evaluator(None, val_X, index)
+
+    list(evaluator.errors(Y_hat)).should.eql([False, True, False])
+    evaluator.wer(Y_hat).should.be.within(33.3, 33.4)
+
+
+def test_evaluates_only_when_due_or_when_loss_improves():
+    Y_hat = all_encoded(padded(sounds), index.phone)
+
+    evaluator = WER_Evaluator(FixedModel(Y_hat), val_X, index, period=10, on_improvement=True)
+
+    evaluator(0, {'val_loss': 1.}).should.eql(0.)
+    evaluator(1, {'val_loss': 2.}).should.be(None)
+    evaluator(2, {'val_loss': .5}).should.eql(0.)
+    evaluator(10, {'val_loss': 3.}).should.eql(0.)
+
+
+def test_batches_words_of_similar_length_cut_to_the_longest():
+    bucket_words = [tuple('AB'), tuple('CAB'), tuple('BA'), tuple('C'), tuple('ABCAB'), tuple('A')]
+    X = all_indexed(padded(bucket_words), index.letter, reverse=True)
+    Y = all_indexed(padded(sounds * 2), index.phone)
+
+    sequence = BucketedSequence(X, Y, index, batch_n=2, random_state=0)
+
+    len(sequence).should.eql(3)
+    for idx in range(len(sequence)):
+        batch_X, batch_Y = sequence[idx]
+        widths = sorted(batch_X.shape[1] - batch_X[..., index.letter['·']].sum(axis=1))
+
+        batch_X.shape[1].should.eql(widths[-1])
+        batch_Y.shape.should.eql((2, Y.shape[1], index.y_dim))
+
+    sorted(sequence[idx][0].shape[1] for idx in range(3)).should.eql([3, 4, 7])
+
+
+def test_teacher_forced_batches_also_give_the_one_hot_outputs_as_inputs():
+    X = all_indexed(padded(words), index.letter, reverse=True)
+    Y = all_indexed(padded(sounds), index.phone)
+
+    (batch_X, truth), targets = OneHotSequence(X, Y, index, shuffle=False, sparse=True, teacher_force=True)[0]
+
+    batch_X.shape.should.eql((3, X.shape[1], index.x_dim))
+    truth.argmax(axis=-1).tolist().should.eql(Y.tolist())
+    targets[..., 0].tolist().should.eql(Y.tolist())
+
+
+def test_lowers_ground_truth_probability_linearly_down_to_the_least():
+    sampling = ScheduledSampling(10, least=.2)
+
+    [sampling.ratio_at(epoch) for epoch in (0, 5, 10, 20)].should.eql([1., .6, .2, .2])
+
+
+def test_collects_asynchronous_scores_and_stops_after_patience():
+    checkpoint = async_checkpoint(StubWorker(alive=True), results=[(0, 30.), (1, 20.)])
+
+    checkpoint.on_epoch_end(2)
+
+    checkpoint.wers.should.eql({0: 30., 1: 20.})
+    checkpoint.best_epoch.should.eql(1)
+    checkpoint.jobs.get_nowait().should.eql((2, 'model.h5.0002.tmp'))
+    checkpoint.model.stop_training.should.be(False)
+
+    checkpoint.on_epoch_end(4)
+    checkpoint.model.stop_training.should.be(True)
+
+
+def test_stops_training_as_soon_as_the_asynchronous_worker_dies():
+    checkpoint = async_checkpoint(StubWorker(alive=False))
+    checkpoint.pending = 1
+
+    checkpoint.on_epoch_end(0)
+
+    checkpoint.model.stop_training.should.be(True)
+    checkpoint.model.dumps.should.be.empty
+
+    checkpoint.on_train_end()
+    checkpoint.best_epoch.should.be(None)
+
+
+def test_blends_teacher_outputs_with_one_hot_targets():
+    Y = np.eye(3)[[[0, 1], [2, 2]]]
+    teacher_Y = np.full(Y.shape, 1 / 3)
+
+    np.allclose(soft_targets_from(teacher_Y, Y, 0.), Y).should.be(True)
+    np.allclose(soft_targets_from(teacher_Y, Y, 1.), teacher_Y).should.be(True)
+    np.allclose(soft_targets_from(teacher_Y, Y, .25)[0, 0], [.75 + .25 / 3, .25 / 3, .25 / 3]).should.be(True)
+    np.allclose(soft_targets_from(teacher_Y, Y, .25).sum(axis=-1), 1.).should.be(True)
+    soft_targets_from.when.called_with(teacher_Y, Y, 1.5).should.throw(ValueError)
+
+
+@pytest.mark.parametrize('modes', [dict(readout=True), dict(teacher_force=True),
+                                   dict(teacher_force=True, teacher_force_ratio=1.)])
+def test_trains_and_predicts_with_readout_and_teacher_forcing(modes):
+    pytest.importorskip('keras', minversion='2.2.2')
+    from keras import backend as K
+
+    X = all_indexed(padded(words), index.letter, reverse=True)
+    Y = all_indexed(padded(sounds), index.phone)
+    teacher_force = modes.get('teacher_force', False)
+    sequence = OneHotSequence(X, Y, index, shuffle=False, teacher_force=teacher_force)
+
+    model = attention_g2p_model_from(index.x_dim, index.x_n, index.y_dim, index.y_n, hidden_n=4, **modes)
+    callbacks = [ScheduledSampling(2, least=.5)] if 'teacher_force_ratio' in modes else []
+    model.fit_generator(sequence, epochs=2, callbacks=callbacks, verbose=0)
+
+    if callbacks: K.get_value(model.decoder.teacher_force_ratio).should.be.within(.74, .76)
+
+    config = dict(input_dim=index.x_dim, input_length=index.x_n, output_dim=index.y_dim, output_length=index.y_n,
+                  hidden_dim=4, depth=1, readout=True)
+    batch_X = sequence[0][0][0] if teacher_force else sequence[0][0]
+    predicted = (InferenceModel(model, config) if teacher_force else model).predict(batch_X)
+
+    predicted.shape.should.eql((len(words), index.y_n, index.y_dim))
+    np.isfinite(predicted).all().should.be(True)
+
+
+def test_masked_model_predicts_the_same_however_much_inputs_are_padded():
+    pytest.importorskip('keras', minversion='2.2.2')
+
+    X = all_indexed(padded(words), index.letter, reverse=True)
+    wider_X = np.hstack([np.full((len(X), 3), index.letter[_GAP], dtype=X.dtype), X])
+
+    model = attention_g2p_model_from(index.x_dim, None, index.y_dim, index.y_n, hidden_n=4,
+                                     mask_index=index.letter[_GAP])
+
+    np.allclose(model.predict(one_hot(X, index.x_dim)), model.predict(one_hot(wider_X, index.x_dim)),
+                atol=1e-6).should.be(True)
+
+
+def test_parallel_model_trains_and_predicts_whole_outputs_in_one_pass():
+    pytest.importorskip('keras', minversion='2.2.2')
+    from keras.layers import RNN, Bidirectional
+    from britfoner.recurrentshop import RecurrentModel
+
+    X = all_indexed(padded(words), index.letter, reverse=True)
+    Y = all_indexed(padded(sounds), index.phone)
+    sequence = OneHotSequence(X, Y, index, shuffle=False, sparse=True)
+
+    model = parallel_g2p_model_from(index.x_dim, index.x_n, index.y_dim, index.y_n, hidden_n=4, depth=2, sparse=True)
+    model.fit_generator(sequence, epochs=2, verbose=0)
+
+    # no layer steps through the sequences, all outputs come out of the one forward pass
+    [layer for layer in model.layers if isinstance(layer, (RNN, Bidirectional, RecurrentModel))].should.be.empty
+    model.output_shape.should.eql((None, index.y_n, index.y_dim))
+
+    predicted = model.predict(sequence[0][0])
+
+    predicted.shape.should.eql((len(words), index.y_n, index.y_dim))
+    np.allclose(predicted.sum(axis=-1), 1., atol=1e-5).should.be(True)
+
+
+def test_sparse_model_has_softmax_outputs_trained_with_sparse_cross_entropy():
+    pytest.importorskip('keras', minversion='2.2.2')
+
+    sparse_model = attention_g2p_model_from(index.x_dim, index.x_n, index.y_dim, index.y_n, hidden_n=4, sparse=True)
+    dense_model = attention_g2p_model_from(index.x_dim, index.x_n, index.y_dim, index.y_n, hidden_n=4)
+
+    sparse_model.loss.should.eql('sparse_categorical_crossentropy')
+    dense_model.loss.should.eql('mse')
+
+    X = all_indexed(padded(words), index.letter, reverse=True)
+    Y = all_indexed(padded(sounds), index.phone)
+    batch_X, targets = OneHotSequence(X, Y, index, shuffle=False, sparse=True)[0]
+
+    targets.shape.should.eql((len(words), index.y_n, 1))
+    np.isfinite(sparse_model.train_on_batch(batch_X, targets)).should.be(True)
+    np.allclose(sparse_model.predict(batch_X).sum(axis=-1), 1., atol=1e-5).should.be(True)
@@ -0,0 +1,46 @@
+import csv
+
+import sure
+
+sure.enable()  # stops pycharm from removing sure import
+from britfoner.IO import arrays_to
+from britfoner.backends import NumpySeq2Seq, Predictor
+from britfoner.leaderboard import leaderboard
+from britfoner.test_backends import random_weights, config
+
+inv_letter, inv_phone = ('*', 'A', 'B', '¬', '·'), ('*', 'a', 'b', 'c', 'd', '¬', '·')
+references = {('A',): {('a',)}, ('B',): {('b',)}, ('A', 'B'): {('a', 'b'), ('a', 'c')}, ('B', 'A'): {('b', 'a')}}
+
+
+def test_ranks_models_by_held_out_wer_and_measures_their_costs(tmpdir):
+    data_src = str(tmpdir.join('held-out.csv'))
+    with open(data_src, 'w', encoding='utf-8') as out_file:
+        out_file.writelines(f'{"".join(word)},{" ".join(sound)}\n' for word, sounds in references.items()
+                            for sound in sorted(sounds))
+        out_file.write('ABA,a b a\n')
+
+    wers = {}
+    for seed in (1, 2):
+        weights = random_weights(random_state=seed)
+        src = str(tmpdir.join(f'{seed}.weights'))
+        arrays_to(src, weights, dict(config=config, inv_letter=inv_letter, inv_phone=inv_phone, train_hash=''))
+
+        predictor = Predictor(NumpySeq2Seq(weights, config), {letter: idx for idx, letter in enumerate(inv_letter)},
+                              inv_phone, max_length=2, output_activation='softmax')
+        words = list(references)
+        errors = sum(sound not in references[word] for word, sound in zip(words, predictor.pronounce(words)))
+        wers[src] = round(100 * errors / len(words), 2)
+
+    out = str(tmpdir.join('leaderboard.tsv'))
+    rows = leaderboard(list(wers), data_src, out, batch_n=2, repeats=3)
+
+    [row['rank'] for row in rows].should.eql([1, 2])
+    [row['WER'] for row in rows].should.eql(sorted(wers.values()))
+    {row['artifact']: row['WER'] for row in rows}.should.eql(wers)
+    for row in rows:
+        (row['words'], row['skipped'], row['params']).should.eql((4, 1, sum(w.size for w in random_weights().values())))
+        row['latency_ms'].should.be.greater_than(0)
+
+    with open(out, newline='') as in_file:
+        [row['artifact'] for row in csv.DictReader(in_file, delimiter='\t')].should.eql(
+            [row['artifact'] for row in rows])
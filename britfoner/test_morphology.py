@@ -0,0 +1,30 @@
+import sure
+
+sure.enable()  # stops pycharm from removing sure import
+from britfoner.IO import lexicon_from
+from britfoner.morphology import Decomposer
+
+lexicon = lexicon_from({tuple('THRONE'): {('θ', 'ɹ', 'əʊ', 'n')}, tuple('BOX'): {('b', 'ɒ', 'k', 's')},
+                        tuple('WANT'): {('w', 'ɒ', 'n', 't')}, tuple('STOP'): {('s', 't', 'ɒ', 'p')},
+                        tuple('HAPPY'): {('h', 'æ', 'p', 'i')}, tuple('FEAR'): {('f', 'ɪə')},
+                        tuple('SUN'): {('s', 'ɐ', 'n')}, tuple('BLACK'): {('b', 'l', 'æ', 'k')},
+                        tuple('BOARD'): {('b', 'ɔː', 'd')}, tuple('FLOWER'): {('f', 'l', 'aʊ', 'ə')}})
+
+
+def test_pronounces_suffixes_according_to_the_stem():
+    decomposer = Decomposer(lexicon)
+
+    decomposer.pronounce(tuple('THRONES')).should.eql({('θ', 'ɹ', 'əʊ', 'n', 'z')})
+    decomposer.pronounce(tuple('BOXES')).should.eql({('b', 'ɒ', 'k', 's', 'ɪ', 'z')})
+    decomposer.pronounce(tuple('WANTED')).should.eql({('w', 'ɒ', 'n', 't', 'ɪ', 'd')})
+    decomposer.pronounce(tuple('STOPPED')).should.eql({('s', 't', 'ɒ', 'p', 't')})
+    decomposer.pronounce(tuple('HAPPINESS')).should.eql({('h', 'æ', 'p', 'ɪ', 'n', 'ɪ', 's')})
+    decomposer.pronounce(tuple('FEARING')).should.eql({('f', 'ɪə', 'ɹ', 'ɪ', 'ŋ')})
+
+
+def test_pronounces_compounds_of_dictionary_words():
+    decomposer = Decomposer(lexicon, min_part=3)
+
+    decomposer.pronounce(tuple('BLACKBOARDS')).should.eql({('b', 'l', 'æ', 'k', 'b', 'ɔː', 'd', 'z')})
+    decomposer.pronounce(tuple('SUNFLOWER')).should.eql({('s', 'ɐ', 'n', 'f', 'l', 'aʊ', 'ə')})
+    decomposer.pronounce(tuple('SUNFLOWER')[:5]).should.eql(set())
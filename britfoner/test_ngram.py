@@ -0,0 +1,33 @@
+import sure
+
+sure.enable()  # stops pycharm from removing sure import
+from britfoner.ngram import joint_sequence_model_from, joint_sequence_model_to, compiled_joint_sequence_model_from
+
+dictionary = {'CAT': 'k æ t', 'BAT': 'b æ t', 'CAB': 'k æ b', 'TAB': 't æ b', 'BAG': 'b æ g', 'GAB': 'g æ b',
+              'CHAT': 'tʃ æ t', 'CHAP': 'tʃ æ p', 'TAP': 't æ p', 'CAP': 'k æ p', 'GAP': 'g æ p',
+              'A': 'æ', 'T': 't', 'G': 'g'}
+words, sounds = zip(*[(tuple(word), tuple(sound.split())) for word, sound in dictionary.items()])
+
+
+def test_pronounces_unseen_words_from_seen_spellings(tmpdir):
+    model = joint_sequence_model_from(words, sounds, order=2)
+
+    model.pronounce([tuple('TAG'), tuple('CHAB')]).should.eql([('t', 'æ', 'g'), ('tʃ', 'æ', 'b')])
+
+    dst = str(tmpdir.join('model.ngram'))
+    joint_sequence_model_to(model, dst)
+    compiled_joint_sequence_model_from(dst).pronounce([tuple('GAT')]).should.eql([('g', 'æ', 't')])
+
+
+def test_gives_pronunciations_with_their_probability_among_the_beam():
+    ambiguous = {'CAT': 'k æ t', 'BAT': 'b æ t', 'MAT': 'm æ t', 'CAKE': 'k eɪ k', 'BAKE': 'b eɪ k', 'MAKE': 'm eɪ k',
+                 'A': 'eɪ', 'T': 't', 'K': 'k'}
+    model = joint_sequence_model_from(*zip(*[(tuple(word), tuple(sound.split()))
+                                             for word, sound in ambiguous.items()]), order=2)
+    unseen = [tuple('TAT'), tuple('TAKE')]
+
+    pronounced = model.pronounce_with_confidence(unseen)
+
+    [phones for phones, _ in pronounced].should.eql(model.pronounce(unseen))
+    pronounced[0][1].should.be.within(.8, .85)
+    pronounced[1][1].should.be.within(.99, 1.)
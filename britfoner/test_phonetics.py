@@ -0,0 +1,20 @@
+import sure
+
+sure.enable()  # stops pycharm from removing sure import
+from britfoner.IO import lexicon_from
+from britfoner.phonetics import PhoneGrams
+
+lexicon = lexicon_from({tuple('THRONE'): {('θ', 'ɹ', 'əʊ', 'n')}, tuple('THROWN'): {('θ', 'ɹ', 'əʊ', 'n')},
+                        tuple('THRONES'): {('θ', 'ɹ', 'əʊ', 'n', 'z')}, tuple('GROAN'): {('g', 'ɹ', 'əʊ', 'n')},
+                        tuple('LEST'): {('l', 'ɛ', 's', 't')}, tuple('CAT'): {('k', 'æ', 't')}})
+
+
+def test_finds_nearest_pronunciations_within_edits():
+    phone_grams = PhoneGrams(lexicon)
+
+    phone_grams.nearest(('θ', 'ɹ', 'əʊ', 'n')).should.eql([(tuple('THRONE'), 0), (tuple('THROWN'), 0),
+                                                          (tuple('GROAN'), 1), (tuple('THRONES'), 1)])
+    phone_grams.nearest(('θ', 'ɹ', 'əʊ', 'n'), k=2).should.eql([(tuple('THRONE'), 0), (tuple('THROWN'), 0)])
+    phone_grams.nearest(('l', 'ɛ', 't', 's'), max_edits=1).should.eql([])
+    phone_grams.nearest(('l', 'ɛ', 't', 's'), max_edits=2).should.eql([(tuple('LEST'), 2)])
+    phone_grams.nearest(('k', 'x')).should.eql([(tuple('CAT'), 2)])
@@ -0,0 +1,46 @@
+import numpy as np
+import sure
+
+sure.enable()  # stops pycharm from removing sure import
+from britfoner.backends import NumpySeq2Seq
+from britfoner.pruning import pruned_by_contribution
+from britfoner.test_backends import random_weights, config
+
+
+def test_prunes_units_not_contributing_to_outputs():
+    weights = random_weights(hidden_dim=4)
+    # encoder unit 1 and decoder unit 2 are read by nothing
+    for name in ('forward/0/U/kernel', 'backward/0/U/kernel', 'decoder/0/W1/kernel'):
+        weights[name][1] = 0
+    for name in ('decoder/0/U/kernel', 'decoder/0/W2/kernel'):
+        weights[name][2] = 0
+    weights['decoder/0/W3/kernel'][[1, 4 + 2]] = 0
+
+    X = np.eye(5, dtype=bool)[np.random.RandomState(0).randint(5, size=(3, 4))]
+    small_weights, small_config = pruned_by_contribution(weights, dict(config, hidden_dim=4), X, hidden_n=3)
+
+    small_config['hidden_dim'].should.eql(3)
+    small_weights['decoder/0/U/kernel'].shape.should.eql((3, 12))
+    small_weights['decoder/0/W3/kernel'].shape.should.eql((6, 1))
+    np.allclose(NumpySeq2Seq(small_weights, small_config).predict(X),
+                NumpySeq2Seq(weights, config).predict(X), atol=1e-6).should.be(True)
+
+
+def test_prunes_readout_weights_with_the_decoder_gates():
+    weights = random_weights(hidden_dim=4)
+    weights['decoder/0/W4/kernel'] = np.random.RandomState(1).normal(size=(7, 16)).astype(np.float32)
+    readout_config = dict(config, hidden_dim=4, readout=True)
+    # encoder unit 1 and decoder unit 2 are read by nothing
+    for name in ('forward/0/U/kernel', 'backward/0/U/kernel', 'decoder/0/W1/kernel'):
+        weights[name][1] = 0
+    for name in ('decoder/0/U/kernel', 'decoder/0/W2/kernel'):
+        weights[name][2] = 0
+    weights['decoder/0/W3/kernel'][[1, 4 + 2]] = 0
+
+    X = np.eye(5, dtype=bool)[np.random.RandomState(0).randint(5, size=(3, 4))]
+    small_weights, small_config = pruned_by_contribution(weights, readout_config, X, hidden_n=3)
+
+    small_config['readout'].should.be(True)
+    small_weights['decoder/0/W4/kernel'].shape.should.eql((7, 12))
+    np.allclose(NumpySeq2Seq(small_weights, small_config).predict(X),
+                NumpySeq2Seq(weights, readout_config).predict(X), atol=1e-6).should.be(True)
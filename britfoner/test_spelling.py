@@ -0,0 +1,21 @@
+import sure
+
+sure.enable()  # stops pycharm from removing sure import
+from britfoner.spelling import NearMatches, edit_distance
+
+words = [tuple('RECEIVE'), tuple("DON'T"), tuple('DOWN'), tuple('GOVERNMENT'), tuple('CAT'), tuple('COT')]
+
+
+def test_counts_adjacent_swaps_as_single_edits():
+    edit_distance('RECIEVE', 'RECEIVE', 3).should.eql(1)
+    edit_distance('GOVERMENT', 'GOVERNMENT', 3).should.eql(1)
+    edit_distance('CAT', 'DOG', 2).should.eql(2)
+
+
+def test_finds_closest_dictionary_words_with_confidence():
+    near_matches = NearMatches(words)
+
+    near_matches.closest(tuple('GOVERMENT')).should.eql(([tuple('GOVERNMENT')], 1 - 1 / 9))
+    near_matches.closest(tuple('DONT')).should.eql(([tuple("DON'T")], 1.))
+    near_matches.closest(tuple('CUT')).should.eql(([tuple('CAT'), tuple('COT')], (1 - 1 / 3) / 2))
+    near_matches.closest(tuple('BIRD')).should.eql(([], 0.))
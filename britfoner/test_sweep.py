@@ -0,0 +1,32 @@
+import sure
+
+sure.enable()  # stops pycharm from removing sure import
+from britfoner.sweep import trials_from, _space_from, DEFAULT_TRIAL
+
+
+def test_parses_hyperparameter_values_with_their_default_types():
+    space = _space_from(['hidden_n=64,128', 'lr=1e-3,3e-3'])
+
+    space.should.eql(dict(hidden_n=[64, 128], lr=[1e-3, 3e-3]))
+    type(space['hidden_n'][0]).should.be(int)
+
+
+def test_rejects_unknown_hyperparameters():
+    _space_from.when.called_with(['hidden=64']).should.throw(ValueError, 'hidden')
+
+
+def test_creates_the_whole_grid_or_a_random_sample_of_it():
+    space = dict(hidden_n=[64, 128, 256], depth=[1, 2])
+
+    grid = trials_from(space)
+
+    len(grid).should.eql(6)
+    grid[0].should.eql(dict(DEFAULT_TRIAL, hidden_n=64, depth=1))
+    {(trial['hidden_n'], trial['depth']) for trial in grid}.should.have.length_of(6)
+
+    sample = trials_from(space, n=3, random_state=0)
+
+    len(sample).should.eql(3)
+    all(trial in grid for trial in sample).should.be(True)
+    sample.should.eql(trials_from(space, n=3, random_state=0))
+    trials_from(space, n=10).should.eql(grid)
@@ -10,5 +10,5 @@ setup(
     license='MIT',
     install_requires=['tensorflow', 'h5py', 'keras', 'scikit-learn'],
     packages=['britfoner','britfoner.recurrentshop', 'britfoner.seq2seq', 'britfoner.recurrentshop.backend'],
-    package_data={'britfoner': ['britfone.main.no-stress.2.0.1.csv', '20x32x256x19x48x1.h5']}
+    package_data={'britfoner': ['britfone.main.no-stress.2.0.1.csv', '20x32x256x19x48x1.h5', 'britfone.4.ngram']}
 )